@@ -0,0 +1,624 @@
+# 异步API服务器：提供与 start-server.py 相同的标记列表、精选、统计、点赞、浏览、实时推送和健康检查接口，
+# 运行在 asyncio 事件循环上，通过 SQLAlchemy 的异步引擎（aiomysql / aiosqlite）访问数据库，每个请求一个异步会话。
+# 等待数据库返回时事件循环继续处理其他请求，一个进程可以同时处理的请求数不受线程数限制，适合大量轮询和点赞。
+#
+# 只支持数据库模式；发布标记、瓦片、聚合、静态文件等接口仍由 start-server.py 提供，可以在反向代理中按路径分流。
+# 启动时创建缺少的表和列，示例数据和统计信息由 start-server.py 初始化。
+#
+# 启动（依赖见 requirements-async.txt）:
+#   STAR_MAP_BIND=0.0.0.0:8000 python async_server.py
+# 也可以直接用 uvicorn 启动（uvicorn async_server:app --workers 2），此时平滑退出要等SSE客户端断开
+import asyncio
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import parse_qsl
+
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker, contains_eager
+
+from db_config import create_async_db_engine, pool_status
+from models import User, Location, Content, Like, Statistics, Base, flush_likes, flush_views, \
+    ensure_hot_score_column, backfill_hot_scores
+from spatial_index import parse_bbox, parse_zoom, thin_markers, iter_thinned_markers
+from read_cache import dump_json_bytes
+from event_bus import EventBus
+from like_buffer import LikeBuffer
+from view_buffer import ViewBuffer
+from cursors import encode_cursor, decode_time_cursor, parse_limit
+from ranking import TOP_K, FEATURED_LIMIT
+
+engine = create_async_db_engine()
+Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+# 流式输出时每批从数据库读取的行数，以及攒够多少字节写出一次
+STREAM_BATCH_SIZE = 1000
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# 增量同步时回看的秒数，见 start-server.py
+SINCE_OVERLAP_SECONDS = 5
+
+STREAM_HEARTBEAT_INTERVAL = 15
+MAX_STREAM_CLIENTS = int(os.environ.get('STAR_MAP_MAX_STREAM_CLIENTS', '1000'))
+
+MAX_VIEW_ID_LENGTH = 50
+MAX_BATCH_VIEWS = int(os.environ.get('STAR_MAP_MAX_BATCH_VIEWS', '500'))
+
+CORS_METHODS = 'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'
+
+event_bus = EventBus()
+
+# 事件循环和SSE连接等待的事件：事件总线收到新事件时替换为新的 asyncio.Event 并唤醒所有等待者
+_loop = {'loop': None, 'stream_event': None}
+
+
+# ---------- 请求和响应 ----------
+
+class Request:
+    def __init__(self, scope, receive):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.receive = receive
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        # 同名参数取第一个，与 Flask 的 request.args.get 相同
+        self.args = {}
+        for name, value in parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True):
+            self.args.setdefault(name, value)
+        client = scope.get('client')
+        self.remote_addr = client[0] if client else None
+        self._body = None
+
+    async def body(self):
+        if self._body is None:
+            chunks = []
+            while True:
+                message = await self.receive()
+                chunks.append(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            self._body = b''.join(chunks)
+        return self._body
+
+    # 请求体中的JSON对象，格式不正确时返回空字典
+    async def json_object(self):
+        try:
+            data = json.loads(await self.body() or b'null')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    async def wait_disconnect(self):
+        while (await self.receive())['type'] != 'http.disconnect':
+            pass
+
+
+class Response:
+    def __init__(self, body=b'', status=200, content_type='application/json', headers=None, on_close=None):
+        # body 为字节串，或逐块产生字节串的异步生成器；on_close 在响应发送结束或客户端断开后调用
+        self.body = body
+        self.status = status
+        self.headers = dict(headers or {})
+        if content_type:
+            self.headers['Content-Type'] = content_type
+        self.on_close = on_close
+
+    async def send(self, request, send):
+        try:
+            await self._send(request, send)
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+    async def _send(self, request, send):
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in self.headers.items()]
+        if isinstance(self.body, bytes):
+            headers.append((b'content-length', str(len(self.body)).encode('latin-1')))
+            await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': self.body if request.method != 'HEAD' else b''})
+            return
+
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+        if request.method == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            await self.body.aclose()
+            return
+        # 每一块都与客户端断开同时等待，断开后立即停止生成（SSE连接不必等到下一次心跳）
+        disconnected = asyncio.ensure_future(request.wait_disconnect())
+        try:
+            while True:
+                next_chunk = asyncio.ensure_future(self.body.__anext__())
+                await asyncio.wait((next_chunk, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if not next_chunk.done():
+                    # 等取消生效、生成器停止运行后才能在 finally 中关闭它
+                    next_chunk.cancel()
+                    await asyncio.gather(next_chunk, return_exceptions=True)
+                    return
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            await self.body.aclose()
+
+
+def json_response(data, status=200, headers=None):
+    return Response(dump_json_bytes(data), status, headers=headers)
+
+
+def error_response(message, status):
+    return json_response({'success': False, 'error': message}, status)
+
+
+# 条件请求：客户端缓存的版本仍然有效时返回304，否则生成响应并附带ETag，与 start-server.py 的处理相同
+async def conditional_response(request, etag, last_modified, build):
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        not_modified = '*' in tags or f'"{etag}"' in tags
+    else:
+        # Last-Modified 只精确到秒，只在客户端没有发送 If-None-Match 时使用
+        not_modified = False
+        if last_modified is not None and request.headers.get('if-modified-since'):
+            try:
+                since = parsedate_to_datetime(request.headers['if-modified-since'])
+                not_modified = last_modified.replace(microsecond=0) <= since
+            except (TypeError, ValueError):
+                pass
+
+    if not_modified:
+        response = Response(status=304, content_type=None)
+    else:
+        response = await build()
+    response.headers['ETag'] = f'"{etag}"'
+    if last_modified is not None:
+        response.headers['Last-Modified'] = format_datetime(last_modified, usegmt=True)
+    # 允许浏览器缓存，但每次使用前都要向服务器确认
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# ---------- 数据库查询 ----------
+
+# 数据版本：取自统计信息行，与 start-server.py 的 ETag 相同，两种服务器可以混合部署。
+# 同时返回统计信息行，/api/stats 不必再查询一次
+async def data_version(session):
+    stats = (await session.execute(select(Statistics).limit(1))).scalars().first()
+    if stats is None:
+        return 'db-empty', None, None
+    updated_at = stats.updated_at
+    stamp = updated_at.timestamp() if updated_at else 0
+    etag = f'db-{stats.total_contents}-{stats.total_likes}-{stats.total_photos}-{stamp:.6f}'
+    return etag, updated_at.astimezone(timezone.utc) if updated_at else None, stats
+
+
+# 标记查询：用户和位置通过JOIN一次性加载（异步会话不能懒加载关联对象）
+def marker_select():
+    return select(Content, func.coalesce(Content.likes_count, 0)) \
+        .join(Content.user) \
+        .join(Content.location) \
+        .options(contains_eager(Content.user), contains_eager(Content.location))
+
+
+def content_to_marker(content, like_count):
+    return {
+        'id': content.id,
+        'nickname': content.user.nickname,
+        'location': content.location.city,
+        'latitude': float(content.location.latitude),
+        'longitude': float(content.location.longitude),
+        'message': content.message,
+        'image': content.image_url,
+        # 加上缓冲区中尚未写入数据库的点赞
+        'likes': like_count + like_buffer.pending_count(content.id),
+        'date': content.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def rows_to_markers(rows):
+    return [content_to_marker(content, like_count) for content, like_count in rows]
+
+
+# 流式输出标记列表：在独立的会话中用服务器端游标分批读取，边读边输出，输出结束或客户端断开后关闭会话
+async def stream_markers(statement, zoom, fmt):
+    if fmt == 'ndjson':
+        start, separator, end, suffix = b'', b'', b'', b'\n'
+    else:
+        start, separator, end, suffix = b'[', b',', b']', b''
+
+    async with Session() as session:
+        result = await session.stream(statement.execution_options(yield_per=STREAM_BATCH_SIZE))
+        chunk = bytearray(start)
+        first = True
+        seen = set()
+        async for rows in result.partitions():
+            for marker in iter_thinned_markers(rows_to_markers(rows), zoom, seen=seen):
+                if not first:
+                    chunk += separator
+                chunk += dump_json_bytes(marker) + suffix
+                first = False
+            if len(chunk) >= STREAM_CHUNK_BYTES:
+                yield bytes(chunk)
+                chunk.clear()
+        chunk += end
+        yield bytes(chunk)
+
+
+# ---------- 接口 ----------
+
+# 获取标记，参数和返回格式与 start-server.py 的 /api/markers 相同
+async def get_markers(request):
+    try:
+        bbox = parse_bbox(request.args)
+        zoom = parse_zoom(request.args)
+        limit = parse_limit(request.args)
+        since = request.args.get('since')
+        page_cursor = request.args.get('cursor')
+        if since is not None:
+            since_time, since_id = decode_time_cursor(since)
+        if page_cursor is not None:
+            page_time, page_id = decode_time_cursor(page_cursor)
+    except ValueError as e:
+        return error_response(str(e), 400)
+    stream = request.args.get('stream')
+    if stream not in (None, 'ndjson', 'json'):
+        return error_response('stream 参数应为 ndjson 或 json', 400)
+
+    async with Session() as session:
+        etag, last_modified, _ = await data_version(session)
+
+        statement = marker_select()
+        if request.args.get('withImages', 'true').lower() == 'true':
+            statement = statement.where(Content.image_url.isnot(None))
+        if bbox:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            statement = statement.where(
+                Location.latitude.between(min_lat, max_lat),
+                Location.longitude.between(min_lng, max_lng)
+            )
+
+        if since is not None:
+            async def build():
+                rows = (await session.execute(
+                    statement.where(Content.created_at >= since_time - timedelta(seconds=SINCE_OVERLAP_SECONDS))
+                    .order_by(Content.created_at, Content.id)
+                )).all()
+                cursor = since
+                if rows and (rows[-1][0].created_at, rows[-1][0].id) > (since_time, since_id):
+                    cursor = encode_cursor(rows[-1][0].created_at, rows[-1][0].id)
+                return json_response({'markers': rows_to_markers(rows), 'cursor': cursor})
+            return await conditional_response(request, etag, last_modified, build)
+
+        statement = statement.order_by(Content.created_at.desc(), Content.id.desc())
+
+        if limit is not None:
+            # 键集分页：从上一页最后一条之后继续，不使用OFFSET
+            if page_cursor is not None:
+                statement = statement.where(or_(
+                    Content.created_at < page_time,
+                    and_(Content.created_at == page_time, Content.id < page_id)
+                ))
+
+            async def build():
+                rows = (await session.execute(statement.limit(limit + 1))).all()
+                next_cursor = None
+                if len(rows) > limit:
+                    rows = rows[:limit]
+                    next_cursor = encode_cursor(rows[-1][0].created_at, rows[-1][0].id)
+                return json_response({'markers': rows_to_markers(rows), 'nextCursor': next_cursor})
+            return await conditional_response(request, etag, last_modified, build)
+
+        if request.args.get('recent', 'false').lower() == 'true':
+            statement = statement.limit(20)
+
+        if stream:
+            content_type = 'application/x-ndjson' if stream == 'ndjson' else 'application/json'
+
+            async def build():
+                return Response(stream_markers(statement, zoom, stream), content_type=content_type)
+            return await conditional_response(request, etag, last_modified, build)
+
+        async def build():
+            rows = (await session.execute(statement)).all()
+            if rows:
+                cursor = encode_cursor(rows[0][0].created_at, rows[0][0].id)
+            else:
+                cursor = encode_cursor(datetime(1970, 1, 1), '')
+            return json_response(thin_markers(rows_to_markers(rows), zoom), headers={'X-Marker-Cursor': cursor})
+        return await conditional_response(request, etag, last_modified, build)
+
+
+async def get_stats(request):
+    async with Session() as session:
+        etag, last_modified, stats = await data_version(session)
+
+    async def build():
+        if stats is None:
+            return json_response({'totalMarkers': 0, 'totalCities': 0, 'totalPhotos': 0, 'totalComments': 0})
+        return json_response({
+            'totalMarkers': stats.total_markers,
+            'totalCities': stats.total_cities,
+            'totalPhotos': stats.total_photos,
+            'totalComments': stats.total_comments
+        })
+    return await conditional_response(request, etag, last_modified, build)
+
+
+# 精选内容：按 hot_score 索引从高到低读取热度最高的带图片标记
+async def get_featured(request):
+    city = request.args.get('city') or None
+    try:
+        limit = parse_limit(request.args, maximum=TOP_K) or FEATURED_LIMIT
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    async with Session() as session:
+        etag, last_modified, _ = await data_version(session)
+
+        statement = marker_select().where(Content.image_url.isnot(None))
+        if city:
+            statement = statement.where(Location.city == city)
+        statement = statement.order_by(Content.hot_score.desc()).limit(limit)
+
+        async def build():
+            return json_response(rows_to_markers((await session.execute(statement)).all()))
+        return await conditional_response(request, etag, last_modified, build)
+
+
+# 点赞：写入缓冲区，由后台线程批量写入，请求中带 userId 时同一用户对同一标记只能点赞一次
+async def like_marker(request, marker_id):
+    user_id = (await request.json_object()).get('userId')
+    if user_id is not None and not isinstance(user_id, int):
+        return error_response('userId 应为整数', 400)
+
+    async with Session() as session:
+        content = (await session.execute(
+            select(Content.id, Content.likes_count).where(Content.id == marker_id)
+        )).first()
+        if not content:
+            return error_response('标记不存在', 404)
+
+        if user_id is not None:
+            if (await session.execute(select(User.id).where(User.id == user_id))).first() is None:
+                return error_response('用户不存在', 400)
+            liked = (await session.execute(
+                select(Like.id).where(Like.content_id == marker_id, Like.user_id == user_id)
+            )).first()
+            if liked is not None:
+                return error_response('已经点过赞了', 409)
+
+    if not like_buffer.add(marker_id, user_id):
+        return error_response('已经点过赞了', 409)
+
+    like_count = (content.likes_count or 0) + like_buffer.pending_count(marker_id)
+    event_bus.publish('marker_liked', {'id': marker_id, 'likes': like_count})
+    return json_response({'success': True, 'likes': like_count})
+
+
+async def request_viewer(request):
+    viewer = (await request.json_object()).get('viewerId')
+    if viewer is None:
+        viewer = f"{request.remote_addr}|{request.headers.get('user-agent', '')}"
+    return viewer
+
+
+async def view_marker(request, marker_id):
+    if len(marker_id) > MAX_VIEW_ID_LENGTH:
+        return error_response('标记不存在', 404)
+    recorded = view_buffer.add(marker_id, await request_viewer(request))
+    return json_response({'success': True, 'recorded': recorded})
+
+
+async def view_markers_batch(request):
+    ids = (await request.json_object()).get('ids')
+    if not isinstance(ids, list) or not all(isinstance(marker_id, str) for marker_id in ids):
+        return error_response('ids 应为标记ID列表', 400)
+    if len(ids) > MAX_BATCH_VIEWS:
+        return error_response(f'一次最多记录 {MAX_BATCH_VIEWS} 个浏览', 400)
+    viewer = await request_viewer(request)
+    recorded = sum(1 for marker_id in ids
+                   if len(marker_id) <= MAX_VIEW_ID_LENGTH and view_buffer.add(marker_id, viewer))
+    return json_response({'success': True, 'recorded': recorded})
+
+
+# 实时事件推送（Server-Sent Events）：等待新事件时不占用线程，连接数只受 MAX_STREAM_CLIENTS 限制
+async def event_stream(request):
+    if not event_bus.open_subscription(MAX_STREAM_CLIENTS):
+        return error_response('连接数过多，请稍后重试', 503)
+
+    last_event_id = request.headers.get('last-event-id', '')
+    last_id = int(last_event_id) if last_event_id.isdigit() else event_bus.last_id
+
+    async def generate():
+        seen = last_id
+        yield b'retry: 3000\n\n'
+        while not event_bus.closed:
+            payloads, seen = event_bus.events_after(seen)
+            if payloads:
+                yield b''.join(payloads)
+            # 先取等待的事件再检查编号，检查之后到达的事件一定会唤醒它
+            waiter = _loop['stream_event']
+            if event_bus.last_id != seen or event_bus.closed:
+                continue
+            try:
+                await asyncio.wait_for(waiter.wait(), STREAM_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b': ping\n\n'
+
+    # 名额在返回响应前占用，响应发送结束或客户端断开后释放
+    return Response(generate(), content_type='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+                    on_close=event_bus.close_subscription)
+
+
+async def health_check(request):
+    return json_response({
+        'status': 'ok',
+        'database_enabled': True,
+        'server': 'asyncio',
+        'timestamp': datetime.now().isoformat(),
+        'database_pool': pool_status(engine.sync_engine)
+    })
+
+
+ROUTES = [
+    ('GET', r'/api/markers', get_markers),
+    ('GET', r'/api/stats', get_stats),
+    ('GET', r'/api/featured', get_featured),
+    ('POST', r'/api/markers/(?P<marker_id>[^/]+)/like', like_marker),
+    ('POST', r'/api/markers/(?P<marker_id>[^/]+)/view', view_marker),
+    ('POST', r'/api/markers/views', view_markers_batch),
+    ('GET', r'/api/stream', event_stream),
+    ('GET', r'/health', health_check),
+]
+ROUTES = [(method, re.compile(pattern), handler) for method, pattern, handler in ROUTES]
+
+
+async def dispatch(request):
+    # HEAD 请求按 GET 处理，发送时不输出响应体
+    request_method = 'GET' if request.method == 'HEAD' else request.method
+    allowed = []
+    for method, pattern, handler in ROUTES:
+        match = pattern.fullmatch(request.path)
+        if match is None:
+            continue
+        if method != request_method:
+            allowed.append(method)
+            continue
+        try:
+            return await handler(request, **match.groupdict())
+        except Exception as e:
+            print(f"{request.method} {request.path} 处理错误: {e}")
+            return error_response('服务器内部错误', 500)
+
+    # 跨域预检请求
+    if request.method == 'OPTIONS' and allowed:
+        headers = {'Access-Control-Allow-Methods': CORS_METHODS}
+        if 'access-control-request-headers' in request.headers:
+            headers['Access-Control-Allow-Headers'] = request.headers['access-control-request-headers']
+        return Response(content_type='text/html; charset=utf-8', headers=headers)
+    if allowed:
+        return error_response('不支持的请求方法', 405)
+    return error_response('接口不存在', 404)
+
+
+# ---------- 写缓冲 ----------
+
+# 点赞和浏览的批量写入在后台线程中触发，交给事件循环在异步会话中执行同步的写入函数，等待提交完成
+async def run_write(func, *args):
+    async with Session() as session:
+        async with session.begin():
+            await session.run_sync(func, *args)
+
+
+def write_in_loop(func, *args):
+    return asyncio.run_coroutine_threadsafe(run_write(func, *args), _loop['loop']).result()
+
+
+def write_likes(rows):
+    write_in_loop(flush_likes, rows)
+
+
+def write_views(counts):
+    write_in_loop(flush_views, counts)
+
+
+like_buffer = LikeBuffer(write_likes)
+view_buffer = ViewBuffer(write_views)
+
+
+# ---------- 启动和退出 ----------
+
+def wake_streams():
+    waiter, _loop['stream_event'] = _loop['stream_event'], asyncio.Event()
+    waiter.set()
+
+
+# 事件总线的回调可能在中转服务的接收线程中调用，转到事件循环中唤醒SSE连接
+def on_bus_event():
+    _loop['loop'].call_soon_threadsafe(wake_streams)
+
+
+async def startup():
+    _loop['loop'] = asyncio.get_running_loop()
+    _loop['stream_event'] = asyncio.Event()
+    event_bus.listeners.append(on_bus_event)
+    # 建表和补充 hot_score 列，与 start-server.py 的初始化相同
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_hot_score_column)
+    async with Session() as session:
+        backfilled = await session.run_sync(backfill_hot_scores)
+        if backfilled:
+            print(f"✓ 已为 {backfilled} 条内容计算热度")
+    like_buffer.start()
+    view_buffer.start()
+    print(f"✓ 异步服务器已启动，数据库: {engine.url.render_as_string(hide_password=True)}")
+
+
+# 开始平滑退出：结束所有SSE长连接
+def begin_shutdown():
+    event_bus.close()
+    if _loop['stream_event'] is not None:
+        wake_streams()
+
+
+async def shutdown():
+    # 写入缓冲区中剩余的点赞和浏览。
+    # stop 在线程池中等待后台线程结束，写入需要事件循环执行，不能阻塞事件循环
+    begin_shutdown()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, like_buffer.stop)
+    await loop.run_in_executor(None, view_buffer.stop)
+    await engine.dispose()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await startup()
+            except Exception as e:
+                print(f"异步服务器启动失败: {e}")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+# ASGI 应用
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    request = Request(scope, receive)
+    response = await dispatch(request)
+    # 允许跨域请求（与 flask_cors 的默认配置相同）
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    await response.send(request, send)
+
+
+# python async_server.py 启动单进程服务器，监听 STAR_MAP_BIND（默认 0.0.0.0:8000）。
+# uvicorn 收到退出信号后要等所有连接关闭才通知应用退出，这里在收到信号时先结束SSE连接，否则要等客户端自己断开
+if __name__ == '__main__':
+    import uvicorn
+
+    class Server(uvicorn.Server):
+        def handle_exit(self, sig, frame):
+            begin_shutdown()
+            super().handle_exit(sig, frame)
+
+    host, port = os.environ.get('STAR_MAP_BIND', '0.0.0.0:8000').rsplit(':', 1)
+    access_log = bool(os.environ.get('STAR_MAP_ACCESS_LOG'))
+    Server(uvicorn.Config(app, host=host, port=int(port), access_log=access_log)).run()
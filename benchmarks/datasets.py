@@ -0,0 +1,151 @@
+# 压测数据集：按固定随机种子生成合成标记，同一规模每次生成的数据完全相同，不同提交之间的结果可以对比。
+# 生成的数据缓存在 benchmarks/.data/ 下（文件模式的 data.json 和 SQLite 数据库），
+# 压测会写入新标记和点赞，每次运行前复制一份干净的数据。
+import json
+import os
+import random
+import shutil
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+CACHE_DIR = os.path.join(ROOT, 'benchmarks', '.data')
+
+SEED = 20240101
+
+# 标记集中分布的城市（约七成标记在城市附近，其余均匀分布在全国范围内）
+CITIES = [
+    ('北京', 39.9042, 116.4074), ('上海', 31.2304, 121.4737), ('广州', 23.1291, 113.2644),
+    ('深圳', 22.5431, 114.0579), ('成都', 30.5728, 104.0668), ('杭州', 30.2741, 120.1551),
+    ('武汉', 30.5928, 114.3055), ('西安', 34.3416, 108.9398), ('重庆', 29.5630, 106.5516),
+    ('南京', 32.0603, 118.7969), ('天津', 39.3434, 117.3616), ('长沙', 28.2282, 112.9388),
+    ('沈阳', 41.8057, 123.4315), ('哈尔滨', 45.8038, 126.5350), ('昆明', 25.0389, 102.7183),
+    ('厦门', 24.4798, 118.0894), ('青岛', 36.0671, 120.3826), ('乌鲁木齐', 43.8256, 87.6168),
+]
+CITY_SHARE = 0.7
+CITY_SPREAD = 0.3
+CHINA_BOUNDS = (18.0, 73.0, 53.0, 135.0)
+
+PHOTO_SHARE = 0.6
+MESSAGES = ['打卡', '今天天气真好', '第一次来这里', '和朋友一起', '夜景很美', '推荐这家店']
+NICKNAMES = 5000
+START_DATE = datetime(2024, 1, 1)
+
+
+def marker_id(i):
+    return f'bench-{i}'
+
+
+def synthetic_markers(count, seed=SEED):
+    rng = random.Random(seed)
+    min_lat, min_lng, max_lat, max_lng = CHINA_BOUNDS
+    for i in range(count):
+        if rng.random() < CITY_SHARE:
+            city, lat, lng = rng.choice(CITIES)
+            latitude = lat + rng.gauss(0, CITY_SPREAD)
+            longitude = lng + rng.gauss(0, CITY_SPREAD)
+        else:
+            city = ''
+            latitude = rng.uniform(min_lat, max_lat)
+            longitude = rng.uniform(min_lng, max_lng)
+        has_photo = rng.random() < PHOTO_SHARE
+        yield {
+            'id': marker_id(i),
+            'nickname': f'压测用户{rng.randrange(NICKNAMES)}',
+            'location': city,
+            'latitude': round(latitude, 6),
+            'longitude': round(longitude, 6),
+            'message': rng.choice(MESSAGES),
+            'image': f'https://picsum.photos/id/{i % 1000}/800/600' if has_photo else None,
+            # 点赞数呈长尾分布，少数标记有较多点赞
+            'likes': int(rng.paretovariate(2.0)) - 1,
+            'date': (START_DATE + timedelta(seconds=i * 30)).strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+
+# 文件模式的快照（与 FileStore 的 data.json 格式相同），逐个标记写出，不在内存中构造完整列表
+def write_file_dataset(path, count):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('{\n  "markers": [')
+        for i, marker in enumerate(synthetic_markers(count)):
+            f.write(',\n    ' if i else '\n    ')
+            f.write(json.dumps(marker, ensure_ascii=False))
+        f.write('\n  ],\n  "stats": {},\n  "seq": 0\n}\n')
+    os.replace(tmp_path, path)
+
+
+def file_dataset(count, cache_dir=CACHE_DIR):
+    path = os.path.join(cache_dir, f'file-{count}', 'data.json')
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        print(f"生成文件数据集: {count} 个标记")
+        write_file_dataset(path, count)
+    return path
+
+
+# 把文件数据集导入数据库（与 migrate_data.py import 相同的批量写入路径）
+def import_dataset(engine, count, cache_dir=CACHE_DIR):
+    from migrate_data import import_markers
+    return import_markers(engine, file_dataset(count, cache_dir))
+
+
+def sqlite_dataset(count, cache_dir=CACHE_DIR):
+    from sqlalchemy import create_engine
+
+    path = os.path.join(cache_dir, f'sqlite-{count}.db')
+    if not os.path.exists(path):
+        print(f"生成SQLite数据集: {count} 个标记")
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        engine = create_engine(f'sqlite:///{tmp_path}')
+        try:
+            import_dataset(engine, count, cache_dir)
+        finally:
+            engine.dispose()
+        os.replace(tmp_path, path)
+    return path
+
+
+# 准备一次运行使用的数据：文件和SQLite复制到 run_dir，返回服务器需要的环境变量。
+# MySQL 等外部数据库直接写入，库中已有数据时只有指定 reset 才会清空重建
+def prepare_storage(storage, count, run_dir, database_url=None, reset=False, cache_dir=CACHE_DIR):
+    os.makedirs(run_dir, exist_ok=True)
+    if storage == 'file':
+        shutil.copyfile(file_dataset(count, cache_dir), os.path.join(run_dir, 'data.json'))
+        return {'STAR_MAP_STORAGE': 'file'}
+    if storage == 'sqlite':
+        path = os.path.join(run_dir, 'star_map.db')
+        shutil.copyfile(sqlite_dataset(count, cache_dir), path)
+        return {'STAR_MAP_DATABASE_URL': f'sqlite:///{path}'}
+    if storage == 'mysql':
+        if not database_url:
+            raise ValueError('mysql 压测需要指定 --database-url')
+        load_database(database_url, count, reset, cache_dir)
+        return {'STAR_MAP_DATABASE_URL': database_url}
+    raise ValueError(f'未知的存储类型: {storage}')
+
+
+def load_database(url, count, reset=False, cache_dir=CACHE_DIR):
+    from sqlalchemy import func
+
+    from db_config import create_db_engine
+    from models import Base, Content
+
+    engine = create_db_engine(url)
+    try:
+        Base.metadata.create_all(engine)
+        with engine.connect() as conn:
+            existing = conn.execute(func.count(Content.id).select()).scalar()
+        if existing:
+            if not reset:
+                raise RuntimeError(f'数据库中已有 {existing} 条内容，压测会清空数据，确认后加 --reset-database')
+            Base.metadata.drop_all(engine)
+            Base.metadata.create_all(engine)
+        import_dataset(engine, count, cache_dir)
+    finally:
+        engine.dispose()
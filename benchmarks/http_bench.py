@@ -0,0 +1,102 @@
+# HTTP压测脚本：多个并发连接（keep-alive）持续请求同一地址，统计吞吐量和延迟
+# 用法: python benchmarks/http_bench.py http://127.0.0.1:8000/api/stats -c 16 -d 10 -p 4
+#       python benchmarks/http_bench.py http://127.0.0.1:8000/api/markers -X POST --body '{"nickname": "压测"}'
+# 压测客户端本身受GIL限制，-p 指定客户端进程数，避免客户端先成为瓶颈
+import argparse
+import http.client
+import json
+import multiprocessing
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(int(len(sorted_values) * p / 100), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+# paths 为请求路径列表，每次随机选一个（例如点赞不同的标记）；为空时请求 url 本身
+def worker(url, deadline, latencies, errors, lock, method='GET', body=None, paths=None):
+    parts = urlsplit(url)
+    paths = paths or [parts.path + ('?' + parts.query if parts.query else '')]
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    payload = body.encode('utf-8') if body is not None else None
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    local_latencies = []
+    local_errors = 0
+    while time.perf_counter() < deadline:
+        path = random.choice(paths)
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                local_errors += 1
+            local_latencies.append(time.perf_counter() - start)
+            if response.getheader('Connection', '').lower() == 'close':
+                conn.close()
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            conn.close()
+    conn.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors.append(local_errors)
+
+
+def collect(url, concurrency, duration, method='GET', body=None, paths=None):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=worker, args=(url, deadline, latencies, errors, lock, method, body, paths))
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, sum(errors)
+
+
+def run(url, concurrency, duration, processes=1, method='GET', body=None, paths=None):
+    # 并发连接平均分配到各客户端进程
+    shares = [concurrency // processes + (1 if i < concurrency % processes else 0) for i in range(processes)]
+    started = time.perf_counter()
+    if processes == 1:
+        results = [collect(url, concurrency, duration, method, body, paths)]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(collect, [(url, share, duration, method, body, paths)
+                                             for share in shares if share])
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for part, _ in results for latency in part)
+    return {
+        'url': url,
+        'method': method,
+        'concurrency': concurrency,
+        'duration': round(elapsed, 2),
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='HTTP压测')
+    parser.add_argument('url')
+    parser.add_argument('-c', '--concurrency', type=int, default=16)
+    parser.add_argument('-d', '--duration', type=float, default=10)
+    parser.add_argument('-p', '--processes', type=int, default=1)
+    parser.add_argument('-X', '--method', default='GET')
+    parser.add_argument('--body', help='请求体（JSON）')
+    args = parser.parse_args()
+    print(json.dumps(run(args.url, args.concurrency, args.duration, args.processes, args.method, args.body),
+                     ensure_ascii=False))
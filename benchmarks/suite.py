@@ -0,0 +1,436 @@
+# 可复现的压测套件：用固定种子生成的数据集（默认 1千、10万、100万个标记）分别在文件模式和数据库模式下
+# 启动服务器，依次压测各接口，记录 p50/p99 延迟、吞吐量、服务器进程的峰值内存，另有进程内的微基准。
+# 结果保存为JSON，可以用 compare 对比两次提交的结果。
+#
+# 用法:
+#   python benchmarks/suite.py run --sizes 1k,100k --storages file,sqlite -c 16 -d 10
+#   python benchmarks/suite.py run --storages mysql --database-url mysql+pymysql://... --reset-database
+#   python benchmarks/suite.py run --server asgi --storages sqlite --sizes 100k -c 256
+#   python benchmarks/suite.py compare benchmarks/results/旧.json benchmarks/results/新.json
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import http.client
+from datetime import datetime
+
+from datasets import CITIES, ROOT, file_dataset, marker_id, prepare_storage
+
+import http_bench
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# 不分页的 /api/markers 返回全部标记，只在数据量不超过该值时压测
+FULL_LIST_MAX_SIZE = 100000
+
+STARTUP_TIMEOUT = 600
+
+# 异步服务器（async_server.py）只支持数据库模式，不提供发布标记接口
+ASGI_SKIPPED_SCENARIOS = ('create_marker',)
+RSS_SAMPLE_INTERVAL = 0.2
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# ---------- 服务器进程 ----------
+
+def start_server(kind, env, run_dir, port, workers, threads):
+    env = dict(os.environ, **env, PYTHONPATH=ROOT, STAR_MAP_GRACEFUL_TIMEOUT='5')
+    if kind == 'gunicorn':
+        env.update(STAR_MAP_BIND=f'127.0.0.1:{port}', STAR_MAP_WORKERS=str(workers), STAR_MAP_THREADS=str(threads))
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'wsgi:app']
+    elif kind == 'asgi':
+        env['STAR_MAP_BIND'] = f'127.0.0.1:{port}'
+        command = [sys.executable, os.path.join(ROOT, 'async_server.py')]
+    else:
+        env['STAR_MAP_PORT'] = str(port)
+        command = [sys.executable, os.path.join(ROOT, 'start-server.py')]
+    log = open(os.path.join(run_dir, 'server.log'), 'wb')
+    try:
+        return subprocess.Popen(command, cwd=run_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        log.close()
+
+
+def wait_ready(proc, port, run_dir, timeout=STARTUP_TIMEOUT):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            with open(os.path.join(run_dir, 'server.log'), 'rb') as f:
+                tail = f.read()[-2000:].decode('utf-8', 'replace')
+            raise RuntimeError(f'服务器启动失败（退出码 {proc.returncode}）:\n{tail}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/health')
+            response = conn.getresponse()
+            if response.status == 200:
+                return json.loads(response.read())
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'服务器在 {timeout} 秒内没有就绪')
+
+
+def stop_server(proc):
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+# 服务器进程树（gunicorn 主进程和工作进程）的常驻内存之和，定时采样取峰值
+class RssSampler:
+    def __init__(self, pid, interval=RSS_SAMPLE_INTERVAL):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.available = os.path.isdir(f'/proc/{pid}')
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if self.available:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.sample())
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        parents = {}
+        for name in os.listdir('/proc'):
+            if name.isdigit():
+                try:
+                    with open(f'/proc/{name}/stat', 'rb') as f:
+                        # 进程名可能包含空格，从最后一个右括号之后解析
+                        fields = f.read().rsplit(b')', 1)[1].split()
+                    parents.setdefault(int(fields[1]), []).append(int(name))
+                except (OSError, IndexError, ValueError):
+                    continue
+        total = 0
+        pending = [self.pid]
+        while pending:
+            pid = pending.pop()
+            pending.extend(parents.get(pid, ()))
+            total += self.process_memory(pid)
+        return total
+
+    # 工作进程与主进程共享 fork 前加载的数据，直接累加 RSS 会重复计算共享页，
+    # 有 smaps_rollup 时使用按共享进程数分摊的 Pss
+    @staticmethod
+    def process_memory(pid):
+        for path, field in ((f'/proc/{pid}/smaps_rollup', 'Pss:'), (f'/proc/{pid}/status', 'VmRSS:')):
+            try:
+                with open(path) as f:
+                    for line in f:
+                        if line.startswith(field):
+                            return int(line.split()[1]) * 1024
+            except OSError:
+                continue
+        return 0
+
+    def peak_mb(self):
+        if self.available:
+            return round(self.peak / 1024 / 1024, 1)
+        # 没有 /proc 时只能取已退出子进程中最大的常驻内存（Linux 单位为KB，macOS 为字节）
+        maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return round(maxrss / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+# ---------- 压测场景 ----------
+
+# (名称, 方法, 路径列表, 请求体)；读接口在前，写接口在后，避免写入的数据影响读接口的结果
+def scenarios(size, seed):
+    rng = random.Random(seed)
+    viewports = [f'/api/markers?minLat={lat - 1:.4f}&minLng={lng - 1:.4f}&maxLat={lat + 1:.4f}'
+                 f'&maxLng={lng + 1:.4f}&zoom=9' for _, lat, lng in CITIES]
+    like_paths = [f'/api/markers/{marker_id(rng.randrange(size))}/like' for _ in range(1000)]
+    city, lat, lng = CITIES[0]
+    new_marker = json.dumps({'nickname': '压测用户', 'location': city, 'latitude': lat, 'longitude': lng,
+                             'message': '压测写入', 'image': None}, ensure_ascii=False)
+    result = [
+        ('markers_page', 'GET', ['/api/markers?limit=100'], None),
+        ('markers_viewport', 'GET', viewports, None),
+        ('markers_all', 'GET', ['/api/markers'], None),
+        ('featured', 'GET', ['/api/featured'], None),
+        ('stats', 'GET', ['/api/stats'], None),
+        ('create_marker', 'POST', ['/api/markers'], new_marker),
+        ('like', 'POST', like_paths, None),
+    ]
+    if size > FULL_LIST_MAX_SIZE:
+        result = [scenario for scenario in result if scenario[0] != 'markers_all']
+    return result
+
+
+def run_http(storage, size, args):
+    run_dir = tempfile.mkdtemp(prefix=f'star-map-bench-{storage}-{size}-')
+    try:
+        started = time.perf_counter()
+        env = prepare_storage(storage, size, run_dir, args.database_url, args.reset_database)
+        prepare_seconds = time.perf_counter() - started
+
+        port = free_port()
+        started = time.perf_counter()
+        proc = start_server(args.server, env, run_dir, port, args.workers, args.threads)
+        sampler = RssSampler(proc.pid).start()
+        try:
+            health = wait_ready(proc, port, run_dir)
+            startup_seconds = time.perf_counter() - started
+            # 数据库不可用时服务器会回退到文件模式，结果就不是目标存储的了
+            if health.get('database_enabled') != (storage != 'file'):
+                raise RuntimeError(f'服务器没有使用 {storage} 存储（database_enabled={health.get("database_enabled")}），'
+                                   f'见 {run_dir}/server.log')
+
+            results = {}
+            for name, method, paths, body in scenarios(size, args.seed):
+                if args.scenarios and name not in args.scenarios:
+                    continue
+                if args.server == 'asgi' and name in ASGI_SKIPPED_SCENARIOS:
+                    continue
+                url = f'http://127.0.0.1:{port}{paths[0]}'
+                if args.warmup:
+                    http_bench.run(url, args.concurrency, args.warmup, args.processes, method, body, paths)
+                results[name] = http_bench.run(url, args.concurrency, args.duration, args.processes,
+                                               method, body, paths)
+                print(f"  {storage:<6} {size:>8} {name:<17} {results[name]['requests_per_sec']:>8} 请求/秒  "
+                      f"p50 {results[name]['p50_ms']:>7} ms  p99 {results[name]['p99_ms']:>7} ms  "
+                      f"错误 {results[name]['errors']}")
+        finally:
+            sampler.stop()
+            stop_server(proc)
+        return {
+            'storage': storage,
+            'size': size,
+            'server': args.server,
+            'prepare_seconds': round(prepare_seconds, 2),
+            'startup_seconds': round(startup_seconds, 2),
+            'peak_rss_mb': sampler.peak_mb(),
+            'scenarios': results
+        }
+    finally:
+        if not args.keep_run_dir:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+
+# ---------- 进程内微基准 ----------
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {'best_ms': round(times[0] * 1000, 3), 'median_ms': round(times[len(times) // 2] * 1000, 3)}
+
+
+def run_micro(size, repeat):
+    from clustering import ClusterIndex
+    from file_store import FileStore
+    from read_cache import dump_json_bytes
+    from spatial_index import lat_lng_to_pixel, thin_markers
+    from tiles import TILE_SIZE, render_star_tile
+
+    work_dir = tempfile.mkdtemp(prefix=f'star-map-micro-{size}-')
+    try:
+        path = os.path.join(work_dir, 'data.json')
+        shutil.copyfile(file_dataset(size), path)
+        results = {}
+        stores = []
+        results['file_store_load'] = measure(lambda: stores.append(FileStore(path)), 1)
+        store = stores[0]
+
+        viewports = [(lat - 1, lng - 1, lat + 1, lng + 1) for _, lat, lng in CITIES]
+        results['bbox_query'] = measure(lambda: [store.query_bbox(bbox) for bbox in viewports], repeat)
+        _, lat, lng = CITIES[0]
+        nearby = store.query_bbox((lat - 3, lng - 3, lat + 3, lng + 3))
+        results['thin_markers_z8'] = measure(lambda: thin_markers(nearby, 8), repeat)
+
+        indexes = []
+
+        def build_index():
+            index = ClusterIndex()
+            for marker in store.markers:
+                index.insert(marker['latitude'], marker['longitude'], marker['id'])
+            indexes.append(index)
+        results['cluster_build'] = measure(build_index, 1)
+        index = indexes[0]
+        results['cluster_query'] = measure(lambda: (index.query(4), index.query(10, viewports[0])), repeat)
+
+        page = store.markers[-100:]
+        results['dump_json_page'] = measure(lambda: dump_json_bytes(page), repeat)
+        if size <= FULL_LIST_MAX_SIZE:
+            results['dump_json_all'] = measure(lambda: dump_json_bytes(store.markers), max(1, repeat // 5))
+
+        def points(bbox):
+            return [(float(m['latitude']), float(m['longitude'])) for m in store.query_bbox(bbox)]
+
+        # 低缩放级别的瓦片来自聚合索引，高缩放级别的瓦片按范围查询标记
+        for zoom in (4, 13):
+            x, y = lat_lng_to_pixel(lat, lng, zoom)
+            tile = (zoom, int(x // TILE_SIZE), int(y // TILE_SIZE))
+            results[f'render_tile_z{zoom}'] = measure(lambda: render_star_tile(*tile, index, points), repeat)
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run(args):
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'sizes': args.sizes, 'storages': args.storages, 'server': args.server,
+            'concurrency': args.concurrency, 'duration': args.duration, 'warmup': args.warmup,
+            'processes': args.processes, 'workers': args.workers, 'threads': args.threads, 'seed': args.seed
+        },
+        'runs': [],
+        'micro': {}
+    }
+    for size in args.sizes:
+        if not args.no_micro:
+            print(f"微基准: {size} 个标记")
+            report['micro'][str(size)] = run_micro(size, args.repeat)
+            for name, result in report['micro'][str(size)].items():
+                print(f"  {name:<17} 最快 {result['best_ms']:>10} ms  中位数 {result['median_ms']:>10} ms")
+        if not args.no_http:
+            for storage in args.storages:
+                if args.server == 'asgi' and storage == 'file':
+                    print("异步服务器不支持文件存储，跳过")
+                    continue
+                print(f"压测: {storage} 存储，{size} 个标记，{args.server}")
+                report['runs'].append(run_http(storage, size, args))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}-{datetime.now():%Y%m%d%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {output}")
+
+
+# ---------- 对比 ----------
+
+def flatten(report):
+    values = {}
+    for item in report.get('runs', []):
+        prefix = f"{item['storage']}/{item['size']}/{item['server']}"
+        values[f'{prefix}/peak_rss_mb'] = (item['peak_rss_mb'], False)
+        for name, result in item['scenarios'].items():
+            values[f'{prefix}/{name}/rps'] = (result['requests_per_sec'], True)
+            values[f'{prefix}/{name}/p99_ms'] = (result['p99_ms'], False)
+    for size, results in report.get('micro', {}).items():
+        for name, result in results.items():
+            values[f'micro/{size}/{name}/median_ms'] = (result['median_ms'], False)
+    return values
+
+
+# 逐项对比两次结果，变差超过阈值的项标记出来，有退化时返回1（可以在CI中使用）
+def compare(args):
+    with open(args.old, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    old_values = flatten(old)
+    new_values = flatten(new)
+    regressions = 0
+    for key in sorted(old_values.keys() & new_values.keys()):
+        (before, higher_is_better), (after, _) = old_values[key], new_values[key]
+        if not before:
+            continue
+        change = (after - before) / before * 100
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > args.threshold:
+            flag = '  <-- 退化'
+            regressions += 1
+        print(f"{key:<55} {before:>10} -> {after:>10}  {change:+7.1f}%{flag}")
+    print(f"共 {regressions} 项退化超过 {args.threshold}%")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='星图压测套件')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='生成数据集并压测')
+    run_parser.add_argument('--sizes', default='1k,100k,1m',
+                            type=lambda text: [parse_size(size) for size in text.split(',')])
+    run_parser.add_argument('--storages', default='file,sqlite', type=lambda text: text.split(','),
+                            help='file / sqlite / mysql（mysql 需要 --database-url）')
+    run_parser.add_argument('--scenarios', type=lambda text: text.split(','), help='只运行指定的场景')
+    run_parser.add_argument('--server', choices=('gunicorn', 'dev', 'asgi'), default='gunicorn',
+                            help='asgi 为单进程的异步服务器（async_server.py）')
+    run_parser.add_argument('--workers', type=int, default=2)
+    run_parser.add_argument('--threads', type=int, default=4)
+    run_parser.add_argument('-c', '--concurrency', type=int, default=16)
+    run_parser.add_argument('-d', '--duration', type=float, default=10)
+    run_parser.add_argument('--warmup', type=float, default=2)
+    run_parser.add_argument('-p', '--processes', type=int, default=1, help='压测客户端进程数')
+    run_parser.add_argument('--repeat', type=int, default=20, help='微基准重复次数')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--no-micro', action='store_true')
+    run_parser.add_argument('--no-http', action='store_true')
+    run_parser.add_argument('--database-url')
+    run_parser.add_argument('--reset-database', action='store_true', help='数据库已有数据时清空重建')
+    run_parser.add_argument('--keep-run-dir', action='store_true', help='保留运行目录（数据和服务器日志）')
+    run_parser.add_argument('-o', '--output', help='结果文件，默认 benchmarks/results/{提交}-{时间}.json')
+
+    compare_parser = commands.add_parser('compare', help='对比两次压测结果')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=10, help='变差超过该百分比视为退化')
+
+    args = parser.parse_args(argv)
+    if args.command == 'compare':
+        return compare(args)
+    run(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,299 @@
+# 批量写入标记：数据迁移工具（migrate_data.py）和批量接口共用
+#
+# 每批标记只执行固定数量的语句：按昵称批量查询/创建用户，多行INSERT写入位置并取回自增ID，
+# executemany 写入内容和点赞记录。不更新统计信息，由调用方在全部写入后统一计算或增量更新。
+import json
+import re
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select
+
+from geocoder import locate_marker
+from models import User, Location, Content, Like
+from ranking import hot_score
+
+# 每批写入的标记数
+CHUNK_SIZE = 2000
+
+# 单条多行INSERT的参数个数上限（SQLite默认最多32766个）
+MAX_STATEMENT_PARAMS = 10000
+
+# 与 add_marker 一致的默认值
+DEFAULT_NICKNAME = '匿名用户'
+DEFAULT_LATITUDE = 35.86166
+DEFAULT_LONGITUDE = 104.195397
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def parse_marker_date(value):
+    # fromisoformat 可以直接解析 DATE_FORMAT 格式，比 strptime 快得多
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.now()
+
+
+# 整理为统一的标记格式，坐标不合法时返回None
+def normalize_marker(marker):
+    try:
+        latitude = float(marker.get('latitude', DEFAULT_LATITUDE))
+        longitude = float(marker.get('longitude', DEFAULT_LONGITUDE))
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+
+    marker_id = marker.get('id')
+    likes = marker.get('likes') or 0
+    # 城市和省份由坐标离线反查，填写的位置保存为地址
+    city, province = locate_marker(marker)
+    return {
+        'id': marker_id if isinstance(marker_id, str) and 0 < len(marker_id) <= 50 else str(uuid.uuid4()),
+        'nickname': (marker.get('nickname') or DEFAULT_NICKNAME)[:50],
+        'location': city[:100],
+        'province': province,
+        # 文件存储的新记录已分开保存城市（location）和填写的位置（address）
+        'address': ((marker['address'] if 'address' in marker else marker.get('location')) or '')[:255] or None,
+        'latitude': latitude,
+        'longitude': longitude,
+        'message': marker.get('message') or '',
+        'image': marker.get('image') or None,
+        'likes': likes if isinstance(likes, int) and likes > 0 else 0,
+        'created_at': parse_marker_date(marker.get('date'))
+    }
+
+
+# 查询或创建昵称对应的用户，结果写入 cache（昵称 -> 用户ID），返回新建的用户数。
+# 其他请求同时创建的同一昵称由唯一索引去重，插入时忽略，重新查询取回ID。
+# 唯一索引按列的排序规则比较昵称（MySQL 默认的 utf8mb4 排序规则不区分大小写和重音），
+# "Bob" 可能对应已保存的 "bob"，查询结果中没有原样出现的昵称逐个按数据库的规则重新查询
+def resolve_user_ids(conn, nicknames, cache):
+    missing = list({nickname for nickname in nicknames if nickname not in cache})
+    if not missing:
+        return 0
+
+    def lookup(locking=False):
+        query = select(User.nickname, User.id).where(User.nickname.in_(missing))
+        if locking:
+            # 读取最新提交的数据，MySQL 可重复读的快照中看不到其他事务刚创建的用户
+            query = query.with_for_update(read=True)
+        cache.update(conn.execute(query).all())
+
+    lookup()
+    new_nicknames = [nickname for nickname in missing if nickname not in cache]
+    created = 0
+    if new_nicknames:
+        now = datetime.now()
+        created = insert_rows(conn, User.__table__, [{
+            'username': 'user_' + uuid.uuid4().hex[:12],
+            'nickname': nickname,
+            'registration_date': now,
+            'is_active': True,
+            'created_at': now,
+            'updated_at': now
+        } for nickname in new_nicknames], ignore=True)
+        lookup(locking=True)
+        for nickname in missing:
+            if nickname not in cache:
+                user_id = conn.execute(select(User.id).where(User.nickname == nickname)
+                                       .with_for_update(read=True)).scalar()
+                if user_id is None:
+                    raise ValueError(f'无法创建用户: {nickname}')
+                cache[nickname] = user_id
+    return created
+
+
+# 大批量写入时SQLAlchemy编译多行INSERT的开销远大于数据库执行本身，这里直接生成驱动层SQL，
+# 参数按列类型转换后以元组传给驱动
+def _driver_insert(conn, table, columns, row_count, ignore=False):
+    preparer = conn.dialect.identifier_preparer
+    placeholder = '?' if conn.dialect.paramstyle == 'qmark' else '%s'
+    row = '(' + ', '.join([placeholder] * len(columns)) + ')'
+    dialect = conn.dialect.name
+    # 忽略违反唯一约束的行，写法与 models.insert_ignore 相同
+    prefix = {'sqlite': 'INSERT OR IGNORE', 'postgresql': 'INSERT'}.get(dialect, 'INSERT IGNORE') if ignore else 'INSERT'
+    suffix = ' ON CONFLICT DO NOTHING' if ignore and dialect == 'postgresql' else ''
+    return (f"{prefix} INTO {preparer.format_table(table)} "
+            f"({', '.join(preparer.quote(column) for column in columns)}) "
+            f"VALUES {', '.join([row] * row_count)}{suffix}")
+
+
+def _driver_params(conn, table, columns, rows):
+    processors = [table.c[column].type.bind_processor(conn.dialect) for column in columns]
+    pairs = list(zip(columns, processors))
+    return [tuple(process(row[column]) if process else row[column] for column, process in pairs)
+            for row in rows]
+
+
+# executemany 写入，不需要取回自增ID，返回写入的行数
+def insert_rows(conn, table, rows, ignore=False):
+    if not rows:
+        return 0
+    columns = list(rows[0])
+    result = conn.exec_driver_sql(_driver_insert(conn, table, columns, 1, ignore),
+                                  _driver_params(conn, table, columns, rows))
+    return result.rowcount
+
+
+# 多行INSERT并按顺序返回新行的自增ID
+def insert_returning_ids(conn, table, rows):
+    columns = list(rows[0])
+    params = _driver_params(conn, table, columns, rows)
+    dialect = conn.dialect.name
+    ids = []
+    step = MAX_STATEMENT_PARAMS // len(columns)
+    for start in range(0, len(params), step):
+        batch = params[start:start + step]
+        sql = _driver_insert(conn, table, columns, len(batch))
+        flat = tuple(value for row in batch for value in row)
+        if dialect == 'postgresql':
+            ids.extend(row[0] for row in conn.exec_driver_sql(sql + ' RETURNING id', flat))
+            continue
+
+        result = conn.exec_driver_sql(sql, flat)
+        if dialect == 'sqlite':
+            # SQLite 返回最后一行的ID
+            last_id = result.lastrowid
+            ids.extend(range(last_id - len(batch) + 1, last_id + 1))
+        else:
+            # MySQL 返回第一行的ID；行数确定的单条INSERT分配的ID是连续的（步长为 auto_increment_increment）
+            increment = conn.exec_driver_sql('SELECT @@auto_increment_increment').scalar() or 1
+            ids.extend(result.lastrowid + i * increment for i in range(len(batch)))
+    return ids
+
+
+# 写入一批标记，返回实际写入的标记（已存在的内容ID跳过，坐标不合法的丢弃）和新建的用户数
+def insert_markers(conn, markers, user_cache=None):
+    if user_cache is None:
+        user_cache = {}
+    markers = [marker for marker in map(normalize_marker, markers) if marker is not None]
+
+    # 去掉批内和数据库中已存在的内容ID，重复执行导入时不会重复写入
+    unique = {}
+    for marker in markers:
+        unique.setdefault(marker['id'], marker)
+    if unique:
+        existing = conn.execute(select(Content.id).where(Content.id.in_(list(unique)))).scalars().all()
+        for content_id in existing:
+            unique.pop(content_id, None)
+    markers = list(unique.values())
+    if not markers:
+        return [], 0
+
+    new_users = resolve_user_ids(conn, [marker['nickname'] for marker in markers], user_cache)
+
+    now = datetime.now()
+    location_ids = insert_returning_ids(conn, Location.__table__, [{
+        'user_id': user_cache[marker['nickname']],
+        'latitude': marker['latitude'],
+        'longitude': marker['longitude'],
+        'address': marker['address'],
+        'city': marker['location'],
+        'province': marker['province'],
+        'country': '中国',
+        'created_at': marker['created_at'],
+        'updated_at': now
+    } for marker in markers])
+
+    insert_rows(conn, Content.__table__, [{
+        'id': marker['id'],
+        'user_id': user_cache[marker['nickname']],
+        'location_id': location_id,
+        'message': marker['message'],
+        'image_url': marker['image'],
+        'likes_count': marker['likes'],
+        'view_count': 0,
+        'is_featured': False,
+        'status': 'published',
+        'created_at': marker['created_at'],
+        'updated_at': now,
+        'hot_score': hot_score(marker['likes'], 0, marker['created_at'])
+    } for marker, location_id in zip(markers, location_ids)])
+
+    # 文件模式只保存点赞数，导入为匿名点赞记录，与 likes_count 保持一致
+    likes = [{'content_id': marker['id'], 'user_id': None, 'created_at': now}
+             for marker in markers for _ in range(marker['likes'])]
+    insert_rows(conn, Like.__table__, likes)
+    return markers, new_users
+
+
+# 转换为前端使用的标记格式
+def to_api_marker(marker):
+    result = {key: marker[key] for key in ('id', 'nickname', 'location', 'latitude', 'longitude',
+                                           'message', 'image', 'likes')}
+    result['date'] = marker['created_at'].strftime(DATE_FORMAT)
+    return result
+
+
+# ---------- 流式读取 ----------
+
+_MARKERS_KEY = re.compile(r'"markers"\s*:\s*\[')
+
+
+# 增量解析JSON文件中的标记数组，不把整个文件读入内存。
+# 支持快照格式 {"markers": [...], ...} 和直接的数组 [...]
+def iter_json_markers(f, chunk_size=1 << 16):
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        more = f.read(chunk_size)
+        if not more:
+            eof = True
+        buf = buf[pos:] + more
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    # 定位数组开始位置
+    skip_whitespace()
+    if pos < len(buf) and buf[pos] == '[':
+        pos += 1
+    else:
+        while True:
+            match = _MARKERS_KEY.search(buf, pos)
+            if match:
+                pos = match.end()
+                break
+            if eof:
+                return
+            # 保留末尾一段，避免键名被分块截断
+            pos = max(pos, len(buf) - 64)
+            fill()
+
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            raise ValueError('JSON文件不完整')
+        if buf[pos] == ']':
+            return
+        if buf[pos] == ',':
+            pos += 1
+            continue
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            fill()
+            continue
+        pos = end
+        yield item
+        # 已解析部分不再保留
+        if pos > chunk_size:
+            buf = buf[pos:]
+            pos = 0
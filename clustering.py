@@ -0,0 +1,98 @@
+# 服务端标记聚合（按缩放级别的分层网格）
+# 每个缩放级别把Web墨卡托像素平面划分为固定大小的网格，网格记录点数和经纬度之和，
+# 第z级的网格(x, y)正好包含在第z-1级的网格(x // 2, y // 2)中。
+# 新增标记时逐级累加，查询时只读取视口内的网格，不需要重新计算聚合。
+import math
+import threading
+
+from spatial_index import lat_lng_to_pixel
+
+# 聚合的最大缩放级别，更高的级别按该级别返回
+MAX_CLUSTER_ZOOM = 16
+
+# 聚合网格的像素大小
+CLUSTER_CELL_PIXELS = 64
+
+
+class ClusterIndex:
+    def __init__(self, max_zoom=MAX_CLUSTER_ZOOM, cell_pixels=CLUSTER_CELL_PIXELS):
+        self.max_zoom = max_zoom
+        self.cell_pixels = cell_pixels
+        # 每个缩放级别一个字典：(x, y) -> [数量, 纬度之和, 经度之和, 最近加入的标记ID]
+        self.levels = [{} for _ in range(max_zoom + 1)]
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def insert(self, lat, lng, marker_id=None):
+        lat = float(lat)
+        lng = float(lng)
+        # 最高级别的像素坐标，逐级右移得到各级网格
+        x, y = lat_lng_to_pixel(lat, lng, self.max_zoom)
+        cell_x = int(x // self.cell_pixels)
+        cell_y = int(y // self.cell_pixels)
+
+        with self.lock:
+            for zoom in range(self.max_zoom, -1, -1):
+                shift = self.max_zoom - zoom
+                key = (cell_x >> shift, cell_y >> shift)
+                cell = self.levels[zoom].get(key)
+                if cell is None:
+                    self.levels[zoom][key] = [1, lat, lng, marker_id]
+                else:
+                    cell[0] += 1
+                    cell[1] += lat
+                    cell[2] += lng
+                    cell[3] = marker_id
+            self.count += 1
+
+    def cell_counts(self, zoom, min_x, min_y, max_x, max_y):
+        # 返回网格坐标范围内（含边界）非空网格的 (x, y, 数量)
+        cells = self.levels[zoom]
+        with self.lock:
+            if (max_x - min_x + 1) * (max_y - min_y + 1) > len(cells):
+                return [(x, y, cell[0]) for (x, y), cell in cells.items()
+                        if min_x <= x <= max_x and min_y <= y <= max_y]
+            return [(x, y, cells[(x, y)][0])
+                    for x in range(min_x, max_x + 1)
+                    for y in range(min_y, max_y + 1)
+                    if (x, y) in cells]
+
+    def query(self, zoom, bbox=None):
+        zoom = max(0, min(int(zoom), self.max_zoom))
+        cells = self.levels[zoom]
+
+        with self.lock:
+            if bbox is None:
+                selected = list(cells.values())
+            else:
+                min_lat, min_lng, max_lat, max_lng = bbox
+                left, top = lat_lng_to_pixel(max_lat, min_lng, zoom)
+                right, bottom = lat_lng_to_pixel(min_lat, max_lng, zoom)
+                min_x = int(left // self.cell_pixels)
+                max_x = int(math.ceil(right / self.cell_pixels))
+                min_y = int(top // self.cell_pixels)
+                max_y = int(math.ceil(bottom / self.cell_pixels))
+
+                # 视口覆盖的网格比非空网格还多时，直接遍历非空网格
+                if (max_x - min_x + 1) * (max_y - min_y + 1) > len(cells):
+                    selected = [cell for (x, y), cell in cells.items()
+                                if min_x <= x <= max_x and min_y <= y <= max_y]
+                else:
+                    selected = [cells[(x, y)]
+                                for x in range(min_x, max_x + 1)
+                                for y in range(min_y, max_y + 1)
+                                if (x, y) in cells]
+            selected = [list(cell) for cell in selected]
+
+        clusters = []
+        for count, sum_lat, sum_lng, marker_id in selected:
+            cluster = {
+                'latitude': sum_lat / count,
+                'longitude': sum_lng / count,
+                'count': count
+            }
+            # 单个标记返回其ID，前端可以直接展示标记详情
+            if count == 1:
+                cluster['id'] = marker_id
+            clusters.append(cluster)
+        return clusters
@@ -0,0 +1,65 @@
+# 游标编码：把游标值编码为不透明的URL安全字符串，客户端原样传回
+import base64
+import json
+from datetime import datetime
+
+# 每页最多返回的标记数
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(*values):
+    raw = json.dumps(list(values), separators=(',', ':'), default=_encode_value)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+# 解码游标，格式不正确时抛出ValueError
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f'游标格式不正确: {e}')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('游标格式不正确')
+    return values
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'无法编码游标值: {value!r}')
+
+
+# 解析游标中的时间
+def parse_cursor_time(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError('游标中的时间格式不正确')
+
+
+# 解析分页大小参数，未提供时返回None
+def parse_limit(args, maximum=MAX_PAGE_SIZE):
+    limit = args.get('limit')
+    if limit is None:
+        return None
+    limit = int(limit)
+    if limit < 1 or limit > maximum:
+        raise ValueError(f'limit 应在 1 到 {maximum} 之间')
+    return limit
+
+
+# 解码 (created_at, id) 游标
+def decode_time_cursor(cursor):
+    created_at, item_id = decode_cursor(cursor, 2)
+    if not isinstance(item_id, str):
+        raise ValueError('游标格式不正确')
+    return parse_cursor_time(created_at), item_id
+
+
+# 解码整数游标（文件模式的日志序号或位置）
+def decode_int_cursor(cursor):
+    value = decode_cursor(cursor, 1)[0]
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise ValueError('游标格式不正确')
+    return value
@@ -10,7 +10,8 @@ CREATE TABLE users (
     last_login TIMESTAMP,
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_users_nickname UNIQUE (nickname)
 );
 
 -- 位置信息表
@@ -43,7 +44,8 @@ CREATE TABLE contents (
     is_featured BOOLEAN DEFAULT FALSE,
     status VARCHAR(20) DEFAULT 'published', -- published, pending, rejected
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    hot_score DOUBLE PRECISION -- 热度分数（见 ranking.py），精选内容按该列排序
 );
 
 -- 点赞记录表
@@ -73,8 +75,9 @@ CREATE INDEX idx_locations_user_id ON locations(user_id);
 CREATE INDEX idx_locations_city ON locations(city);
 CREATE INDEX idx_contents_user_id ON contents(user_id);
 CREATE INDEX idx_contents_location_id ON contents(location_id);
-CREATE INDEX idx_contents_created_at ON contents(created_at);
+CREATE INDEX idx_contents_created_at ON contents(created_at, id);
 CREATE INDEX idx_contents_is_featured ON contents(is_featured);
+CREATE INDEX idx_contents_hot_score ON contents(hot_score);
 
 -- 添加初始统计记录
 INSERT INTO statistics (id) VALUES (1) ON CONFLICT DO NOTHING;
@@ -102,32 +105,98 @@ JOIN
 JOIN 
     contents c ON l.id = c.location_id;
 
--- 创建触发器：更新统计信息
-CREATE OR REPLACE FUNCTION update_statistics()
+-- 城市计数表：每个城市的位置数量，用于增量维护覆盖城市数
+CREATE TABLE city_stats (
+    city VARCHAR(100) PRIMARY KEY,
+    marker_count INTEGER NOT NULL DEFAULT 0
+);
+
+-- 创建触发器：逐行增量更新统计信息，插入/删除一行只修改统计表的一行，不随数据量增长
+CREATE OR REPLACE FUNCTION increment_statistics()
 RETURNS TRIGGER AS $$
+DECLARE
+    delta INTEGER := CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END;
+    city_count INTEGER;
 BEGIN
+    IF TG_TABLE_NAME = 'users' THEN
+        UPDATE statistics SET total_users = total_users + delta, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+    ELSIF TG_TABLE_NAME = 'locations' THEN
+        UPDATE statistics SET total_locations = total_locations + delta, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        IF TG_OP = 'INSERT' AND NEW.city IS NOT NULL AND NEW.city <> '' THEN
+            INSERT INTO city_stats (city, marker_count) VALUES (NEW.city, 1)
+            ON CONFLICT (city) DO UPDATE SET marker_count = city_stats.marker_count + 1
+            RETURNING marker_count INTO city_count;
+            IF city_count = 1 THEN
+                UPDATE statistics SET total_cities = total_cities + 1 WHERE id = 1;
+            END IF;
+        ELSIF TG_OP = 'DELETE' AND OLD.city IS NOT NULL AND OLD.city <> '' THEN
+            UPDATE city_stats SET marker_count = marker_count - 1 WHERE city = OLD.city
+            RETURNING marker_count INTO city_count;
+            IF city_count = 0 THEN
+                DELETE FROM city_stats WHERE city = OLD.city;
+                UPDATE statistics SET total_cities = total_cities - 1 WHERE id = 1;
+            END IF;
+        END IF;
+    ELSIF TG_TABLE_NAME = 'contents' THEN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE statistics SET
+                total_contents = total_contents + 1,
+                total_photos = total_photos + (CASE WHEN NEW.image_url IS NOT NULL THEN 1 ELSE 0 END),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = 1;
+        ELSE
+            UPDATE statistics SET
+                total_contents = total_contents - 1,
+                total_photos = total_photos - (CASE WHEN OLD.image_url IS NOT NULL THEN 1 ELSE 0 END),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = 1;
+        END IF;
+    ELSIF TG_TABLE_NAME = 'likes' THEN
+        UPDATE statistics SET total_likes = total_likes + delta, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 全量重新统计：用于定期校准，修复增量计数的偏差（例如直接修改 image_url 或城市的更新语句）
+CREATE OR REPLACE FUNCTION reconcile_statistics()
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM city_stats;
+    INSERT INTO city_stats (city, marker_count)
+        SELECT city, COUNT(*) FROM locations WHERE city IS NOT NULL AND city <> '' GROUP BY city;
+    
+    -- 校准每条内容的点赞数（服务端批量写入点赞时累加 likes_count）
+    UPDATE contents c SET likes_count = COALESCE(l.cnt, 0)
+    FROM contents c2
+        LEFT JOIN (SELECT content_id, COUNT(*) AS cnt FROM likes GROUP BY content_id) l ON l.content_id = c2.id
+    WHERE c.id = c2.id AND c.likes_count IS DISTINCT FROM COALESCE(l.cnt, 0);
+    
     UPDATE statistics SET
         total_users = (SELECT COUNT(*) FROM users),
         total_locations = (SELECT COUNT(*) FROM locations),
         total_contents = (SELECT COUNT(*) FROM contents),
         total_photos = (SELECT COUNT(*) FROM contents WHERE image_url IS NOT NULL),
-        total_likes = (SELECT SUM(likes_count) FROM contents),
-        total_cities = (SELECT COUNT(DISTINCT city) FROM locations WHERE city IS NOT NULL),
+        total_likes = (SELECT COUNT(*) FROM likes),
+        total_cities = (SELECT COUNT(*) FROM city_stats),
         updated_at = CURRENT_TIMESTAMP
     WHERE id = 1;
-    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
--- 为相关表创建触发器
+-- 为相关表创建逐行触发器
 CREATE TRIGGER after_user_change
-AFTER INSERT OR UPDATE OR DELETE ON users
-FOR EACH STATEMENT EXECUTE FUNCTION update_statistics();
+AFTER INSERT OR DELETE ON users
+FOR EACH ROW EXECUTE FUNCTION increment_statistics();
 
 CREATE TRIGGER after_location_change
-AFTER INSERT OR UPDATE OR DELETE ON locations
-FOR EACH STATEMENT EXECUTE FUNCTION update_statistics();
+AFTER INSERT OR DELETE ON locations
+FOR EACH ROW EXECUTE FUNCTION increment_statistics();
 
 CREATE TRIGGER after_content_change
-AFTER INSERT OR UPDATE OR DELETE ON contents
-FOR EACH STATEMENT EXECUTE FUNCTION update_statistics();
\ No newline at end of file
+AFTER INSERT OR DELETE ON contents
+FOR EACH ROW EXECUTE FUNCTION increment_statistics();
+
+CREATE TRIGGER after_like_change
+AFTER INSERT OR DELETE ON likes
+FOR EACH ROW EXECUTE FUNCTION increment_statistics();
@@ -0,0 +1,156 @@
+# 数据库连接配置：连接地址和连接池参数从环境变量读取（支持 .env 文件）
+#
+# STAR_MAP_DATABASE_URL     完整的连接地址，设置后忽略下面的单项配置
+# STAR_MAP_DB_USER / STAR_MAP_DB_PASSWORD / STAR_MAP_DB_HOST / STAR_MAP_DB_PORT / STAR_MAP_DB_NAME
+# STAR_MAP_DB_POOL_SIZE     连接池常驻连接数，默认 10
+# STAR_MAP_DB_MAX_OVERFLOW  高峰时允许额外创建的连接数，默认 20
+# STAR_MAP_DB_POOL_TIMEOUT  连接全部占用时等待的秒数，默认 10
+# STAR_MAP_DB_POOL_RECYCLE  连接使用多少秒后重建，需小于MySQL的 wait_timeout，默认 1800
+# STAR_MAP_DB_PRE_PING      取出连接前检查是否可用，默认 true
+# STAR_MAP_SQL_ECHO         打印所有SQL语句，仅用于调试，默认 false
+# STAR_MAP_ASYNC_DATABASE_URL  异步服务器（async_server.py）的连接地址，默认把上面地址的驱动换成对应的异步驱动
+import os
+import threading
+import time
+from urllib.parse import quote_plus
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+
+def env_bool(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes')
+
+
+def database_url():
+    url = os.environ.get('STAR_MAP_DATABASE_URL')
+    if url:
+        return url
+    user = quote_plus(os.environ.get('STAR_MAP_DB_USER', 'root'))
+    password = quote_plus(os.environ.get('STAR_MAP_DB_PASSWORD', ''))
+    host = os.environ.get('STAR_MAP_DB_HOST', 'localhost')
+    port = os.environ.get('STAR_MAP_DB_PORT', '3306')
+    name = os.environ.get('STAR_MAP_DB_NAME', 'star_map')
+    return f'mysql+pymysql://{user}:{password}@{host}:{port}/{name}?charset=utf8mb4'
+
+
+def pool_options():
+    return {
+        'pool_size': int(os.environ.get('STAR_MAP_DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.environ.get('STAR_MAP_DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': float(os.environ.get('STAR_MAP_DB_POOL_TIMEOUT', '10')),
+    }
+
+
+def engine_options(url):
+    options = {
+        'echo': env_bool('STAR_MAP_SQL_ECHO', 'false'),
+        'pool_pre_ping': env_bool('STAR_MAP_DB_PRE_PING', 'true'),
+        'pool_recycle': int(os.environ.get('STAR_MAP_DB_POOL_RECYCLE', '1800')),
+    }
+    # SQLite 使用自己的连接池，不支持连接数配置
+    if not url.startswith('sqlite'):
+        options['poolclass'] = MonitoredQueuePool
+        options.update(pool_options())
+    return options
+
+
+# 记录等待次数的连接池：连接全部被占用时取连接需要排队，等待次数和超时次数反映连接池是否过小
+class MonitoredQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        exhausted = self.checkedin() == 0 and self.overflow() >= self._max_overflow
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            if exhausted:
+                with self.stats_lock:
+                    self.waits += 1
+                    self.wait_seconds += time.perf_counter() - start
+
+
+def create_db_engine(url=None):
+    url = url or database_url()
+    engine = create_engine(url, **engine_options(url))
+
+    # 多进程部署时连接池随fork复制到工作进程，父进程创建的连接不能在子进程中使用，
+    # 取出连接时发现不是本进程创建的就丢弃并重新连接
+    @event.listens_for(engine, 'connect')
+    def record_connection_pid(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def check_connection_pid(dbapi_connection, connection_record, connection_proxy):
+        if connection_record.info['pid'] != os.getpid():
+            connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+            raise exc.DisconnectionError('连接属于其他进程，重新连接')
+
+    return engine
+
+
+# 各数据库的异步驱动（需另外安装，见 requirements-async.txt）
+ASYNC_DRIVERS = {'mysql': 'aiomysql', 'sqlite': 'aiosqlite', 'postgresql': 'asyncpg'}
+
+
+def async_database_url(url=None):
+    url = os.environ.get('STAR_MAP_ASYNC_DATABASE_URL') or url or database_url()
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if parsed.get_driver_name() != ASYNC_DRIVERS.get(backend, parsed.get_driver_name()):
+        parsed = parsed.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+    return parsed
+
+
+# 异步引擎：连接池参数与同步引擎相同，使用SQLAlchemy的异步连接池（不统计排队等待次数）
+def create_async_db_engine(url=None):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    url = async_database_url(url)
+    options = engine_options(str(url))
+    options.pop('poolclass', None)
+    # aiosqlite 默认每次请求新建连接（和一个后台线程），文件数据库也使用连接池
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        options.update(poolclass=AsyncAdaptedQueuePool, **pool_options())
+    return create_async_engine(url, **options)
+
+
+# 连接池状态，用于健康检查
+def pool_status(engine):
+    pool = engine.pool
+    status = {'class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+            'timeout': pool.timeout(),
+        })
+    if isinstance(pool, MonitoredQueuePool):
+        with pool.stats_lock:
+            status.update({
+                'waits': pool.waits,
+                'wait_seconds': round(pool.wait_seconds, 3),
+                'timeouts': pool.timeouts,
+            })
+    return status
@@ -0,0 +1,214 @@
+# 实时事件总线：新标记、点赞等事件推送给所有 /api/stream 的SSE连接
+#
+# 每个事件只序列化一次，放入固定长度的环形缓冲区，所有订阅者共享同一份字节；
+# 订阅者只记录自己读到的事件编号，等待在同一个条件变量上，空闲连接不占用额外内存。
+# 断线重连时浏览器带上 Last-Event-ID，缓冲区内的事件会补发。
+#
+# 多个工作进程时，设置 STAR_MAP_EVENT_BROKER=host:port 连接本地中转服务（python event_bus.py 启动），
+# 各进程发布的事件经中转服务编号后广播给所有进程，事件编号在进程之间一致。
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+
+# 环形缓冲区保留的事件数
+EVENT_BUFFER_SIZE = int(os.environ.get('STAR_MAP_EVENT_BUFFER_SIZE', '1000'))
+
+# 中转服务地址，未设置时只在本进程内广播
+EVENT_BROKER = os.environ.get('STAR_MAP_EVENT_BROKER', '')
+
+# 与中转服务断开后重连的间隔（秒）
+BROKER_RECONNECT_INTERVAL = 1.0
+
+
+# SSE消息格式
+def format_event(event_id, event, data):
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'id: {event_id}\nevent: {event}\ndata: {body}\n\n'.encode('utf-8')
+
+
+class EventBus:
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE, broker=EVENT_BROKER):
+        self.events = deque(maxlen=buffer_size)
+        self.last_id = 0
+        self.condition = threading.Condition()
+        self.subscribers = 0
+        self.closed = False
+        # 事件到达时的回调，例如异步服务器用它唤醒事件循环
+        self.listeners = []
+        self.broker = BrokerClient(broker, self._deliver) if broker else None
+
+    def publish(self, event, data):
+        # 有中转服务时由中转服务编号后再广播回来，中转服务不可用时直接在本进程内广播
+        if self.broker is not None and self.broker.send(event, data):
+            return
+        self._deliver(None, event, data)
+
+    def _deliver(self, event_id, event, data):
+        with self.condition:
+            if event_id is None:
+                event_id = self.last_id + 1
+            elif event_id <= self.last_id:
+                # 中转服务重启后编号从头开始，丢弃旧编号的事件
+                self.events.clear()
+            self.events.append((event_id, format_event(event_id, event, data)))
+            self.last_id = event_id
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def events_after(self, last_id):
+        # 返回编号大于 last_id 的事件数据和最新编号
+        with self.condition:
+            if last_id > self.last_id:
+                # 客户端的编号来自中转服务重启之前，补发缓冲区中的全部事件
+                last_id = 0
+            payloads = [payload for event_id, payload in self.events if event_id > last_id]
+            return payloads, self.last_id
+
+    def wait(self, last_id, timeout):
+        # 等待新事件，超时返回False
+        with self.condition:
+            return self.condition.wait_for(lambda: self.last_id != last_id or self.closed, timeout)
+
+    def close(self):
+        # 服务退出时唤醒所有订阅者，让SSE连接结束
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def open_subscription(self, limit=None):
+        # 订阅者数已达到 limit 时返回False；检查和计数在同一把锁内，并发连接不会超过上限
+        with self.condition:
+            if limit is not None and self.subscribers >= limit:
+                return False
+            self.subscribers += 1
+        # 订阅者需要收到其他进程的事件，确保已连接中转服务
+        if self.broker is not None:
+            self.broker.start()
+        return True
+
+    def close_subscription(self):
+        with self.condition:
+            self.subscribers -= 1
+
+
+# 连接中转服务：发布事件，并在后台线程中接收广播。
+# 首次使用时才建立连接，fork出的工作进程各自重新连接
+class BrokerClient:
+    def __init__(self, address, on_event):
+        host, port = address.rsplit(':', 1)
+        self.address = (host, int(port))
+        self.on_event = on_event
+        self.sock = None
+        self.lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        with self.lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.sock = None
+            self._connect()
+        threading.Thread(target=self._run, name='event-broker', daemon=True).start()
+
+    def send(self, event, data):
+        self.start()
+        line = json.dumps({'event': event, 'data': data}, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            if self.sock is None:
+                return False
+            try:
+                self.sock.sendall(line.encode('utf-8') + b'\n')
+                return True
+            except OSError as e:
+                print(f"事件中转服务发送失败: {e}")
+                self._close()
+                return False
+
+    def _connect(self):
+        try:
+            self.sock = socket.create_connection(self.address, timeout=BROKER_RECONNECT_INTERVAL)
+            self.sock.settimeout(None)
+        except OSError:
+            self.sock = None
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if self.sock is None:
+                    self._connect()
+                sock = self.sock
+            if sock is None:
+                time.sleep(BROKER_RECONNECT_INTERVAL)
+                continue
+            try:
+                for line in sock.makefile('rb'):
+                    message = json.loads(line)
+                    self.on_event(message['id'], message['event'], message['data'])
+            except (OSError, ValueError) as e:
+                print(f"事件中转服务连接中断: {e}")
+            with self.lock:
+                if self.sock is sock:
+                    self._close()
+            time.sleep(BROKER_RECONNECT_INTERVAL)
+
+
+# 本地中转服务：给每个事件分配全局编号，再广播给所有连接的工作进程
+class BrokerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, BrokerHandler)
+        self.clients = set()
+        self.last_id = 0
+        self.lock = threading.Lock()
+
+    def broadcast(self, message):
+        with self.lock:
+            self.last_id += 1
+            message['id'] = self.last_id
+            line = json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+            for client in list(self.clients):
+                try:
+                    client.sendall(line)
+                except OSError:
+                    self.clients.discard(client)
+
+
+class BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        with self.server.lock:
+            self.server.clients.add(self.request)
+        try:
+            for line in self.rfile:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                self.server.broadcast({'event': message.get('event'), 'data': message.get('data')})
+        finally:
+            with self.server.lock:
+                self.server.clients.discard(self.request)
+
+
+if __name__ == '__main__':
+    address = sys.argv[1] if len(sys.argv) > 1 else (EVENT_BROKER or '127.0.0.1:8765')
+    host, port = address.rsplit(':', 1)
+    server = BrokerServer((host, int(port)))
+    print(f"事件中转服务已启动: {address}")
+    server.serve_forever()
@@ -0,0 +1,455 @@
+# 文件存储模式的数据层：快照 + 追加写日志
+#
+# data.json 保存快照（与旧版格式兼容：markers + stats，另加 seq 记录快照包含的最后一条日志序号），
+# 每次写入只向 data.jsonl 追加一行 JSON 记录，内存中维护全部标记、统计和空间索引。
+# 日志记录数达到阈值后在后台线程中把内存状态写成新快照并截断日志。
+# 启动时读取快照并重放日志尾部，崩溃时写了一半的最后一行会被截掉。
+# 多进程通过 .lock 文件上的 fcntl.flock 互斥写入；没有 fcntl 的平台（Windows）只做线程内互斥。
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from spatial_index import GridIndex, in_bbox
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 日志累计多少条记录后触发压缩
+COMPACT_THRESHOLD = int(os.environ.get('STAR_MAP_COMPACT_THRESHOLD', '1000'))
+
+# 每次追加后是否fsync（默认只写入操作系统缓存，进程崩溃不丢数据）
+LOG_FSYNC = os.environ.get('STAR_MAP_LOG_FSYNC', 'false').lower() == 'true'
+
+# 检查其他进程写入的最小间隔（秒），间隔内的读请求完全使用内存数据
+REFRESH_INTERVAL = float(os.environ.get('STAR_MAP_REFRESH_INTERVAL', '1.0'))
+
+
+def empty_stats():
+    return {
+        'totalMarkers': 0,
+        'totalCities': 0,
+        'totalPhotos': 0,
+        'totalComments': 0
+    }
+
+
+class FileStore:
+    def __init__(self, path, log_path=None, compact_threshold=COMPACT_THRESHOLD, fsync=LOG_FSYNC,
+                 refresh_interval=REFRESH_INTERVAL):
+        self.path = path
+        self.log_path = log_path or os.path.splitext(path)[0] + '.jsonl'
+        self.lock_path = self.log_path + '.lock'
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self.refresh_interval = refresh_interval
+        self._last_refresh = 0.0
+
+        self.lock = threading.RLock()
+        self._lock_fd = None
+        self._lock_pid = None
+        self._lock_depth = 0
+
+        # 日志读取句柄保持打开，旧日志的inode不会被新文件复用，可以可靠地判断日志是否被替换
+        self._log_file = None
+        self._log_inode = None
+        self._log_offset = 0
+        self._pid = None
+
+        self._listeners = []
+        self._compacting = False
+
+        # version 在每次内存状态变化时递增，供读缓存判断数据是否更新
+        self.version = 0
+        with self._file_lock(exclusive=True):
+            self._reload(recover=True)
+
+    # ---------- 锁 ----------
+
+    def _get_lock_fd(self):
+        # 子进程需要重新打开锁文件，flock 在 fork 后的共享文件描述上不互斥
+        if self._lock_fd is None or self._lock_pid != os.getpid():
+            self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._lock_pid = os.getpid()
+        return self._lock_fd
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        with self.lock:
+            outermost = self._lock_depth == 0
+            if outermost and fcntl is not None:
+                fcntl.flock(self._get_lock_fd(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if outermost and fcntl is not None:
+                    fcntl.flock(self._get_lock_fd(), fcntl.LOCK_UN)
+
+    # ---------- 日志文件 ----------
+
+    def _open_log(self):
+        self._close_log()
+        try:
+            self._log_file = open(self.log_path, 'rb')
+        except FileNotFoundError:
+            return
+        self._log_inode = os.fstat(self._log_file.fileno()).st_ino
+
+    def _close_log(self):
+        if self._log_file is not None:
+            self._log_file.close()
+        self._log_file = None
+        self._log_inode = None
+        self._log_offset = 0
+
+    def _stale(self):
+        # fork出的子进程需要重新加载；日志被其他进程压缩替换（或新建、删除）后也需要重新加载
+        if self._pid != os.getpid():
+            return True
+        try:
+            return os.stat(self.log_path).st_ino != self._log_inode
+        except FileNotFoundError:
+            return self._log_inode is not None
+
+    def _truncate_partial_line(self):
+        # 崩溃恢复：去掉日志末尾不完整的一行
+        with open(self.log_path, 'rb+') as f:
+            content = f.read()
+            end = content.rfind(b'\n') + 1
+            if end != len(content):
+                print(f"日志末尾存在不完整记录，已截断 {len(content) - end} 字节")
+                f.truncate(end)
+
+    def _read_log_tail(self):
+        if self._log_file is None:
+            return
+        self._log_file.seek(self._log_offset)
+        chunk = self._log_file.read()
+
+        # 只处理完整的行，未写完的行留到下次读取
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            return
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                print(f"跳过无法解析的日志记录: {e}")
+                continue
+            self._apply_record(record)
+        self._log_offset += end
+
+    # ---------- 加载与重放 ----------
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            data = {'markers': [], 'stats': empty_stats(), 'seq': 0}
+            self._write_json_atomic(self.path, data)
+            return data
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _reload(self, recover=False):
+        self._close_log()
+        data = self._read_snapshot()
+
+        self.markers = []
+        # 与 markers 对应的日志序号，用于增量同步（since 游标）
+        self.marker_seqs = []
+        self.by_id = {}
+        self.index = GridIndex()
+        self.cities = set()
+        # 标记ID -> 浏览数，不放在标记中，接口返回的标记格式不变
+        self.views = dict(data.get('views', {}))
+        # 已点赞的 (标记ID, 用户ID)，同一用户对同一标记只计一次
+        self.liked = {tuple(pair) for pair in data.get('liked', [])}
+        self.stats = dict(empty_stats(), **data.get('stats', {}))
+        for key in ('totalMarkers', 'totalCities', 'totalPhotos', 'totalComments'):
+            self.stats[key] = 0
+
+        markers = data.get('markers', [])
+        marker_seqs = data.get('marker_seqs') or [0] * len(markers)
+        for marker, seq in zip(markers, marker_seqs):
+            self._apply_marker(marker, seq)
+        self.seq = data.get('seq', 0)
+        self.last_modified = data.get('last_modified') or os.path.getmtime(self.path)
+        self.log_records = 0
+
+        # 重放日志
+        if recover and os.path.exists(self.log_path):
+            self._truncate_partial_line()
+        self._open_log()
+        self._read_log_tail()
+        self._pid = os.getpid()
+
+        self.version += 1
+        for _, on_reset, _ in self._listeners:
+            if on_reset is not None:
+                on_reset()
+
+    def _apply_record(self, record):
+        # 快照已包含的记录直接跳过（压缩过程中崩溃时日志可能与快照重叠）
+        seq = record.get('seq', 0)
+        if seq <= self.seq:
+            return
+        self.seq = seq
+        self.log_records += 1
+        self.last_modified = record.get('ts', self.last_modified)
+
+        if record.get('op') == 'add':
+            marker = record['marker']
+            self._apply_marker(marker, seq)
+            for on_marker, _, _ in self._listeners:
+                on_marker(marker)
+        elif record.get('op') == 'like':
+            # likes 为匿名点赞数，users 为实名点赞的 [标记ID, 用户ID]，已点过赞的不再计数
+            # （多个进程可能同时写入同一用户的点赞，按日志顺序只有第一条生效）
+            likes = dict(record.get('likes', {}))
+            for marker_id, user_id in record.get('users', []):
+                if (marker_id, user_id) not in self.liked and marker_id in self.by_id:
+                    self.liked.add((marker_id, user_id))
+                    likes[marker_id] = likes.get(marker_id, 0) + 1
+            for marker_id, count in likes.items():
+                marker = self.by_id.get(marker_id)
+                if marker is not None:
+                    marker['likes'] = marker.get('likes', 0) + count
+                    for _, _, on_update in self._listeners:
+                        if on_update is not None:
+                            on_update(marker)
+        elif record.get('op') == 'view':
+            for marker_id, count in record['views'].items():
+                marker = self.by_id.get(marker_id)
+                if marker is not None:
+                    self.views[marker_id] = self.views.get(marker_id, 0) + count
+                    for _, _, on_update in self._listeners:
+                        if on_update is not None:
+                            on_update(marker)
+        self.version += 1
+
+    def _apply_marker(self, marker, seq):
+        if marker.get('id') in self.by_id:
+            return
+        self.markers.append(marker)
+        self.marker_seqs.append(seq)
+        self.by_id[marker.get('id')] = marker
+        try:
+            self.index.insert(float(marker['latitude']), float(marker['longitude']), marker)
+        except (KeyError, TypeError, ValueError):
+            pass
+
+        self.stats['totalMarkers'] += 1
+        self.stats['totalComments'] += 1
+        if marker.get('image'):
+            self.stats['totalPhotos'] += 1
+        if marker.get('location'):
+            self.cities.add(marker['location'])
+            self.stats['totalCities'] = len(self.cities)
+
+    def refresh(self, force=False):
+        # 读取其他进程追加的日志；日志被其他进程压缩替换后重新加载。
+        # 本进程的写入立即生效，其他进程的写入最多延迟 refresh_interval 秒可见
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = now
+
+        with self.lock:
+            if not self._stale():
+                if self._log_file is None:
+                    return
+                if os.fstat(self._log_file.fileno()).st_size == self._log_offset:
+                    return
+
+            with self._file_lock(exclusive=False):
+                if self._stale():
+                    self._reload()
+                else:
+                    self._read_log_tail()
+
+    # ---------- 读取 ----------
+
+    def current_version(self):
+        self.refresh()
+        return self.version
+
+    def all_markers(self):
+        self.refresh()
+        with self.lock:
+            return list(self.markers)
+
+    def query_bbox(self, bbox):
+        self.refresh()
+        with self.lock:
+            return self.index.query(*bbox)
+
+    def markers_since(self, seq):
+        # 返回日志序号大于 seq 的标记，以及当前最新序号（作为下一次的游标）
+        self.refresh()
+        with self.lock:
+            start = bisect.bisect_right(self.marker_seqs, seq)
+            return self.markers[start:], self.seq
+
+    def markers_before(self, position, limit, bbox=None):
+        # 从新到旧分页：返回位置 position 之前的最多 limit 个标记，以及下一页的起始位置（没有更多时为None）。
+        # 标记只追加不删除，压缩也保持顺序，所以位置在各进程之间一致
+        self.refresh()
+        with self.lock:
+            index = len(self.markers) if position is None else min(position, len(self.markers))
+            page = []
+            while index > 0 and len(page) < limit:
+                index -= 1
+                marker = self.markers[index]
+                if bbox is None or in_bbox(marker, bbox):
+                    page.append(marker)
+            return page, index if index > 0 else None
+
+    def get_stats(self):
+        self.refresh()
+        with self.lock:
+            return dict(self.stats)
+
+    def subscribe(self, on_marker, on_reset=None, on_update=None):
+        # on_marker 在每个新标记应用后调用（包括其他进程写入的），on_reset 在整体重新加载后调用，
+        # on_update 在已有标记的点赞数、浏览数变化后调用
+        with self.lock:
+            self._listeners.append((on_marker, on_reset, on_update))
+
+    # ---------- 写入 ----------
+
+    def _append(self, *records):
+        # 多条记录一次写入，只加锁和 fsync 一次
+        with self._file_lock(exclusive=True):
+            # 先追上其他进程的写入，保证序号连续
+            if self._stale():
+                self._reload()
+            else:
+                self._read_log_tail()
+
+            now = time.time()
+            for offset, record in enumerate(records, 1):
+                record['seq'] = self.seq + offset
+                record['ts'] = now
+            data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8')
+            fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            if self._log_file is None:
+                self._open_log()
+            self._read_log_tail()
+
+            if self.log_records >= self.compact_threshold and not self._compacting:
+                self._compacting = True
+                threading.Thread(target=self.compact, name='file-store-compact', daemon=True).start()
+
+    def add_marker(self, marker):
+        self._append({'op': 'add', 'marker': marker})
+        return marker
+
+    def add_markers(self, markers):
+        if markers:
+            self._append(*({'op': 'add', 'marker': marker} for marker in markers))
+        return markers
+
+    def get_marker(self, marker_id):
+        self.refresh()
+        with self.lock:
+            return self.by_id.get(marker_id)
+
+    def add_likes(self, likes, users=()):
+        # likes: {标记ID: 新增匿名点赞数}，users: 实名点赞的 (标记ID, 用户ID)，一批点赞只写一条日志记录
+        if likes or users:
+            self._append({'op': 'like', 'likes': likes, 'users': [list(pair) for pair in users]})
+
+    def has_liked(self, marker_id, user_id):
+        self.refresh()
+        with self.lock:
+            return (marker_id, user_id) in self.liked
+
+    def add_views(self, views):
+        # views: {标记ID: 新增浏览数}，一批浏览数只写一条日志记录
+        if views:
+            self._append({'op': 'view', 'views': views})
+
+    def view_count(self, marker_id):
+        with self.lock:
+            return self.views.get(marker_id, 0)
+
+    # ---------- 压缩 ----------
+
+    # 临时文件名包含进程号和线程号，手动压缩与后台压缩同时进行时互不覆盖
+    def _write_json_atomic(self, path, data):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def compact(self):
+        try:
+            # 1. 持锁截取当前状态
+            with self._file_lock(exclusive=True):
+                self.refresh(force=True)
+                if self._log_file is None:
+                    return
+                snapshot = {
+                    # 标记字典会被之后应用的点赞原地修改，持锁复制，避免快照包含截取点之后的点赞（日志尾部也会保留它们）
+                    'markers': [dict(marker) for marker in self.markers],
+                    'marker_seqs': list(self.marker_seqs),
+                    'stats': dict(self.stats),
+                    'views': dict(self.views),
+                    'liked': sorted(list(pair) for pair in self.liked),
+                    'seq': self.seq,
+                    'last_modified': self.last_modified
+                }
+                cut_file = self._log_file
+                cut_offset = self._log_offset
+
+            # 2. 不持锁序列化快照，压缩期间的写入继续追加到日志
+            tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+
+            # 3. 持锁替换快照，并把截取点之后追加的记录搬到新日志
+            with self._file_lock(exclusive=True):
+                if self._stale() or self._log_file is not cut_file:
+                    # 其他进程已经完成了压缩，放弃本次结果
+                    os.remove(tmp_path)
+                    self.refresh(force=True)
+                    return
+                self._read_log_tail()
+                cut_file.seek(cut_offset)
+                tail = cut_file.read(self._log_offset - cut_offset)
+
+                tmp_log = f'{self.log_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp_log, 'wb') as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                os.replace(tmp_log, self.log_path)
+
+                # 新日志中的记录都已应用过
+                self._open_log()
+                self._log_offset = len(tail)
+                self.log_records = tail.count(b'\n')
+            print(f"数据文件压缩完成，共 {len(snapshot['markers'])} 个标记")
+        except Exception as e:
+            print(f"数据文件压缩失败: {e}")
+        finally:
+            self._compacting = False
@@ -0,0 +1,129 @@
+# 离线反向地理编码：从本地地名库 gazetteer.csv 中查找距离坐标最近的城市，不访问网络。
+#
+# 地名库每行为 城市,省份,纬度,经度，包含全国地级行政区和港澳台主要城市的驻地坐标，
+# 面积很大的地区（西藏、新疆、青海等）另有几个同名的参考点。按最近的驻地判断归属是对行政区边界的近似，
+# 边界附近的坐标可能归入相邻城市；最近的驻地超过 MAX_DISTANCE_KM 时认为不在覆盖范围内，返回None。
+#
+# 坐标转换为单位球面上的三维向量后建立KD树，弦长最近即球面距离最近，不受经度收缩和经度180度处的影响。
+# 几百个地点的树深度约9层，单次查询只比较十几到几十个节点，耗时在几十微秒以内。
+import csv
+import math
+import os
+import threading
+
+GAZETTEER_PATH = os.environ.get('STAR_MAP_GAZETTEER_PATH',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.csv'))
+
+# 与最近驻地的最大距离（公里），超过时不返回结果
+MAX_DISTANCE_KM = float(os.environ.get('STAR_MAP_GEOCODE_MAX_KM', '300'))
+
+EARTH_RADIUS_KM = 6371.0088
+
+COUNTRY = '中国'
+
+
+# 经纬度转换为单位球面上的三维向量
+def to_vector(lat, lng):
+    phi = math.radians(lat)
+    lam = math.radians(lng)
+    cos_phi = math.cos(phi)
+    return cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi)
+
+
+class Gazetteer:
+    def __init__(self, places, max_distance_km=MAX_DISTANCE_KM):
+        # places 为 (城市, 省份, 纬度, 经度)
+        self.places = [(city, province) for city, province, _, _ in places]
+        # 距离上限换算为弦长的平方，查询时直接比较
+        chord = 2 * math.sin(min(max_distance_km / EARTH_RADIUS_KM, math.pi) / 2)
+        self.max_chord2 = chord * chord
+        points = [(to_vector(float(lat), float(lng)), index)
+                  for index, (_, _, lat, lng) in enumerate(places)]
+        self.root = self._build(points, 0)
+
+    @classmethod
+    def load(cls, path=GAZETTEER_PATH, **kwargs):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            places = [(row['city'], row['province'], row['latitude'], row['longitude'])
+                      for row in csv.DictReader(f)]
+        return cls(places, **kwargs)
+
+    # 节点为 (向量, 地点下标, 划分维度, 左子树, 右子树)
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda point: point[0][axis])
+        middle = len(points) // 2
+        vector, index = points[middle]
+        return (vector, index, axis,
+                self._build(points[:middle], depth + 1),
+                self._build(points[middle + 1:], depth + 1))
+
+    # 最近地点的下标和弦长的平方，超出距离上限时下标为None
+    def nearest(self, lat, lng):
+        target = to_vector(lat, lng)
+        best = [None, self.max_chord2]
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            vector, index, axis, left, right = node
+            dx = vector[0] - target[0]
+            dy = vector[1] - target[1]
+            dz = vector[2] - target[2]
+            distance = dx * dx + dy * dy + dz * dz
+            if distance <= best[1]:
+                best[0] = index
+                best[1] = distance
+            diff = target[axis] - vector[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # 先压入远侧，弹出时先访问近侧；远侧只有与划分平面的距离小于当前最优时才可能更近
+            if diff * diff <= best[1]:
+                stack.append(far)
+            stack.append(near)
+        return best[0], best[1]
+
+    # 返回 {city, province, country, distance}，distance 为与驻地的距离（公里）
+    def reverse(self, lat, lng):
+        index, chord2 = self.nearest(lat, lng)
+        if index is None:
+            return None
+        city, province = self.places[index]
+        distance = 2 * math.asin(min(math.sqrt(chord2) / 2, 1.0)) * EARTH_RADIUS_KM
+        return {'city': city, 'province': province, 'country': COUNTRY, 'distance': round(distance, 1)}
+
+
+_gazetteer = {'gazetteer': None}
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    if _gazetteer['gazetteer'] is None:
+        with _gazetteer_lock:
+            if _gazetteer['gazetteer'] is None:
+                _gazetteer['gazetteer'] = Gazetteer.load()
+    return _gazetteer['gazetteer']
+
+
+# 坐标不合法或不在覆盖范围内时返回None
+def reverse_geocode(lat, lng):
+    try:
+        lat = float(lat)
+        lng = float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return get_gazetteer().reverse(lat, lng)
+
+
+# 标记的城市和省份：提交了坐标且在覆盖范围内时取反查结果，否则城市为填写的位置、省份为None
+def locate_marker(marker):
+    place = None
+    if marker.get('latitude') is not None and marker.get('longitude') is not None:
+        place = reverse_geocode(marker['latitude'], marker['longitude'])
+    if place is None:
+        return marker.get('location') or '', None
+    return place['city'], place['province']
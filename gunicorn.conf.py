@@ -0,0 +1,73 @@
+# gunicorn 配置：gunicorn -c gunicorn.conf.py wsgi:app
+# 所有参数都可以通过环境变量调整
+import multiprocessing
+import os
+import signal
+
+bind = os.environ.get('STAR_MAP_BIND', '0.0.0.0:8000')
+
+# 工作进程数，默认 CPU核数 * 2 + 1
+workers = int(os.environ.get('STAR_MAP_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# 每个工作进程的线程数；SSE长连接较多时可改用 gevent（STAR_MAP_WORKER_CLASS=gevent）
+threads = int(os.environ.get('STAR_MAP_THREADS', '4'))
+worker_class = os.environ.get('STAR_MAP_WORKER_CLASS', 'gthread')
+worker_connections = int(os.environ.get('STAR_MAP_WORKER_CONNECTIONS', '1000'))
+
+# 线程型工作进程（gthread，或 threads 为1的 sync）中每个SSE连接在整个连接期间占用一个线程。
+# 默认每个进程最多一半的线程用于SSE（至少1个，只有1个线程时SSE连接会占满该线程），其余线程留给普通请求，
+# 超过时 /api/stream 返回503；
+# 需要大量实时连接时使用 gevent 工作进程，或把 /api/stream 转发到 async_server.py。
+# 配置文件在加载应用之前执行，这里设置的默认值对 start-server.py 生效，显式设置的环境变量优先
+if worker_class in ('gthread', 'sync'):
+    os.environ.setdefault('STAR_MAP_MAX_STREAM_CLIENTS', str(max(1, threads // 2)))
+
+# 请求超时和平滑退出等待时间（秒）
+timeout = int(os.environ.get('STAR_MAP_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('STAR_MAP_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('STAR_MAP_KEEPALIVE', '5'))
+
+# 处理一定数量的请求后重启工作进程，防止内存缓慢增长
+max_requests = int(os.environ.get('STAR_MAP_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('STAR_MAP_MAX_REQUESTS_JITTER', '0'))
+
+# 在主进程中加载应用，数据库表和示例数据只初始化一次
+preload_app = True
+
+accesslog = os.environ.get('STAR_MAP_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def _server():
+    import wsgi
+    return wsgi.server
+
+
+# 主进程创建工作进程之前关闭初始化时打开的数据库连接
+def pre_fork(server, worker):
+    _server().before_fork()
+
+
+# 每个工作进程启动自己的后台任务
+def post_fork(server, worker):
+    _server().on_worker_start()
+
+
+# 收到退出信号时先结束SSE长连接，其余请求在 graceful_timeout 内正常完成
+def post_worker_init(worker):
+    handle_exit = worker.handle_exit
+
+    def on_exit(sig, frame):
+        _server().begin_shutdown()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, on_exit)
+
+
+def worker_int(worker):
+    _server().begin_shutdown()
+
+
+# 工作进程退出前停止后台任务
+def worker_exit(server, worker):
+    _server().stop_background_tasks()
@@ -0,0 +1,231 @@
+# 密度热力图：所有标记的坐标保存在连续的数组中，预先换算为Web墨卡托平面坐标（[0, 1) 范围）。
+# 请求某个缩放级别时，视口覆盖的瓦片一次性分箱：用 NumPy 向量化计算每个点所在的网格并用 bincount 计数，
+# 不逐个遍历标记对象。每张瓦片分为 GRID_SIZE x GRID_SIZE 个网格（第 z 级下每个网格 256 / GRID_SIZE 像素）。
+#
+# 分箱结果按瓦片 (z, x, y) 缓存为非空网格的计数和序列化好的JSON片段；新增标记时只给已缓存的、
+# 包含该点的各级瓦片对应网格加一，并让该瓦片的JSON片段失效，不需要重新分箱。
+# 未安装 NumPy 时用纯Python循环分箱，结果相同但较慢。
+#
+# 返回格式：{"zoom": z, "gridSize": 64, "cellPixels": 4, "max": 最大数量,
+#            "tiles": [{"x": 瓦片x, "y": 瓦片y, "cells": [列, 行, 数量, 列, 行, 数量, ...]}, ...]}
+# 只包含非空的瓦片和网格，网格 (列, 行) 的像素范围为瓦片左上角加上 (列, 行) * cellPixels。
+import math
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+from spatial_index import MAX_LATITUDE
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+# 每张瓦片每边的网格数
+GRID_SIZE = 64
+
+# 热力图的最大缩放级别，更高的级别按该级别计算
+MAX_HEATMAP_ZOOM = 16
+
+# 一次请求最多覆盖的瓦片数（2560x1440 的视口约覆盖 11 x 7 张）
+MAX_HEATMAP_TILES = int(os.environ.get('STAR_MAP_HEATMAP_MAX_TILES', '128'))
+
+# 缓存的瓦片数，最久未使用的先淘汰
+HEATMAP_CACHE_TILES = int(os.environ.get('STAR_MAP_HEATMAP_CACHE_TILES', '2048'))
+
+# 从迭代器读取坐标时每批的数量
+LOAD_BATCH_SIZE = 10000
+
+
+# 经纬度转换为 [0, 1) 范围的Web墨卡托平面坐标
+def project(lat, lng):
+    lat = max(min(float(lat), MAX_LATITUDE), -MAX_LATITUDE)
+    sin_lat = math.sin(math.radians(lat))
+    u = (float(lng) + 180.0) / 360.0
+    v = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(u, 0.0), math.nextafter(1.0, 0.0)), min(max(v, 0.0), math.nextafter(1.0, 0.0))
+
+
+def project_arrays(lats, lngs):
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    sin_lat = np.sin(np.radians(lats))
+    u = (np.asarray(lngs, dtype=np.float64) + 180.0) / 360.0
+    v = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)
+    top = np.nextafter(1.0, 0.0)
+    return np.clip(u, 0.0, top), np.clip(v, 0.0, top)
+
+
+# 经纬度范围覆盖的瓦片坐标范围（含边界）
+def bbox_tiles(z, bbox):
+    limit = (1 << z) - 1
+    if bbox is None:
+        return 0, 0, limit, limit
+    min_lat, min_lng, max_lat, max_lng = bbox
+    left, top = project(max_lat, min_lng)
+    right, bottom = project(min_lat, max_lng)
+    return (min(int(left * (1 << z)), limit), min(int(top * (1 << z)), limit),
+            min(int(right * (1 << z)), limit), min(int(bottom * (1 << z)), limit))
+
+
+class Heatmap:
+    def __init__(self, max_zoom=MAX_HEATMAP_ZOOM, max_tiles=HEATMAP_CACHE_TILES):
+        self.max_zoom = max_zoom
+        self.max_tiles = max_tiles
+        self.lock = threading.Lock()
+        # 平面坐标：NumPy 数组按容量成倍扩展，前 count 个有效
+        if HAS_NUMPY:
+            self.us = np.empty(1024, dtype=np.float64)
+            self.vs = np.empty(1024, dtype=np.float64)
+        else:
+            self.us = array('d')
+            self.vs = array('d')
+        self.count = 0
+        # (z, x, y) -> [{(网格列, 网格行): 数量}, JSON片段（网格变化后为None）, 最大数量]
+        self.tiles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _append(self, us, vs):
+        if not HAS_NUMPY:
+            self.us.extend(us)
+            self.vs.extend(vs)
+            self.count += len(us)
+            return
+        end = self.count + len(us)
+        if end > len(self.us):
+            capacity = max(end, len(self.us) * 2)
+            self.us = np.resize(self.us, capacity)
+            self.vs = np.resize(self.vs, capacity)
+        self.us[self.count:end] = us
+        self.vs[self.count:end] = vs
+        self.count = end
+
+    # 批量加入 (纬度, 经度)，用于启动时加载全部坐标
+    def extend(self, points):
+        iterator = iter(points)
+        while True:
+            batch = [point for _, point in zip(range(LOAD_BATCH_SIZE), iterator)]
+            if not batch:
+                return
+            if HAS_NUMPY:
+                coords = np.array(batch, dtype=np.float64).reshape(-1, 2)
+                us, vs = project_arrays(coords[:, 0], coords[:, 1])
+            else:
+                us, vs = zip(*(project(lat, lng) for lat, lng in batch))
+            with self.lock:
+                self._append(us, vs)
+
+    # 新增一个标记：记录坐标，并给已缓存的各级瓦片中对应的网格加一
+    def insert(self, lat, lng):
+        u, v = project(lat, lng)
+        with self.lock:
+            self._append([u], [v])
+            self._apply(self.count - 1, self.count, self.tiles)
+
+    # 把下标 [start, end) 的点计入 keys 中的瓦片（keys 中的瓦片都已缓存）
+    def _apply(self, start, end, keys):
+        if not keys:
+            return
+        for index in range(start, end):
+            u = float(self.us[index])
+            v = float(self.vs[index])
+            for z in range(self.max_zoom + 1):
+                scale = (1 << z) * GRID_SIZE
+                gx = int(u * scale)
+                gy = int(v * scale)
+                key = (z, gx // GRID_SIZE, gy // GRID_SIZE)
+                if key in keys:
+                    entry = self.tiles[key]
+                    cell = (gx % GRID_SIZE, gy % GRID_SIZE)
+                    entry[0][cell] = entry[0].get(cell, 0) + 1
+                    entry[1] = None
+
+    # 统计瓦片范围内各网格的点数，返回 {(z, x, y): {(网格列, 网格行): 数量}}
+    def _bin(self, z, min_x, min_y, max_x, max_y, us, vs):
+        scale = (1 << z) * GRID_SIZE
+        gx0 = min_x * GRID_SIZE
+        gy0 = min_y * GRID_SIZE
+        width = (max_x - min_x + 1) * GRID_SIZE
+        height = (max_y - min_y + 1) * GRID_SIZE
+        result = {(z, x, y): {} for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)}
+
+        if HAS_NUMPY:
+            gx = (us * scale).astype(np.int64) - gx0
+            gy = (vs * scale).astype(np.int64) - gy0
+            inside = (gx >= 0) & (gx < width) & (gy >= 0) & (gy < height)
+            counts = np.bincount(gy[inside] * width + gx[inside], minlength=width * height)
+            for flat in np.flatnonzero(counts).tolist():
+                row, column = divmod(flat, width)
+                result[(z, min_x + column // GRID_SIZE, min_y + row // GRID_SIZE)][
+                    (column % GRID_SIZE, row % GRID_SIZE)] = int(counts[flat])
+            return result
+
+        for u, v in zip(us, vs):
+            column = int(u * scale) - gx0
+            row = int(v * scale) - gy0
+            if 0 <= column < width and 0 <= row < height:
+                cells = result[(z, min_x + column // GRID_SIZE, min_y + row // GRID_SIZE)]
+                cell = (column % GRID_SIZE, row % GRID_SIZE)
+                cells[cell] = cells.get(cell, 0) + 1
+        return result
+
+    # 瓦片的JSON片段，空瓦片返回None
+    def _fragment(self, key, entry):
+        cells = entry[0]
+        if not cells:
+            return None
+        if entry[1] is None:
+            flat = ','.join(f'{column},{row},{value}' for (column, row), value in cells.items())
+            entry[1] = f'{{"x":{key[1]},"y":{key[2]},"cells":[{flat}]}}'.encode('ascii')
+            entry[2] = max(cells.values())
+        return entry[1]
+
+    # 第 z 级、经纬度范围内的密度网格，返回JSON字节串。覆盖的瓦片数超过 max_tiles 时抛出ValueError
+    def render(self, z, bbox=None, max_tiles=MAX_HEATMAP_TILES):
+        z = max(0, min(int(z), self.max_zoom))
+        min_x, min_y, max_x, max_y = bbox_tiles(z, bbox)
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > max_tiles:
+            raise ValueError(f'范围过大，第 {z} 级最多覆盖 {max_tiles} 张瓦片，请缩小范围或降低缩放级别')
+
+        keys = [(z, x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+        with self.lock:
+            missing = [key for key in keys if key not in self.tiles]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            # 当前数组的快照；分箱期间新增的点在写入缓存前补上
+            count = self.count
+            us = self.us[:count]
+            vs = self.vs[:count]
+
+        binned = {}
+        if missing:
+            # 只对缺失瓦片的外接范围分箱
+            xs = [x for _, x, _ in missing]
+            ys = [y for _, _, y in missing]
+            binned = self._bin(z, min(xs), min(ys), max(xs), max(ys), us, vs)
+
+        fragments = []
+        peak = 0
+        with self.lock:
+            for key in missing:
+                self.tiles[key] = [binned[key], None, 0]
+            self._apply(count, self.count, set(missing))
+            for key in keys:
+                entry = self.tiles[key]
+                self.tiles.move_to_end(key)
+                fragment = self._fragment(key, entry)
+                if fragment is not None:
+                    fragments.append(fragment)
+                    peak = max(peak, entry[2])
+            while len(self.tiles) > self.max_tiles:
+                self.tiles.popitem(last=False)
+
+        header = f'{{"zoom":{z},"gridSize":{GRID_SIZE},"cellPixels":{256 // GRID_SIZE},"max":{peak},"tiles":['
+        return header.encode('ascii') + b','.join(fragments) + b']}'
+
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
@@ -0,0 +1,224 @@
+# 图片上传和缩略图：上传的图片按内容的 SHA-256 保存，相同内容的图片只保存一份，
+# 文件名就是哈希值，内容不会变化，返回的地址可以被浏览器和CDN永久缓存（immutable）。
+#
+# 目录结构：{IMAGE_DIR}/{哈希前两位}/{哈希}.{jpg|png|gif|webp} 为原图，
+# {哈希}-{尺寸名}.jpg 为缩略图（最长边不超过 VARIANTS 中的像素数，透明部分填充白色）。
+# 缩略图在后台进程池中生成，解码和缩放不占用请求线程，也不受GIL限制；生成完成前请求缩略图返回原图，
+# 此时不能长期缓存，响应为 no-cache。未安装 Pillow 时不生成缩略图，始终返回原图。
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from PIL import Image, ImageOps
+    HAS_PIL = True
+except ImportError:
+    Image = None
+    ImageOps = None
+    HAS_PIL = False
+
+IMAGE_DIR = os.environ.get('STAR_MAP_IMAGE_DIR', 'uploads')
+
+# 单张图片的最大字节数
+MAX_IMAGE_BYTES = int(os.environ.get('STAR_MAP_MAX_IMAGE_BYTES', str(10 * 1024 * 1024)))
+
+# 生成缩略图的进程数
+IMAGE_WORKERS = int(os.environ.get('STAR_MAP_IMAGE_WORKERS', '2'))
+
+# 缩略图尺寸名 -> 最长边像素：thumb 用于列表，popup 用于地图弹窗
+VARIANTS = {'thumb': 160, 'popup': 480}
+
+JPEG_QUALITY = 82
+
+# 文件头 -> 扩展名（WebP 的文件头单独判断）
+IMAGE_TYPES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+MIME_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp'}
+
+# 读取上传数据的块大小
+CHUNK_SIZE = 64 * 1024
+
+URL_PREFIX = '/images/'
+
+NAME_PATTERN = re.compile(r'^([0-9a-f]{64})(?:-([a-z]+))?\.(jpg|png|gif|webp)$')
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+# 根据文件头判断图片格式，返回扩展名，不支持的格式返回None
+def detect_type(head):
+    for magic, ext in IMAGE_TYPES:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+# 在工作进程中执行：从原图生成各尺寸的JPEG缩略图，targets 为 [(路径, 最长边)]
+def render_variants(source, targets):
+    with Image.open(source) as image:
+        # JPEG 解码时直接按接近的比例缩小，大图只解码需要的像素
+        image.draft('RGB', (max(size for _, size in targets),) * 2)
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        # 从大到小依次缩放，每次以上一个尺寸为起点
+        for path, size in sorted(targets, key=lambda target: -target[1]):
+            image.thumbnail((size, size), Image.LANCZOS)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            image.save(tmp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            os.replace(tmp_path, path)
+
+
+class ImageStore:
+    def __init__(self, directory=IMAGE_DIR, workers=IMAGE_WORKERS):
+        self.directory = directory
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.pool = None
+        # 正在生成缩略图的哈希，避免重复提交；生成失败（无法解码）的哈希不再重试
+        self.pending = set()
+        self.failed = set()
+
+    def path(self, digest, suffix):
+        return os.path.join(self.directory, digest[:2], f'{digest}{suffix}')
+
+    def variant_paths(self, digest):
+        return [(self.path(digest, f'-{name}.jpg'), size) for name, size in VARIANTS.items()]
+
+    # 图片的相对地址：原图和各尺寸缩略图
+    def urls(self, digest, ext):
+        return (f'{URL_PREFIX}{digest}.{ext}',
+                {name: f'{URL_PREFIX}{digest}-{name}.jpg' for name in VARIANTS})
+
+    # 从文件对象读取并保存图片，返回 (哈希, 扩展名, 是否新保存)。格式不支持时抛出ValueError，超过大小限制时抛出ImageTooLarge
+    def save(self, stream, max_bytes=MAX_IMAGE_BYTES):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f'upload.{os.getpid()}.{threading.get_ident()}.tmp')
+        digest = hashlib.sha256()
+        ext = None
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if ext is None:
+                        ext = detect_type(chunk)
+                        if ext is None:
+                            raise ValueError('只支持 JPEG、PNG、GIF、WebP 格式的图片')
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ImageTooLarge(f'图片不能超过 {max_bytes // (1024 * 1024)}MB')
+                    digest.update(chunk)
+                    f.write(chunk)
+            if ext is None:
+                raise ValueError('图片内容为空')
+
+            digest = digest.hexdigest()
+            path = self.path(digest, f'.{ext}')
+            created = not os.path.exists(path)
+            if created:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.schedule(digest, ext)
+        return digest, ext, created
+
+    # 缩略图不存在时提交到后台进程池生成
+    def schedule(self, digest, ext):
+        if not HAS_PIL or self.workers <= 0:
+            return
+        targets = [(path, size) for path, size in self.variant_paths(digest) if not os.path.exists(path)]
+        if not targets:
+            return
+        with self.lock:
+            if digest in self.pending or digest in self.failed:
+                return
+            if self.pool is None:
+                # 请求线程运行时 fork 可能继承其他线程持有的锁，工作进程用 spawn 方式启动
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            try:
+                future = self.pool.submit(render_variants, self.path(digest, f'.{ext}'), targets)
+            except (BrokenProcessPool, RuntimeError) as e:
+                # 工作进程异常退出后进程池不可用，丢弃后下次重新创建；请求照常返回原图
+                print(f"缩略图进程池不可用: {e}")
+                self.pool = None
+                return
+            self.pending.add(digest)
+        future.add_done_callback(lambda done: self._finish(digest, done))
+
+    def _finish(self, digest, future):
+        if future.cancelled():
+            error = None
+        else:
+            error = future.exception()
+        with self.lock:
+            self.pending.discard(digest)
+            if isinstance(error, BrokenProcessPool):
+                self.pool = None
+            elif error is not None:
+                self.failed.add(digest)
+        if error is not None:
+            print(f"缩略图生成失败 {digest}: {error}")
+
+    # 根据文件名查找图片，返回 (路径, MIME类型, 内容是否不会变化)，不存在时返回None。
+    # 缩略图尚未生成时返回原图，并在需要时重新提交生成（其他工作进程上传的图片、重启前未完成的任务）
+    def resolve(self, name):
+        match = NAME_PATTERN.match(name)
+        if match is None:
+            return None
+        digest, variant, ext = match.groups()
+        if variant is None:
+            path = self.path(digest, f'.{ext}')
+            return (path, MIME_TYPES[ext], True) if os.path.exists(path) else None
+
+        if variant not in VARIANTS or ext != 'jpg':
+            return None
+        path = self.path(digest, f'-{variant}.jpg')
+        if os.path.exists(path):
+            return path, 'image/jpeg', True
+        for ext in MIME_TYPES:
+            original = self.path(digest, f'.{ext}')
+            if os.path.exists(original):
+                self.schedule(digest, ext)
+                return original, MIME_TYPES[ext], False
+        return None
+
+    # 地址指向本服务保存的原图时返回相对于图片目录的路径，用于 contents.image_path
+    def relative_path(self, url):
+        if not isinstance(url, str) or URL_PREFIX not in url:
+            return None
+        match = NAME_PATTERN.match(url.rsplit('/', 1)[-1])
+        if match is None or match.group(2) is not None:
+            return None
+        digest, _, ext = match.groups()
+        path = self.path(digest, f'.{ext}')
+        return os.path.relpath(path, self.directory) if os.path.exists(path) else None
+
+    def shutdown(self):
+        with self.lock:
+            pool = self.pool
+            self.pool = None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -16,7 +16,8 @@ CREATE TABLE IF NOT EXISTS users (
     last_login TIMESTAMP,
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    CONSTRAINT uq_users_nickname UNIQUE (nickname)
 );
 
 -- 位置信息表
@@ -51,7 +52,8 @@ CREATE TABLE IF NOT EXISTS contents (
     is_featured BOOLEAN DEFAULT FALSE,
     status VARCHAR(20) DEFAULT 'published', -- published, pending, rejected
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    hot_score DOUBLE -- 热度分数（见 ranking.py），精选内容按该列排序
 );
 
 -- 添加外键约束
@@ -86,13 +88,23 @@ CREATE TABLE IF NOT EXISTS statistics (
     total_comments INT DEFAULT 0
 );
 
+-- 城市计数表：每个城市的位置数量，新增标记时增量维护覆盖城市数，无需 COUNT(DISTINCT)
+CREATE TABLE IF NOT EXISTS city_stats (
+    city VARCHAR(100) PRIMARY KEY,
+    marker_count INTEGER NOT NULL DEFAULT 0
+);
+
 -- 创建索引以优化查询性能
 CREATE INDEX IF NOT EXISTS idx_locations_user_id ON locations(user_id);
 CREATE INDEX IF NOT EXISTS idx_locations_city ON locations(city);
 CREATE INDEX IF NOT EXISTS idx_contents_user_id ON contents(user_id);
 CREATE INDEX IF NOT EXISTS idx_contents_location_id ON contents(location_id);
-CREATE INDEX IF NOT EXISTS idx_contents_created_at ON contents(created_at);
+CREATE INDEX IF NOT EXISTS idx_contents_created_at ON contents(created_at, id);
 CREATE INDEX IF NOT EXISTS idx_contents_is_featured ON contents(is_featured);
+-- 已有的 contents 表由服务启动时补充 hot_score 列（见 models.ensure_hot_score_column）
+CREATE INDEX IF NOT EXISTS idx_contents_hot_score ON contents(hot_score);
+-- 已有的 users 表补建昵称唯一索引（新建的表已包含）；存在重名用户时需先合并
+CREATE UNIQUE INDEX IF NOT EXISTS uq_users_nickname ON users(nickname);
 
 -- 添加初始统计记录
 INSERT INTO statistics (id, total_markers, total_cities, total_photos, total_comments) 
@@ -127,17 +139,27 @@ INSERT INTO users (username, nickname)
 VALUES ('anonymous', '匿名用户') 
 ON DUPLICATE KEY UPDATE nickname = nickname;
 
--- 初始化统计数据的存储过程
+-- 全量统计的存储过程：用于初始化和定期校准（日常写入由服务端增量更新统计）
 DELIMITER //
 CREATE PROCEDURE IF NOT EXISTS update_statistics()
 BEGIN
+    DELETE FROM city_stats;
+    INSERT INTO city_stats (city, marker_count)
+        SELECT city, COUNT(*) FROM locations WHERE city IS NOT NULL AND city != '' GROUP BY city;
+    
+    -- 校准每条内容的点赞数（服务端批量写入点赞时累加 likes_count）
+    UPDATE contents c
+        LEFT JOIN (SELECT content_id, COUNT(*) AS cnt FROM likes GROUP BY content_id) l ON l.content_id = c.id
+        SET c.likes_count = COALESCE(l.cnt, 0), c.updated_at = c.updated_at
+        WHERE c.likes_count <> COALESCE(l.cnt, 0);
+    
     UPDATE statistics SET 
         total_users = (SELECT COUNT(*) FROM users),
         total_locations = (SELECT COUNT(*) FROM locations),
         total_contents = (SELECT COUNT(*) FROM contents),
         total_photos = (SELECT COUNT(*) FROM contents WHERE image_url IS NOT NULL),
         total_likes = (SELECT COUNT(*) FROM likes),
-        total_cities = (SELECT COUNT(DISTINCT city) FROM locations WHERE city IS NOT NULL AND city != ''),
+        total_cities = (SELECT COUNT(*) FROM city_stats),
         total_markers = (SELECT COUNT(*) FROM contents),
         total_comments = (SELECT COUNT(*) FROM contents)
     WHERE id = 1;
@@ -0,0 +1,99 @@
+# 点赞写缓冲：点赞请求只写入内存，由后台线程按固定间隔或累计到一定数量后批量写入存储。
+# 读取点赞数时加上缓冲区中尚未写入的数量，用户立即看到最新结果。
+# 同一用户对同一内容的重复点赞在缓冲区中去重；匿名点赞（user_id为None）不去重
+import os
+import threading
+from datetime import datetime
+
+from periodic import PeriodicTask
+
+# 批量写入的间隔（秒）
+LIKE_FLUSH_INTERVAL = float(os.environ.get('STAR_MAP_LIKE_FLUSH_INTERVAL', '0.5'))
+
+# 缓冲区累计多少个点赞后立即写入
+LIKE_FLUSH_EVENTS = int(os.environ.get('STAR_MAP_LIKE_FLUSH_EVENTS', '500'))
+
+
+class LikeBuffer:
+    def __init__(self, flush_func, interval=LIKE_FLUSH_INTERVAL, max_events=LIKE_FLUSH_EVENTS):
+        self.flush_func = flush_func
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        # flush 互斥，写入失败放回缓冲区时不会与下一次写入交错
+        self.flush_lock = threading.Lock()
+        self.rows = []
+        self.users = set()
+        # 按内容统计：缓冲区中的点赞数，以及正在写入、尚未提交的点赞数
+        self.pending = {}
+        self.inflight = {}
+        # 缓冲区中的点赞数每次变化加一，用于使包含点赞数的响应缓存失效
+        self.version = 0
+        self.task = PeriodicTask(interval, self.flush, name='like-flush')
+
+    def add(self, content_id, user_id=None):
+        # 返回False表示该用户已经在缓冲区中点过赞
+        with self.lock:
+            if user_id is not None:
+                if (content_id, user_id) in self.users:
+                    return False
+                self.users.add((content_id, user_id))
+            self.rows.append({'content_id': content_id, 'user_id': user_id, 'created_at': datetime.now()})
+            self.pending[content_id] = self.pending.get(content_id, 0) + 1
+            self.version += 1
+            full = len(self.rows) >= self.max_events
+        if full:
+            self.task.trigger()
+        return True
+
+    def has_user(self, content_id, user_id):
+        with self.lock:
+            return (content_id, user_id) in self.users
+
+    def pending_count(self, content_id):
+        # 尚未写入存储的点赞数（包括正在写入的）；缓冲区为空时不加锁，列表接口逐条调用
+        if not self.pending and not self.inflight:
+            return 0
+        with self.lock:
+            return self.pending.get(content_id, 0) + self.inflight.get(content_id, 0)
+
+    def pending_counts(self):
+        # 所有内容尚未写入存储的点赞数
+        if not self.pending and not self.inflight:
+            return {}
+        with self.lock:
+            counts = dict(self.inflight)
+            for content_id, count in self.pending.items():
+                counts[content_id] = counts.get(content_id, 0) + count
+            return counts
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not self.rows:
+                    return
+                rows, self.rows = self.rows, []
+                self.inflight, self.pending = self.pending, {}
+
+            try:
+                self.flush_func(rows)
+            except Exception:
+                # 写入失败时放回缓冲区，下次重试
+                with self.lock:
+                    self.rows = rows + self.rows
+                    for content_id, count in self.inflight.items():
+                        self.pending[content_id] = self.pending.get(content_id, 0) + count
+                    self.inflight = {}
+                raise
+
+            with self.lock:
+                self.inflight = {}
+                self.version += 1
+                for row in rows:
+                    self.users.discard((row['content_id'], row['user_id']))
+
+    def start(self):
+        self.task.start()
+
+    def stop(self):
+        # 退出前写入剩余的点赞
+        self.task.stop(run_final=True)
@@ -0,0 +1,134 @@
+# 内存索引（聚合索引、热力图、精选排序）的构建和增量更新
+#
+# LazyIndex：首次使用时读取全部标记构建，之后逐个应用新标记。构建耗时较长，开始时在新标记分发的锁内
+# 截取快照并开始缓冲，构建期间到达的新标记在构建完成后补上，快照和缓冲之间不重复也不遗漏。
+#
+# MarkerFeed：数据库模式下把所有工作进程新增的标记按 locations.id 的顺序分发给本进程的内存索引。
+# 每个进程每隔 interval 秒（以及本进程写入之后）查询一次 id 大于已处理位置的标记，
+# 其他工作进程写入的标记最多延迟 interval 秒进入本进程的索引。
+# 并发事务的提交顺序与 id 的分配顺序不一定一致，每次查询回看 lookback 个 id 并按 id 去重；
+# 一个事务从分配 id 到提交期间，其他事务分配的 id 不超过 lookback 个时不会遗漏。
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 检查其他进程新增标记的最小间隔（秒）
+SYNC_INTERVAL = float(os.environ.get('STAR_MAP_INDEX_SYNC_INTERVAL', '1.0'))
+
+# 每次查询回看的 id 数
+SYNC_LOOKBACK = int(os.environ.get('STAR_MAP_INDEX_SYNC_LOOKBACK', '1000'))
+
+
+class LazyIndex:
+    def __init__(self, build, insert, update=None):
+        # build(快照) 构建索引，insert(索引, 标记) 应用新标记，update(索引, 标记) 应用已有标记的点赞数、浏览数变化
+        self.build = build
+        self.insert = insert
+        self.update = update
+        self.index = None
+        # 构建期间为列表，缓冲 (是否新标记, 标记)
+        self.buffer = None
+        # 每次 reset 加一，构建期间发生过 reset 时结果不保存
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+
+    # snapshot(start) 在新标记分发的锁内调用 start() 并返回快照
+    def get(self, snapshot):
+        index = self.index
+        if index is not None:
+            return index
+        with self.build_lock:
+            if self.index is not None:
+                return self.index
+            started = {}
+
+            def start():
+                with self.lock:
+                    self.buffer = []
+                    started['generation'] = self.generation
+
+            try:
+                index = self.build(snapshot(start))
+            except Exception:
+                with self.lock:
+                    self.buffer = None
+                raise
+            with self.lock:
+                buffer, self.buffer = self.buffer, None
+                if buffer is None or started.get('generation') != self.generation:
+                    # 构建期间数据整体重新加载过，结果只给本次请求使用
+                    return index
+                for created, marker in buffer:
+                    self._apply(index, created, marker)
+                self.index = index
+            return index
+
+    def _apply(self, index, created, marker):
+        if created:
+            self.insert(index, marker)
+        elif self.update is not None:
+            self.update(index, marker)
+
+    def offer(self, marker, created=True):
+        with self.lock:
+            if self.index is not None:
+                self._apply(self.index, created, marker)
+            elif self.buffer is not None:
+                self.buffer.append((created, marker))
+
+    def reset(self):
+        with self.lock:
+            self.generation += 1
+            self.index = None
+            self.buffer = None
+
+
+class MarkerFeed:
+    def __init__(self, latest, fetch, on_marker, interval=SYNC_INTERVAL, lookback=SYNC_LOOKBACK):
+        # latest() 返回当前最大位置；fetch(after) 返回位置大于 after 的 [(位置, 标记)]；
+        # on_marker(标记) 对每个新标记在锁内调用一次
+        self.latest = latest
+        self.fetch = fetch
+        self.on_marker = on_marker
+        self.interval = interval
+        self.lookback = lookback
+        # 已处理的最大位置，首次同步时初始化
+        self.position = None
+        # 回看范围内已处理的位置 -> 标记，用于去重和构建快照
+        self.recent = OrderedDict()
+        self.lock = threading.RLock()
+        self._last_sync = 0.0
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.interval:
+            return
+        self._last_sync = now
+        with self.lock:
+            if self.position is None:
+                # 启动前已有的标记由各索引构建时读取，只记录回看范围内的位置
+                self.position = self.latest() or 0
+                for position, marker in self.fetch(self.position - self.lookback):
+                    self.recent[position] = marker
+                    self.position = max(self.position, position)
+                return
+            for position, marker in self.fetch(self.position - self.lookback):
+                if position in self.recent or position <= self.position - self.lookback:
+                    continue
+                self.recent[position] = marker
+                self.position = max(self.position, position)
+                self.on_marker(marker)
+            floor = self.position - self.lookback
+            for position in [position for position in self.recent if position <= floor]:
+                del self.recent[position]
+
+    # 在锁内调用 start() 并返回 (位置上限, 回看范围内的标记)：
+    # 索引由位置不超过上限的标记加上这些标记构建，与已分发的标记完全一致
+    def snapshot(self, start):
+        with self.lock:
+            self.sync(force=True)
+            start()
+            floor = self.position - self.lookback
+            return floor, [marker for position, marker in self.recent.items() if position > floor]
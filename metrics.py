@@ -0,0 +1,304 @@
+# 请求级监控：接口延迟直方图、每个请求的SQL语句数和耗时、缓存命中率，以Prometheus文本格式在 /metrics 输出。
+#
+# SQL耗时通过 SQLAlchemy 的 before_cursor_execute / after_cursor_execute 事件统计，记入当前线程正在处理的请求；
+# 不在请求中执行的语句（后台任务、流式响应生成器）记入 endpoint="background"。
+# 指标保存在进程内，gunicorn 多进程部署时每个工作进程分别统计。
+#
+# 慢请求分析（默认关闭）：
+# STAR_MAP_PROFILE_SLOW_MS   超过该耗时（毫秒）的请求保存性能分析结果，0 表示关闭
+# STAR_MAP_PROFILE_SAMPLE    参与分析的请求比例，默认 1.0；分析本身有开销，流量大时调低
+# STAR_MAP_PROFILE_DIR       分析结果保存目录，默认 profiles
+# STAR_MAP_PROFILER          cprofile（默认，输出 .prof，可用 snakeviz 等查看）或 pyinstrument（需另外安装，输出 .html）
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# 接口延迟的分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 每个请求SQL语句数的分桶
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+PROFILE_SLOW_MS = float(os.environ.get('STAR_MAP_PROFILE_SLOW_MS', '0'))
+PROFILE_SAMPLE = float(os.environ.get('STAR_MAP_PROFILE_SAMPLE', '1.0'))
+PROFILE_DIR = os.environ.get('STAR_MAP_PROFILE_DIR', 'profiles')
+PROFILER = os.environ.get('STAR_MAP_PROFILER', 'cprofile').lower()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_labels(self.label_names, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # 标签 -> [各分桶计数（不累计）, 总和, 总数]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}')
+                label_text = _labels(self.label_names, labels)
+                lines.append(f'{self.name}_sum{label_text} {_number(total)}')
+                lines.append(f'{self.name}_count{label_text} {count}')
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.request_latency = Histogram(
+            'star_map_request_duration_seconds', '接口处理耗时（流式响应只计到开始输出）',
+            ('endpoint', 'method'))
+        self.requests = Counter(
+            'star_map_requests_total', '请求数', ('endpoint', 'method', 'status'))
+        self.sql_per_request = Histogram(
+            'star_map_request_sql_statements', '每个请求执行的SQL语句数',
+            ('endpoint',), SQL_COUNT_BUCKETS)
+        self.sql_latency = Histogram(
+            'star_map_request_sql_duration_seconds', '每个请求执行SQL的总耗时', ('endpoint',))
+        self.sql_statements = Counter(
+            'star_map_sql_statements_total', 'SQL语句数', ('endpoint',))
+        self.sql_seconds = Counter(
+            'star_map_sql_duration_seconds_total', 'SQL执行总耗时', ('endpoint',))
+        self.slow_requests = Counter(
+            'star_map_slow_requests_total', '超过分析阈值并保存了分析结果的请求数', ('endpoint',))
+        # 缓存名 -> 带 hits / misses 属性的对象
+        self.caches = {}
+        # (指标名, 说明, 取值函数, 标签名)，取值函数返回数值或 {标签值: 数值}
+        self.gauges = []
+        self.local = threading.local()
+        self.started = time.time()
+
+    # ---------- 注册 ----------
+
+    def register_cache(self, name, cache):
+        self.caches[name] = cache
+
+    def register_gauge(self, name, help_text, func, label_name=None):
+        self.gauges.append((name, help_text, func, label_name))
+
+    def instrument_engine(self, engine):
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            starts = conn.info.get('query_start')
+            if not starts:
+                return
+            self.record_sql(time.perf_counter() - starts.pop())
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(context):
+            # 执行失败的语句不会触发 after_cursor_execute，在这里记录并取出它的开始时间
+            starts = context.connection.info.get('query_start') if context.connection is not None else None
+            if starts:
+                self.record_sql(time.perf_counter() - starts.pop())
+
+    # ---------- 记录 ----------
+
+    def record_sql(self, seconds):
+        current = getattr(self.local, 'request', None)
+        if current is not None:
+            current['sql_count'] += 1
+            current['sql_seconds'] += seconds
+        else:
+            self.sql_statements.inc(('background',))
+            self.sql_seconds.inc(('background',), seconds)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        self.local.request = {'sql_count': 0, 'sql_seconds': 0.0}
+        g.metrics_profiler = None
+        if PROFILE_SLOW_MS > 0 and random.random() < PROFILE_SAMPLE:
+            g.metrics_profiler = start_profiler()
+
+    def _after_request(self, response):
+        start = g.pop('metrics_start', None)
+        current = getattr(self.local, 'request', None)
+        self.local.request = None
+        if start is None or current is None:
+            return response
+
+        elapsed = time.perf_counter() - start
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        method = request.method
+        self.request_latency.observe((endpoint, method), elapsed)
+        self.requests.inc((endpoint, method, str(response.status_code)))
+        self.sql_per_request.observe((endpoint,), current['sql_count'])
+        self.sql_latency.observe((endpoint,), current['sql_seconds'])
+        if current['sql_count']:
+            self.sql_statements.inc((endpoint,), current['sql_count'])
+            self.sql_seconds.inc((endpoint,), current['sql_seconds'])
+
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            stop_profiler(profiler)
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                path = save_profile(profiler, endpoint, method, elapsed)
+                if path:
+                    self.slow_requests.inc((endpoint,))
+                    print(f"慢请求 {method} {request.full_path} 耗时 {elapsed * 1000:.0f}ms，"
+                          f"SQL {current['sql_count']} 条 {current['sql_seconds'] * 1000:.0f}ms，分析结果: {path}")
+        return response
+
+    def _teardown_request(self, exc):
+        # 未处理的异常不会经过 after_request，这里清理线程状态
+        self.local.request = None
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            stop_profiler(profiler)
+
+    # ---------- 输出 ----------
+
+    def render(self):
+        lines = []
+        for metric in (self.request_latency, self.requests, self.sql_per_request, self.sql_latency,
+                       self.sql_statements, self.sql_seconds, self.slow_requests):
+            lines.extend(metric.render())
+
+        cache_lines = {'hits': [], 'misses': [], 'ratio': []}
+        for name, cache in sorted(self.caches.items()):
+            hits, misses = cache.hits, cache.misses
+            label = f'{{cache="{_escape(name)}"}}'
+            cache_lines['hits'].append(f'star_map_cache_hits_total{label} {hits}')
+            cache_lines['misses'].append(f'star_map_cache_misses_total{label} {misses}')
+            ratio = hits / (hits + misses) if hits + misses else 0.0
+            cache_lines['ratio'].append(f'star_map_cache_hit_ratio{label} {_number(ratio)}')
+        for kind, metric_type, help_text in (('hits', 'counter', '缓存命中次数'),
+                                             ('misses', 'counter', '缓存未命中次数'),
+                                             ('ratio', 'gauge', '缓存命中率')):
+            name = 'star_map_cache_hit_ratio' if kind == 'ratio' else f'star_map_cache_{kind}_total'
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}'] + cache_lines[kind]
+
+        for name, help_text, func, label_name in self.gauges:
+            try:
+                value = func()
+            except Exception as e:
+                print(f"指标 {name} 读取失败: {e}")
+                continue
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            if isinstance(value, dict):
+                for label, item in sorted(value.items()):
+                    lines.append(f'{name}{{{label_name}="{_escape(label)}"}} {_number(item)}')
+            else:
+                lines.append(f'{name} {_number(value)}')
+
+        lines += ['# HELP star_map_process_start_time_seconds 进程启动时间',
+                  '# TYPE star_map_process_start_time_seconds gauge',
+                  f'star_map_process_start_time_seconds {_number(self.started)}']
+        return '\n'.join(lines) + '\n'
+
+
+# ---------- 慢请求分析 ----------
+
+def start_profiler():
+    if PROFILER == 'pyinstrument' and pyinstrument is not None:
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        return profiler
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # 同一线程中已有分析器在运行
+        return None
+    return profiler
+
+
+def stop_profiler(profiler):
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        profiler.stop()
+
+
+def save_profile(profiler, endpoint, method, elapsed):
+    name = re.sub(r'[^A-Za-z0-9]+', '_', endpoint).strip('_') or 'root'
+    path = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{method}-{name}-{elapsed * 1000:.0f}ms'
+                                     f'-{os.getpid()}-{threading.get_ident()}')
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if isinstance(profiler, cProfile.Profile):
+            path += '.prof'
+            profiler.dump_stats(path)
+        else:
+            path += '.html'
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+        return path
+    except OSError as e:
+        print(f"性能分析结果保存失败: {e}")
+        return None
@@ -0,0 +1,164 @@
+# 数据迁移工具：文件模式的数据（data.json + data.jsonl）与数据库之间批量导入导出
+#
+# 导入: python migrate_data.py import data.json [--database-url URL] [--chunk-size 2000]
+#   用文件存储读取快照并重放日志 data.jsonl（新增的标记和点赞），按批写入数据库。
+#   也可以导入 export 导出的 JSONL 文件。已存在的内容ID会跳过，中断后可以重新执行。
+#   每批一个事务，全部写入后统一重新计算统计信息。
+# 导出: python migrate_data.py export markers.jsonl [--database-url URL]
+#   按创建时间顺序流式读取数据库，每行一个标记（与 /api/markers 的格式相同）
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from bulk_import import CHUNK_SIZE, DATE_FORMAT, insert_markers, iter_json_markers
+from db_config import create_db_engine
+from file_store import FileStore
+from models import Base, User, Location, Content, Statistics, update_statistics
+
+
+# 读取JSONL文件：每行一个标记，或者文件存储的日志记录
+def iter_jsonl_markers(f):
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if 'op' not in record:
+            yield record
+        elif record['op'] == 'add':
+            yield record['marker']
+
+
+# 按顺序产生待导入的标记。data.json 和日志 data.jsonl 由 FileStore 加载，
+# 日志重放（实名点赞按快照中的点赞记录去重、快照与日志重叠的记录、末尾不完整的记录）与服务器一致
+def iter_source_markers(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if path.endswith('.jsonl') or first not in ('{', '['):
+            yield from iter_jsonl_markers(f)
+            return
+        if first == '[':
+            # 旧版的标记数组文件没有日志，直接流式解析
+            yield from iter_json_markers(f)
+            return
+
+    store = FileStore(path)
+    markers = store.all_markers()
+    print(f"{path}: {len(markers)} 个标记，{sum(marker.get('likes') or 0 for marker in markers)} 个点赞")
+    yield from markers
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_markers(engine, path, chunk_size=CHUNK_SIZE):
+    Base.metadata.create_all(engine)
+    user_cache = {}
+    read = inserted = likes = users = 0
+    started = time.perf_counter()
+    for chunk in chunked(iter_source_markers(path), chunk_size):
+        with engine.begin() as conn:
+            markers, new_users = insert_markers(conn, chunk, user_cache)
+        read += len(chunk)
+        inserted += len(markers)
+        likes += sum(marker['likes'] for marker in markers)
+        users += new_users
+        elapsed = time.perf_counter() - started
+        print(f"已读取 {read} 个标记，写入 {inserted} 个（{inserted / elapsed:.0f} 个/秒）")
+
+    # 全部写入后统一计算统计信息
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    try:
+        if not session.query(Statistics).first():
+            session.add(Statistics(total_markers=0, total_cities=0, total_photos=0,
+                                   total_comments=0, updated_at=datetime.now()))
+            session.flush()
+        update_statistics(session)
+    finally:
+        session.close()
+
+    elapsed = time.perf_counter() - started
+    # 每个标记写入一行位置和一行内容，另有点赞记录和新用户
+    rows = inserted * 2 + likes + users
+    print(f"导入完成: {inserted} 个标记（跳过 {read - inserted} 个），{likes} 个点赞，"
+          f"耗时 {elapsed:.1f} 秒，约 {rows / elapsed:.0f} 行/秒")
+    return inserted
+
+
+def export_markers(engine, path, chunk_size=CHUNK_SIZE):
+    query = select(
+        Content.id, User.nickname, Location.city, Location.latitude, Location.longitude,
+        Content.message, Content.image_url, func.coalesce(Content.likes_count, 0), Content.created_at
+    ).join(User, Content.user_id == User.id) \
+        .join(Location, Content.location_id == Location.id) \
+        .order_by(Content.created_at, Content.id)
+
+    count = 0
+    started = time.perf_counter()
+    tmp_path = path + '.tmp'
+    with engine.connect() as conn, open(tmp_path, 'w', encoding='utf-8') as f:
+        # 服务端游标，按批读取
+        result = conn.execution_options(stream_results=True).execute(query)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            f.writelines(json.dumps({
+                'id': content_id,
+                'nickname': nickname,
+                'location': city,
+                'latitude': float(latitude),
+                'longitude': float(longitude),
+                'message': message,
+                'image': image_url,
+                'likes': likes,
+                'date': created_at.strftime(DATE_FORMAT)
+            }, ensure_ascii=False) + '\n'
+                for content_id, nickname, city, latitude, longitude, message, image_url, likes, created_at in rows)
+            count += len(rows)
+    os.replace(tmp_path, path)
+
+    elapsed = time.perf_counter() - started
+    print(f"导出完成: {count} 个标记，耗时 {elapsed:.1f} 秒，约 {count / max(elapsed, 1e-9):.0f} 个/秒")
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='星图数据导入导出')
+    parser.add_argument('--database-url', help='数据库连接地址，默认读取环境变量配置')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='每批写入/读取的标记数')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('import', help='从 data.json 或 JSONL 文件导入数据库').add_argument('path')
+    commands.add_parser('export', help='把数据库中的标记导出为JSONL文件').add_argument('path')
+    args = parser.parse_args(argv)
+
+    engine = create_db_engine(args.database_url)
+    try:
+        if args.command == 'import':
+            import_markers(engine, args.path, args.chunk_size)
+        else:
+            export_markers(engine, args.path, args.chunk_size)
+    finally:
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
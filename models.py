@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Numeric, func, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Numeric, Float, func, UniqueConstraint, \
+    Index, insert, update, select, bindparam, tuple_, or_, case, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
 
+from ranking import hot_score
+
 # 创建基类
 Base = declarative_base()
 
@@ -11,20 +15,23 @@ Base = declarative_base()
 class User(Base):
     __tablename__ = 'users'
     
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(50), nullable=False, unique=True)
-    nickname = db.Column(db.String(50), nullable=False)
-    avatar_url = db.Column(db.Text)
-    registration_date = db.Column(db.DateTime, default=datetime.utcnow)
-    last_login = db.Column(db.DateTime)
-    is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    id = Column(Integer, primary_key=True)
+    username = Column(String(50), nullable=False, unique=True, default=lambda: 'user_' + uuid.uuid4().hex[:12])
+    nickname = Column(String(50), nullable=False)
+    avatar_url = Column(Text)
+    registration_date = Column(DateTime, default=datetime.utcnow)
+    last_login = Column(DateTime)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # 按昵称查找用户（发布标记时）走索引；唯一约束保证并发创建同一昵称时只有一个成功
+    __table_args__ = (UniqueConstraint('nickname', name='uq_users_nickname'),)
     
     # 关系定义
-    locations = db.relationship('Location', backref='user', lazy=True, cascade='all, delete-orphan')
-    contents = db.relationship('Content', backref='user', lazy=True, cascade='all, delete-orphan')
-    likes = db.relationship('Like', backref='user', lazy=True, cascade='all, delete-orphan')
+    locations = relationship('Location', backref='user', lazy=True, cascade='all, delete-orphan')
+    contents = relationship('Content', backref='user', lazy=True, cascade='all, delete-orphan')
+    likes = relationship('Like', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -41,20 +48,23 @@ class User(Base):
 class Location(Base):
     __tablename__ = 'locations'
     
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    latitude = db.Column(db.Numeric(10, 8), nullable=False)
-    longitude = db.Column(db.Numeric(11, 8), nullable=False)
-    address = db.Column(db.String(255))
-    city = db.Column(db.String(100))
-    province = db.Column(db.String(100))
-    country = db.Column(db.String(100), default='中国')
-    timezone = db.Column(db.String(50))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    latitude = Column(Numeric(10, 8), nullable=False)
+    longitude = Column(Numeric(11, 8), nullable=False)
+    address = Column(String(255))
+    city = Column(String(100))
+    province = Column(String(100))
+    country = Column(String(100), default='中国')
+    timezone = Column(String(50))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # 经纬度联合索引，用于视口范围查询
+    __table_args__ = (Index('idx_latitude_longitude', 'latitude', 'longitude'),)
     
     # 关系定义
-    contents = db.relationship('Content', backref='location', lazy=True, cascade='all, delete-orphan')
+    contents = relationship('Content', backref='location', lazy=True, cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -69,25 +79,37 @@ class Location(Base):
             'created_at': self.created_at.isoformat()
         }
 
+# 插入内容时根据同一行的点赞数、浏览数和发布时间计算热度
+def default_hot_score(context):
+    params = context.get_current_parameters()
+    return hot_score(params.get('likes_count'), params.get('view_count'),
+                     params.get('created_at') or datetime.utcnow(), params.get('is_featured'))
+
 # 内容信息表
 class Content(Base):
     __tablename__ = 'contents'
     
-    id = db.Column(db.Integer, primary_key=True)
-    location_id = db.Column(db.Integer, db.ForeignKey('locations.id', ondelete='CASCADE'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    message = db.Column(db.Text)
-    image_path = db.Column(db.Text)
-    image_url = db.Column(db.Text)
-    likes_count = db.Column(db.Integer, default=0)
-    view_count = db.Column(db.Integer, default=0)
-    is_featured = db.Column(db.Boolean, default=False)
-    status = db.Column(db.String(20), default='published')  # published, pending, rejected
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    id = Column(String(50), primary_key=True, default=lambda: str(uuid.uuid4()))
+    location_id = Column(Integer, ForeignKey('locations.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    message = Column(Text)
+    image_path = Column(Text)
+    image_url = Column(Text)
+    likes_count = Column(Integer, default=0)
+    view_count = Column(Integer, default=0)
+    is_featured = Column(Boolean, default=False)
+    status = Column(String(20), default='published')  # published, pending, rejected
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 热度分数（见 ranking.py），点赞和浏览数变化时更新，精选内容按该列的索引取前几名
+    hot_score = Column(Float(53), default=default_hot_score)
+    
+    # 标记列表按 (created_at, id) 排序和键集分页
+    __table_args__ = (Index('idx_contents_created_at', 'created_at', 'id'),
+                      Index('idx_contents_hot_score', 'hot_score'))
     
     # 关系定义
-    likes = db.relationship('Like', backref='content', lazy=True, cascade='all, delete-orphan')
+    likes = relationship('Like', backref='content', lazy=True, cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -114,26 +136,28 @@ class Content(Base):
 class Like(Base):
     __tablename__ = 'likes'
     
-    id = db.Column(db.Integer, primary_key=True)
-    content_id = db.Column(db.Integer, db.ForeignKey('contents.id', ondelete='CASCADE'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    id = Column(Integer, primary_key=True)
+    content_id = Column(String(50), ForeignKey('contents.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    created_at = Column(DateTime, default=datetime.utcnow)
     
     # 添加联合唯一约束，确保一个用户只能点赞一次
-    __table_args__ = (db.UniqueConstraint('content_id', 'user_id', name='_content_user_uc'),)
+    __table_args__ = (UniqueConstraint('content_id', 'user_id', name='_content_user_uc'),)
 
 # 统计信息表
 class Statistics(Base):
     __tablename__ = 'statistics'
     
-    id = db.Column(db.Integer, primary_key=True)
-    total_users = db.Column(db.Integer, default=0)
-    total_locations = db.Column(db.Integer, default=0)
-    total_contents = db.Column(db.Integer, default=0)
-    total_photos = db.Column(db.Integer, default=0)
-    total_likes = db.Column(db.Integer, default=0)
-    total_cities = db.Column(db.Integer, default=0)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    id = Column(Integer, primary_key=True)
+    total_users = Column(Integer, default=0)
+    total_locations = Column(Integer, default=0)
+    total_contents = Column(Integer, default=0)
+    total_photos = Column(Integer, default=0)
+    total_likes = Column(Integer, default=0)
+    total_cities = Column(Integer, default=0)
+    total_markers = Column(Integer, default=0)
+    total_comments = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def to_dict(self):
         return {
@@ -146,9 +170,53 @@ class Statistics(Base):
             'updated_at': self.updated_at.isoformat()
         }
 
+# 城市计数表：记录每个城市的位置数量，用于增量维护覆盖城市数
+class CityCount(Base):
+    __tablename__ = 'city_stats'
+    
+    city = Column(String(100), primary_key=True)
+    marker_count = Column(Integer, nullable=False, default=0)
+
 # 数据库初始化函数不再需要，已在start-server.py中实现
 
-# 更新统计信息函数
+# 增量更新统计信息：只修改统计表的一行，不扫描数据表。
+# 不提交事务，调用方在写入数据的同一事务中提交，保证计数与数据一致
+def increment_statistics(session, users=0, locations=0, contents=0, photos=0, likes=0, city=None, cities=None):
+    values = {}
+    for column, delta in (('total_users', users), ('total_locations', locations),
+                          ('total_contents', contents), ('total_markers', contents),
+                          ('total_comments', contents), ('total_photos', photos),
+                          ('total_likes', likes)):
+        if delta:
+            values[column] = getattr(Statistics, column) + delta
+    
+    # 城市计数增加，计数从0开始说明是新城市。cities 为 {城市: 新增标记数}，用于批量写入
+    cities = dict(cities or {})
+    if city:
+        cities[city] = cities.get(city, 0) + 1
+    new_cities = 0
+    # 按城市名排序更新，并发写入时加锁顺序一致
+    for city in sorted(name for name in cities if name):
+        count = cities[city]
+        updated = session.query(CityCount).filter(CityCount.city == city) \
+            .update({CityCount.marker_count: CityCount.marker_count + count}, synchronize_session=False)
+        if not updated:
+            try:
+                with session.begin_nested():
+                    session.add(CityCount(city=city, marker_count=count))
+                new_cities += 1
+            except IntegrityError:
+                # 并发请求已插入同一城市
+                session.query(CityCount).filter(CityCount.city == city) \
+                    .update({CityCount.marker_count: CityCount.marker_count + count}, synchronize_session=False)
+    if new_cities:
+        values['total_cities'] = Statistics.total_cities + new_cities
+    
+    if values:
+        values['updated_at'] = datetime.now()
+        session.query(Statistics).update(values, synchronize_session=False)
+
+# 全量重新统计：用于初始化和定期校准，修复增量计数可能产生的偏差
 def update_statistics(session):
     stats = session.query(Statistics).first()
     if stats:
@@ -158,30 +226,148 @@ def update_statistics(session):
         stats.total_contents = session.query(func.count(Content.id)).scalar()
         stats.total_photos = session.query(func.count(Content.id)).filter(Content.image_url.isnot(None)).scalar()
         stats.total_likes = session.query(func.count(Like.id)).scalar()
-        stats.total_cities = session.query(func.count(func.distinct(Location.city))).filter(Location.city.isnot(None) & Location.city != '').scalar()
+        
+        # 校准每条内容的点赞数
+        sync_like_counts(session)
+        
+        # 重建城市计数表
+        city_rows = session.query(Location.city, func.count(Location.id)) \
+            .filter(Location.city.isnot(None), Location.city != '') \
+            .group_by(Location.city).all()
+        session.query(CityCount).delete(synchronize_session=False)
+        session.bulk_insert_mappings(CityCount, [
+            {'city': city, 'marker_count': count} for city, count in city_rows
+        ])
+        stats.total_cities = len(city_rows)
         stats.updated_at = datetime.now()
         
         # 更新总标记数（向后兼容）
         stats.total_markers = stats.total_contents
+        stats.total_comments = stats.total_contents
         
         session.commit()
         return stats
     return None
 
-# 创建示例数据函数已在start-server.py中实现
-        Location(user_id=users[2].id, latitude=23.1291, longitude=113.2644, city='广州', address='广州市天河区')
-    ]
-    db.session.add_all(locations)
-    db.session.commit()
-    
-    # 创建示例内容
-    contents = [
-        Content(location_id=locations[0].id, user_id=users[0].id, message='大家好！北京欢迎你！', likes_count=32),
-        Content(location_id=locations[1].id, user_id=users[1].id, message='魔都打卡！', likes_count=28),
-        Content(location_id=locations[2].id, user_id=users[2].id, message='广州塔下的问候！', likes_count=25)
-    ]
-    db.session.add_all(contents)
-    db.session.commit()
-    
-    # 更新统计信息
-    update_statistics()
\ No newline at end of file
+# 按 likes 表校准每条内容的点赞数，只更新不一致的行并重新计算它们的热度，返回更新的行数。
+# 用于定期校准和启动时修复已有数据库（添加 likes_count 列之前的内容为默认值0）。不提交事务，由调用方提交
+def sync_like_counts(session, batch_size=1000):
+    like_counts = session.query(func.count(Like.id)).filter(Like.content_id == Content.id).scalar_subquery()
+    content_ids = sorted(content_id for content_id, in session.query(Content.id)
+                         .filter(or_(Content.likes_count.is_(None), Content.likes_count != like_counts)))
+    for start in range(0, len(content_ids), batch_size):
+        chunk = content_ids[start:start + batch_size]
+        session.query(Content) \
+            .filter(Content.id.in_(chunk)) \
+            .update({Content.likes_count: like_counts, Content.updated_at: Content.updated_at},
+                    synchronize_session=False)
+        refresh_hot_scores(session, chunk)
+    return len(content_ids)
+
+# 批量插入时忽略违反唯一约束的行（MySQL: INSERT IGNORE，SQLite: INSERT OR IGNORE，PostgreSQL: ON CONFLICT DO NOTHING）
+def insert_ignore(session, model):
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(model).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return insert(model).prefix_with('OR IGNORE')
+    return insert(model).prefix_with('IGNORE')
+
+# 批量写入缓冲的点赞：插入点赞记录，累加每条内容的 likes_count 和总点赞数。
+# rows 为 {'content_id', 'user_id', 'created_at'} 列表，同一用户对同一内容的重复点赞已在缓冲区去重。
+# 每条内容的点赞用一条多行 INSERT IGNORE 写入，按实际插入的行数累加：其他进程并发写入同一用户的点赞时，
+# 后写入的一方被唯一约束忽略（等待先写入的事务提交），不会重复计数。不提交事务，由调用方提交
+def flush_likes(session, rows):
+    # 已经点过赞的用户（数据库中已有记录）不再写入
+    pairs = list({(row['content_id'], row['user_id']) for row in rows if row['user_id'] is not None})
+    if pairs:
+        existing = set(session.query(Like.content_id, Like.user_id)
+                       .filter(tuple_(Like.content_id, Like.user_id).in_(pairs)).all())
+        rows = [row for row in rows if (row['content_id'], row['user_id']) not in existing]
+    if not rows:
+        return 0
+    
+    by_content = {}
+    for row in rows:
+        by_content.setdefault(row['content_id'], []).append(row)
+    # 按内容ID排序写入，多个进程同时写入时加锁顺序一致，避免死锁
+    counts = {}
+    for content_id in sorted(by_content):
+        inserted = session.execute(insert_ignore(session, Like).values(by_content[content_id])).rowcount
+        if inserted:
+            counts[content_id] = inserted
+    if not counts:
+        return 0
+    
+    session.execute(
+        update(Content.__table__)
+        .where(Content.__table__.c.id == bindparam('content_id'))
+        .values(likes_count=func.coalesce(Content.__table__.c.likes_count, 0) + bindparam('delta')),
+        [{'content_id': content_id, 'delta': counts[content_id]} for content_id in sorted(counts)]
+    )
+    refresh_hot_scores(session, sorted(counts))
+    total = sum(counts.values())
+    increment_statistics(session, likes=total)
+    return total
+
+# 一条 UPDATE 语句中最多更新的内容数（CASE 分支和 IN 列表各占一个参数）
+VIEW_UPDATE_CHUNK = 500
+
+# 批量写入缓冲的浏览数：counts 为 {内容ID: 新增浏览数}，每批内容用一条 CASE UPDATE 累加 view_count，
+# 不修改内容的 updated_at。浏览数改变精选排序，统计信息的 updated_at 随之更新，读接口的ETag（数据版本）随之变化。
+# 不提交事务，由调用方提交
+def flush_views(session, counts):
+    table = Content.__table__
+    # 按内容ID排序更新，多个进程同时写入时加锁顺序一致，避免死锁
+    content_ids = sorted(counts)
+    for start in range(0, len(content_ids), VIEW_UPDATE_CHUNK):
+        chunk = content_ids[start:start + VIEW_UPDATE_CHUNK]
+        session.execute(
+            update(table).where(table.c.id.in_(chunk)).values(
+                view_count=func.coalesce(table.c.view_count, 0)
+                + case({content_id: counts[content_id] for content_id in chunk}, value=table.c.id, else_=0),
+                updated_at=table.c.updated_at
+            )
+        )
+        refresh_hot_scores(session, chunk)
+    if content_ids:
+        session.query(Statistics).update({Statistics.updated_at: datetime.now()}, synchronize_session=False)
+    return len(content_ids)
+
+# 重新计算指定内容的热度。在更新点赞数、浏览数的同一事务中调用，行已被锁定，读到的计数是最新的
+def refresh_hot_scores(session, content_ids):
+    table = Content.__table__
+    rows = session.execute(
+        select(table.c.id, table.c.likes_count, table.c.view_count, table.c.is_featured, table.c.created_at)
+        .where(table.c.id.in_(content_ids))
+    ).all()
+    if rows:
+        session.execute(
+            update(table).where(table.c.id == bindparam('content_id')).values(hot_score=bindparam('score')),
+            [{'content_id': row.id, 'score': hot_score(row.likes_count, row.view_count, row.created_at or datetime.utcnow(),
+                                                      row.is_featured)}
+             for row in sorted(rows)]
+        )
+
+# 已有的 contents 表补充 hot_score 列和索引（新建的表已包含）。在调用方的事务中执行
+def ensure_hot_score_column(conn):
+    columns = {column['name'] for column in inspect(conn).get_columns('contents')}
+    if 'hot_score' not in columns:
+        conn.execute(text('ALTER TABLE contents ADD COLUMN hot_score DOUBLE PRECISION'))
+        conn.execute(text('CREATE INDEX idx_contents_hot_score ON contents (hot_score)'))
+        print("✓ contents 表已添加 hot_score 列")
+
+# 为热度为空的内容（添加该列之前的数据）分批计算热度，返回更新的行数
+def backfill_hot_scores(session, batch_size=1000):
+    table = Content.__table__
+    total = 0
+    while True:
+        rows = session.execute(
+            select(table.c.id).where(table.c.hot_score.is_(None)).limit(batch_size)
+        ).scalars().all()
+        if not rows:
+            return total
+        refresh_hot_scores(session, sorted(rows))
+        session.commit()
+        total += len(rows)
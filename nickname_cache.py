@@ -0,0 +1,82 @@
+# 昵称到用户ID的进程内LRU缓存：发布标记时按昵称查找用户，命中缓存时不访问 users 表。
+#
+# 未命中时按唯一索引查询，不存在则在保存点中创建；两个请求同时创建同一昵称时，
+# 后插入的一方违反唯一约束，回滚保存点后重新查询，拿到先创建的用户。
+# 新建的用户在事务提交后才放入缓存，事务回滚不会在缓存中留下不存在的用户ID。
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import User
+
+# 缓存的最大昵称数
+NICKNAME_CACHE_SIZE = int(os.environ.get('STAR_MAP_NICKNAME_CACHE_SIZE', '10000'))
+
+
+class NicknameCache:
+    def __init__(self, max_entries=NICKNAME_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, nickname):
+        with self.lock:
+            user_id = self.entries.get(nickname)
+            if user_id is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(nickname)
+            self.hits += 1
+            return user_id
+
+    def get_many(self, nicknames):
+        # 返回 {昵称: 用户ID}，只包含命中的昵称
+        found = {}
+        for nickname in set(nicknames):
+            user_id = self.get(nickname)
+            if user_id is not None:
+                found[nickname] = user_id
+        return found
+
+    def put(self, nickname, user_id):
+        self.update({nickname: user_id})
+
+    def update(self, mapping):
+        with self.lock:
+            for nickname, user_id in mapping.items():
+                self.entries[nickname] = user_id
+                self.entries.move_to_end(nickname)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def resolve(self, session, nickname):
+        # 返回 (用户ID, 是否新建)。新建的用户由调用方在提交后调用 put 放入缓存
+        user_id = self.get(nickname)
+        if user_id is not None:
+            return user_id, False
+
+        user_id = session.query(User.id).filter(User.nickname == nickname).scalar()
+        if user_id is not None:
+            self.put(nickname, user_id)
+            return user_id, False
+
+        try:
+            with session.begin_nested():
+                user = User(nickname=nickname, created_at=datetime.now())
+                session.add(user)
+            return user.id, True
+        except IntegrityError:
+            # 并发请求已创建同一昵称。加锁读取最新提交的数据，MySQL 可重复读的快照中看不到这一行
+            user_id = session.query(User.id).filter(User.nickname == nickname) \
+                .with_for_update(read=True).scalar()
+            self.put(nickname, user_id)
+            return user_id, False
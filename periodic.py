@@ -0,0 +1,47 @@
+# 后台周期任务：在守护线程中按固定间隔执行函数
+import threading
+
+
+class PeriodicTask:
+    def __init__(self, interval, func, name='periodic-task'):
+        self.interval = interval
+        self.func = func
+        self.name = name
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return self
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+        return self
+
+    # 不等到下一个周期，立即执行一次（例如缓冲区已满）
+    def trigger(self):
+        self.wake_event.set()
+
+    def stop(self, run_final=False):
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 5)
+        # 停止时再执行一次，例如把缓冲区中的数据写入数据库
+        if run_final:
+            self._run_once()
+
+    def _run_once(self):
+        try:
+            self.func()
+        except Exception as e:
+            print(f"后台任务 {self.name} 执行出错: {e}")
+
+    def _run(self):
+        while True:
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+            if self.stop_event.is_set():
+                break
+            self._run_once()
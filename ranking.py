@@ -0,0 +1,119 @@
+# 精选内容排序：按点赞、浏览和发布时间计算热度，每个地区保留热度最高的K个内容
+#
+# 热度在对数空间中计算：ln(1 + 点赞 * LIKE_WEIGHT + 浏览 * VIEW_WEIGHT) + 发布时间 / DECAY_SECONDS，
+# 排序结果与“互动量按半衰期指数衰减”相同，但分数与当前时间无关，只在点赞、浏览时增加，
+# 算好的分数一直有效，不需要定期重算，也可以直接存入数据库并建立索引（contents.hot_score）。
+# 分数只增不减，所以每个地区只需保留前K个：被挤出的内容只有自己的分数增加时才可能回到前K，
+# 届时再与该地区第K名比较即可。
+import heapq
+import math
+import os
+import threading
+from datetime import datetime
+
+LIKE_WEIGHT = float(os.environ.get('STAR_MAP_HOT_LIKE_WEIGHT', '1'))
+VIEW_WEIGHT = float(os.environ.get('STAR_MAP_HOT_VIEW_WEIGHT', '0.1'))
+
+# 热度半衰期（小时）：晚发布这么久的内容需要两倍的互动量才能排在前面
+HALF_LIFE_HOURS = float(os.environ.get('STAR_MAP_HOT_HALF_LIFE_HOURS', '48'))
+DECAY_SECONDS = HALF_LIFE_HOURS * 3600 / math.log(2)
+
+# 编辑精选（is_featured）相当于互动量乘以10
+FEATURED_BOOST = math.log(10)
+
+# 每个地区保留的候选数量，/api/featured 的 limit 不能超过该值
+TOP_K = int(os.environ.get('STAR_MAP_FEATURED_TOP_K', '50'))
+
+# 默认返回的精选数量
+FEATURED_LIMIT = 10
+
+# 时间的起点，减去后分数保持在较小的数值范围内，浮点精度不受影响
+EPOCH = datetime(2024, 1, 1)
+
+
+def hot_score(likes, views, created_at, featured=False):
+    score = math.log(1 + LIKE_WEIGHT * (likes or 0) + VIEW_WEIGHT * (views or 0))
+    score += (created_at - EPOCH).total_seconds() / DECAY_SECONDS
+    if featured:
+        score += FEATURED_BOOST
+    return score
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return EPOCH
+
+
+# 文件模式的标记（前端格式），浏览数单独保存在文件存储中
+def marker_score(marker, views=0):
+    return hot_score(marker.get('likes'), views, parse_date(marker.get('date')), marker.get('featured'))
+
+
+# 单个地区的前K名：最小堆保存 (分数, ID)，堆顶是第K名
+class TopK:
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+        self.scores = {}
+        self._ranked = None
+
+    def offer(self, item_id, score):
+        # 返回排名是否变化
+        current = self.scores.get(item_id)
+        if current is not None:
+            if score <= current:
+                return False
+            # 已在前K名中，K很小，直接更新分数后重新建堆
+            self.scores[item_id] = score
+            self.heap = [(self.scores[member], member) for _, member in self.heap]
+            heapq.heapify(self.heap)
+        elif len(self.heap) < self.k:
+            heapq.heappush(self.heap, (score, item_id))
+            self.scores[item_id] = score
+        elif score > self.heap[0][0]:
+            _, evicted = heapq.heapreplace(self.heap, (score, item_id))
+            del self.scores[evicted]
+            self.scores[item_id] = score
+        else:
+            return False
+        self._ranked = None
+        return True
+
+    def ranked(self, limit=None):
+        # 排序结果在下一次变化前一直复用
+        if self._ranked is None:
+            self._ranked = [item_id for _, item_id in sorted(self.heap, reverse=True)]
+        return self._ranked[:limit]
+
+
+# 全国和各城市的前K名
+class HotRanking:
+    def __init__(self, k=TOP_K):
+        self.k = k
+        # 地区 -> TopK，None 表示全国
+        self.regions = {}
+        self.lock = threading.Lock()
+
+    def update(self, item_id, region, score):
+        with self.lock:
+            for key in (None, region) if region else (None,):
+                top = self.regions.get(key)
+                if top is None:
+                    top = self.regions[key] = TopK(self.k)
+                top.offer(item_id, score)
+
+    # 新增标记或点赞、浏览数变化后调用；只有带图片的标记参与精选
+    def add_marker(self, marker, views=0):
+        if marker.get('image'):
+            self.update(marker['id'], marker.get('location'), marker_score(marker, views))
+
+    def top(self, region=None, limit=FEATURED_LIMIT):
+        with self.lock:
+            top = self.regions.get(region or None)
+            return top.ranked(limit) if top is not None else []
@@ -0,0 +1,45 @@
+# 读接口的响应缓存
+# 缓存预先序列化好的JSON字节，按数据版本号失效：数据版本不变时直接返回同一份字节，
+# 避免每次轮询都重新遍历和序列化全部标记。
+import json
+import threading
+from collections import OrderedDict
+
+# 缓存的最大条目数
+DEFAULT_MAX_ENTRIES = 256
+
+
+# 序列化为紧凑的UTF-8 JSON字节
+def dump_json_bytes(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class ResponseCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, build):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # 在锁外序列化，避免大数据量时阻塞其他读请求
+        body = dump_json_bytes(build())
+        with self.lock:
+            self.entries[key] = (version, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return body
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -1,10 +1,12 @@
 # 简单的Flask服务器示例
 from flask import Flask, jsonify, request
 from flask_cors import CORS
-import json
 import os
 import uuid
 from datetime import datetime
+from spatial_index import parse_bbox, parse_zoom, thin_markers
+from file_store import FileStore
+from read_cache import ResponseCache
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
@@ -12,35 +14,26 @@ CORS(app)  # 允许跨域请求
 # 文件存储配置
 DATA_FILE = 'data.json'
 
-# 确保数据文件存在
-def ensure_data_file():
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump({
-                'markers': [],
-                'stats': {
-                    'totalMarkers': 0,
-                    'totalCities': 0,
-                    'totalPhotos': 0,
-                    'totalComments': 0
-                }
-            }, f, ensure_ascii=False, indent=2)
+# 文件存储（快照 + 追加写日志），首次使用时加载
+_file_store = {'store': None}
 
-# 读取数据
-def load_data():
-    ensure_data_file()
-    with open(DATA_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+def get_store():
+    if _file_store['store'] is None:
+        _file_store['store'] = FileStore(DATA_FILE)
+    return _file_store['store']
 
-# 保存数据
-def save_data(data):
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+# 读接口的响应缓存，按存储版本号失效
+response_cache = ResponseCache()
+
+# 返回预先序列化的JSON响应，数据没有变化时不重新序列化
+def cached_json_response(key, build):
+    body = response_cache.get(key, get_store().current_version(), build)
+    return app.response_class(body, mimetype='application/json')
 
 # 初始化示例数据
 def init_sample_data():
-    data = load_data()
-    if len(data['markers']) > 0:
+    store = get_store()
+    if store.all_markers():
         print("已有数据，跳过示例数据初始化")
         return
     
@@ -81,23 +74,25 @@ def init_sample_data():
         }
     ]
     
-    # 添加示例数据
-    data['markers'] = sample_markers
-    
-    # 更新统计信息
-    data['stats']['totalMarkers'] = len(sample_markers)
-    data['stats']['totalPhotos'] = len([m for m in sample_markers if m['image']])
-    data['stats']['totalCities'] = len(set(m['location'] for m in sample_markers))
-    data['stats']['totalComments'] = len(sample_markers)
-    
-    save_data(data)
+    # 添加示例数据，统计信息由存储层更新
+    for marker in sample_markers:
+        store.add_marker(marker)
     print("示例数据初始化完成")
 
 # API端点
 @app.route('/api/markers', methods=['GET'])
 def get_markers():
-    data = load_data()
-    return jsonify(data['markers'])
+    # 视口范围和缩放级别（可选）
+    try:
+        bbox = parse_bbox(request.args)
+        zoom = parse_zoom(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    store = get_store()
+    if bbox:
+        return jsonify(thin_markers(store.query_bbox(bbox), zoom))
+    return cached_json_response(('markers', zoom), lambda: thin_markers(store.all_markers(), zoom))
 
 @app.route('/api/markers', methods=['POST'])
 def add_marker():
@@ -114,36 +109,25 @@ def add_marker():
         'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
     
-    all_data = load_data()
-    all_data['markers'].append(marker)
-    
-    # 更新统计
-    all_data['stats']['totalMarkers'] += 1
-    all_data['stats']['totalPhotos'] += 1 if marker['image'] else 0
-    
-    # 更新城市统计
-    cities = set(m['location'] for m in all_data['markers'] if m['location'])
-    all_data['stats']['totalCities'] = len(cities)
-    
-    save_data(all_data)
+    # 追加写入日志，统计和索引由存储层增量更新
+    get_store().add_marker(marker)
     return jsonify({'success': True, 'marker': marker})
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
-    data = load_data()
-    return jsonify(data['stats'])
+    return cached_json_response('stats', get_store().get_stats)
 
 @app.route('/api/featured', methods=['GET'])
 def get_featured():
-    data = load_data()
     # 筛选带图片的标记，按创建时间排序，取最新的10个
-    image_markers = [m for m in data['markers'] if m.get('image')]
-    sorted_markers = sorted(
-        image_markers,
-        key=lambda x: x['date'],
-        reverse=True
-    )[:10]
-    return jsonify(sorted_markers)
+    def build_featured():
+        image_markers = [m for m in get_store().all_markers() if m.get('image')]
+        return sorted(
+            image_markers,
+            key=lambda x: x['date'],
+            reverse=True
+        )[:10]
+    return cached_json_response('featured', build_featured)
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -153,9 +137,15 @@ def health_check():
     })
 
 # 主入口
+# 应用工厂：gunicorn "simple_server:create_app()"
+def create_app():
+    init_sample_data()
+    return app
+
 if __name__ == '__main__':
     print("=== 启动简单服务器 ===")
-    ensure_data_file()
-    init_sample_data()
+    create_app()
     print("服务器启动中...")
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    # STAR_MAP_DEBUG=true 时开启调试器和自动重载
+    debug = os.environ.get('STAR_MAP_DEBUG', 'false').lower() == 'true'
+    app.run(host='0.0.0.0', port=8000, debug=debug, threaded=True)
\ No newline at end of file
@@ -0,0 +1,140 @@
+# 空间索引与视口查询工具
+# 文件存储模式下使用网格索引按经纬度范围查找标记，数据库模式使用 locations 表上的
+# idx_latitude_longitude 索引
+import math
+
+# 网格单元大小（度）
+DEFAULT_CELL_SIZE = 1.0
+
+# Web墨卡托投影的纬度范围
+MAX_LATITUDE = 85.05112878
+
+# 按缩放级别抽稀时每个显示单元的像素大小
+THINNING_CELL_PIXELS = 32
+
+
+# 解析请求中的视口参数，未提供时返回None，参数不合法时抛出ValueError
+# 支持 minLat/minLng/maxLat/maxLng 四个参数，或 bbox=minLng,minLat,maxLng,maxLat
+def parse_bbox(args):
+    names = ('minLat', 'minLng', 'maxLat', 'maxLng')
+    values = [args.get(name) for name in names]
+    if args.get('bbox'):
+        parts = args.get('bbox').split(',')
+        if len(parts) != 4:
+            raise ValueError('bbox 参数格式应为 minLng,minLat,maxLng,maxLat')
+        values = [parts[1], parts[0], parts[3], parts[2]]
+    if all(value is None for value in values):
+        return None
+    if any(value is None for value in values):
+        raise ValueError('视口参数不完整，需要 minLat, minLng, maxLat, maxLng')
+
+    min_lat, min_lng, max_lat, max_lng = [float(value) for value in values]
+    # float() 接受 nan、inf，NaN 与任何值比较都为False，会绕过下面的范围检查
+    if not all(math.isfinite(value) for value in (min_lat, min_lng, max_lat, max_lng)):
+        raise ValueError('视口参数必须是有限的数字')
+    if min_lat > max_lat or min_lng > max_lng:
+        raise ValueError('视口参数范围不正确')
+
+    # 限制在合法经纬度范围内
+    return (max(min_lat, -90.0), max(min_lng, -180.0), min(max_lat, 90.0), min(max_lng, 180.0))
+
+
+# 解析缩放级别参数，未提供时返回None
+def parse_zoom(args):
+    zoom = args.get('zoom', args.get('z'))
+    if zoom is None:
+        return None
+    zoom = int(zoom)
+    if zoom < 0 or zoom > 22:
+        raise ValueError('缩放级别超出范围')
+    return zoom
+
+
+# 判断标记是否在视口范围内
+def in_bbox(marker, bbox):
+    min_lat, min_lng, max_lat, max_lng = bbox
+    return (min_lat <= float(marker['latitude']) <= max_lat
+            and min_lng <= float(marker['longitude']) <= max_lng)
+
+
+# 经纬度转换为指定缩放级别下的全局像素坐标（Web墨卡托）
+def lat_lng_to_pixel(lat, lng, zoom, tile_size=256):
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    scale = tile_size * (2 ** zoom)
+    x = (lng + 180.0) / 360.0 * scale
+    sin_lat = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * scale
+    return x, y
+
+
+# 按缩放级别抽稀标记：每个显示单元只保留最新的一个标记，使返回数量受视口像素大小约束
+def thin_markers(markers, zoom, cell_pixels=THINNING_CELL_PIXELS):
+    if zoom is None:
+        return markers
+
+    kept = {}
+    for marker in markers:
+        x, y = lat_lng_to_pixel(float(marker['latitude']), float(marker['longitude']), zoom)
+        cell = (int(x // cell_pixels), int(y // cell_pixels))
+        current = kept.get(cell)
+        if current is None or marker.get('date', '') > current.get('date', ''):
+            kept[cell] = marker
+    return list(kept.values())
+
+
+# 流式抽稀：输入已按时间从新到旧排序时，每个显示单元的第一个标记就是最新的，
+# 可以边读边输出，内存只与显示单元数量有关。分批输入时各批传入同一个 seen 集合
+def iter_thinned_markers(markers, zoom, cell_pixels=THINNING_CELL_PIXELS, seen=None):
+    if zoom is None:
+        yield from markers
+        return
+
+    seen = set() if seen is None else seen
+    for marker in markers:
+        x, y = lat_lng_to_pixel(float(marker['latitude']), float(marker['longitude']), zoom)
+        cell = (int(x // cell_pixels), int(y // cell_pixels))
+        if cell not in seen:
+            seen.add(cell)
+            yield marker
+
+
+# 网格空间索引：把点按固定大小的经纬度网格分桶，范围查询只扫描与视口相交的网格
+class GridIndex:
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.count = 0
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lat / self.cell_size)), int(math.floor(lng / self.cell_size)))
+
+    def insert(self, lat, lng, item):
+        self.cells.setdefault(self._cell(lat, lng), []).append((lat, lng, item))
+        self.count += 1
+
+    def clear(self):
+        self.cells = {}
+        self.count = 0
+
+    def query(self, min_lat, min_lng, max_lat, max_lng):
+        min_row, min_col = self._cell(min_lat, min_lng)
+        max_row, max_col = self._cell(max_lat, max_lng)
+
+        # 视口覆盖的网格比非空网格还多时，直接遍历非空网格
+        span = (max_row - min_row + 1) * (max_col - min_col + 1)
+        if span > len(self.cells):
+            buckets = [points for (row, col), points in self.cells.items()
+                       if min_row <= row <= max_row and min_col <= col <= max_col]
+        else:
+            buckets = [self.cells[(row, col)]
+                       for row in range(min_row, max_row + 1)
+                       for col in range(min_col, max_col + 1)
+                       if (row, col) in self.cells]
+
+        results = []
+        for points in buckets:
+            for lat, lng, item in points:
+                if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                    results.append(item)
+        return results
+
@@ -3,6 +3,21 @@ import { MapContainer, TileLayer, Marker, Popup, useMap } from 'react-leaflet'
 import L from 'leaflet'
 import './App.css'
 
+// 不超过该缩放级别时星星由服务端瓦片图层绘制，不创建DOM标记
+const STAR_TILE_MAX_ZOOM = 11
+const INITIAL_ZOOM = 4
+// 浏览数批量上报的间隔（毫秒）
+const VIEW_REPORT_INTERVAL = 10000
+
+// 弹窗中显示的缩略图：上传到服务器的图片使用生成的 popup 尺寸，picsum 示例图片请求较小的尺寸
+const popupImageUrl = (url) => {
+  const uploaded = url.match(/^(.*\/images\/[0-9a-f]{64})\.\w+$/)
+  if (uploaded) return `${uploaded[1]}-popup.jpg`
+  const picsum = url.match(/^(https:\/\/picsum\.photos\/id\/\d+)\/\d+\/\d+$/)
+  if (picsum) return `${picsum[1]}/480/360`
+  return url
+}
+
 // 星星标记组件
 const StarMarker = ({ position, color, onClick, children }) => {
   return (
@@ -38,14 +53,43 @@ function App() {
     totalComments: 0
   })
   const mapRef = useRef(null)
+  const mapInstanceRef = useRef(null)
+  const loadDataRef = useRef(null)
+  const starTileLayerRef = useRef(null)
+  // 打开过弹窗、尚未上报浏览数的标记ID
+  const pendingViewsRef = useRef(new Set())
+
+  // 根据当前地图视口构建标记请求地址，只加载可见范围内的标记
+  const buildMarkersUrl = () => {
+    const map = mapInstanceRef.current
+    if (!map) return 'http://localhost:8000/api/markers'
+    const bounds = map.getBounds()
+    const params = new URLSearchParams({
+      minLat: bounds.getSouth().toFixed(5),
+      minLng: bounds.getWest().toFixed(5),
+      maxLat: bounds.getNorth().toFixed(5),
+      maxLng: bounds.getEast().toFixed(5),
+      zoom: map.getZoom()
+    })
+    return `http://localhost:8000/api/markers?${params}`
+  }
 
   // 加载数据
   useEffect(() => {
     // 从后端API加载数据
     const loadData = async () => {
       try {
+        // 低缩放级别只显示星星瓦片，不加载标记列表
+        const map = mapInstanceRef.current
+        if ((map ? map.getZoom() : INITIAL_ZOOM) <= STAR_TILE_MAX_ZOOM) {
+          setMarkers([]);
+          const statsResponse = await fetch('http://localhost:8000/api/stats');
+          if (statsResponse.ok) setStats(await statsResponse.json());
+          return;
+        }
+
         // 加载标记数据
-        const markersResponse = await fetch('http://localhost:8000/api/markers');
+        const markersResponse = await fetch(buildMarkersUrl());
         if (markersResponse.ok) {
           const markersData = await markersResponse.json();
           // 确保数据格式正确
@@ -57,8 +101,13 @@ function App() {
           // 同时保存到localStorage作为备份
           localStorage.setItem('markers', JSON.stringify(formattedMarkers));
           
-          // 更新统计信息
-          updateStats(formattedMarkers);
+          // 更新统计信息：视口内的标记只是一部分，总数从统计接口获取
+          const statsResponse = await fetch('http://localhost:8000/api/stats');
+          if (statsResponse.ok) {
+            setStats(await statsResponse.json());
+          } else {
+            updateStats(formattedMarkers);
+          }
         } else {
           console.error('加载标记失败:', markersResponse.status);
           // 如果API失败，从localStorage加载
@@ -104,11 +153,67 @@ function App() {
       setStats(stats);
     };
 
+    loadDataRef.current = loadData;
     loadData();
 
-    // 设置定期更新（每30秒）
-    const interval = setInterval(loadData, 30000);
-    return () => clearInterval(interval);
+    // 实时推送：新标记和点赞通过SSE到达，断线重连后重新加载一次补齐数据
+    const events = new EventSource('http://localhost:8000/api/stream');
+    events.addEventListener('open', () => loadData());
+    events.addEventListener('marker_created', (event) => {
+      const marker = JSON.parse(event.data);
+      const map = mapInstanceRef.current
+      if ((map ? map.getZoom() : INITIAL_ZOOM) <= STAR_TILE_MAX_ZOOM) {
+        // 星星瓦片模式不显示标记列表：服务端已删除该位置的缓存瓦片，重新加载瓦片（未变化的瓦片返回304）
+        if (starTileLayerRef.current) starTileLayerRef.current.redraw();
+      } else if (map && map.getBounds().contains([marker.latitude, marker.longitude])) {
+        // 标记列表只包含当前视口内的标记，视口外的新标记在移动地图后加载
+        setMarkers(prev => prev.some(m => m.id === marker.id) ? prev : [
+          ...prev,
+          { ...marker, position: [marker.latitude, marker.longitude] }
+        ]);
+      }
+      setStats(prev => ({
+        ...prev,
+        totalMarkers: prev.totalMarkers + 1,
+        totalComments: prev.totalComments + 1,
+        totalPhotos: prev.totalPhotos + (marker.image ? 1 : 0)
+      }));
+    });
+    events.addEventListener('marker_liked', (event) => {
+      const { id, likes } = JSON.parse(event.data);
+      setMarkers(prev => prev.map(m => m.id === id ? { ...m, likes } : m));
+    });
+
+    // 推送连接断开时退回定期更新（每30秒）
+    const interval = setInterval(() => {
+      if (events.readyState !== EventSource.OPEN) loadData();
+    }, 30000);
+    return () => {
+      clearInterval(interval);
+      events.close();
+    };
+  }, [])
+
+  // 浏览数定期批量上报，页面关闭时把剩余的一并发送
+  useEffect(() => {
+    const sendViews = () => {
+      const ids = Array.from(pendingViewsRef.current)
+      if (ids.length === 0) return
+      pendingViewsRef.current.clear()
+      fetch('http://localhost:8000/api/markers/views', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ids }),
+        keepalive: true
+      }).catch(error => console.error('上报浏览数失败:', error))
+    }
+    const timer = setInterval(sendViews, VIEW_REPORT_INTERVAL)
+    window.addEventListener('pagehide', sendViews)
+    return () => {
+      clearInterval(timer)
+      window.removeEventListener('pagehide', sendViews)
+      sendViews()
+    }
   }, [])
 
   // 获取用户地理位置
@@ -123,29 +228,16 @@ function App() {
         async (position) => {
           const { latitude, longitude } = position.coords
           
-          // 使用反向地理编码API获取位置名称（使用OpenStreetMap Nominatim）
+          // 由后端的离线地名库反查城市名称（/api/geocode/reverse，不访问外部服务）
           try {
             const response = await fetch(
-              `https://nominatim.openstreetmap.org/reverse?format=json&lat=${latitude}&lon=${longitude}&zoom=10&addressdetails=1`,
-              {
-                headers: {
-                  'User-Agent': 'StarMapApp/1.0'
-                }
-              }
+              `http://localhost:8000/api/geocode/reverse?lat=${latitude}&lng=${longitude}`
             )
             
             if (!response.ok) throw new Error('Geocoding failed')
             
             const data = await response.json()
-            let locationName = '未知位置'
-            
-            // 构建位置名称
-            if (data.address) {
-              const { city, town, village, state, country } = data.address
-              locationName = [city || town || village, state, country]
-                .filter(Boolean)
-                .join(', ')
-            }
+            const locationName = data.city || '未知位置'
             
             setFormData(prev => ({
               ...prev,
@@ -211,15 +303,25 @@ function App() {
       ? [formData.latitude, formData.longitude]
       : [35 + Math.random() * 20, 105 + Math.random() * 30]
     
-    // 对于图片，使用在线图片服务或占位符
+    // 新选择的图片先上传到服务器，按内容哈希保存，缩略图由服务器在后台生成
     let imageUrl = null
     if (formData.image) {
-      // 如果是新上传的文件，使用picsum.photos作为演示
       if (formData.image instanceof File) {
-        // 使用随机图片作为演示
-        const randomId = Math.floor(Math.random() * 1000)
-        imageUrl = `https://picsum.photos/id/${randomId}/800/600`
-        // 在实际应用中，这里应该上传文件到服务器
+        try {
+          const body = new FormData()
+          body.append('image', formData.image)
+          const response = await fetch('http://localhost:8000/api/images', {
+            method: 'POST',
+            body
+          })
+          const result = await response.json()
+          if (!response.ok || !result.success) throw new Error(result.error || '图片上传失败')
+          imageUrl = result.image
+        } catch (error) {
+          console.error('图片上传失败:', error)
+          alert(`图片上传失败: ${error.message}`)
+          return
+        }
       } else {
         imageUrl = formData.image
       }
@@ -361,7 +463,7 @@ function App() {
               <div className="w-full h-[600px] md:h-[700px] lg:h-[800px] map-container-wrapper" ref={mapRef} style={{ zIndex: 1, position: 'relative' }}>
                 <MapContainer 
                   center={[35.8617, 104.1954]} 
-                  zoom={4} 
+                  zoom={INITIAL_ZOOM} 
                   style={{ height: '100%', width: '100%', zIndex: 1 }}
                   attributionControl={true}
                   zoomControl={true}
@@ -371,6 +473,11 @@ function App() {
                     console.log('地图准备就绪');
                     // 使用正确的方式调用invalidateSize
                     const mapInstance = evt.target;
+                    mapInstanceRef.current = mapInstance;
+                    // 视口变化后重新加载可见范围内的标记
+                    mapInstance.on('moveend', () => {
+                      if (loadDataRef.current) loadDataRef.current();
+                    });
                     // 短暂延迟后触发地图重绘
                     setTimeout(() => {
                       mapInstance.invalidateSize();
@@ -403,12 +510,24 @@ function App() {
                     opacity={0}
                     subdomains={['a', 'b', 'c', 'd']}
                   />
+                  {/* 星星图层：低缩放级别由服务端渲染为瓦片 */}
+                  <TileLayer
+                    ref={starTileLayerRef}
+                    url="http://localhost:8000/tiles/{z}/{x}/{y}.png"
+                    maxZoom={STAR_TILE_MAX_ZOOM}
+                    noWrap={true}
+                    tileSize={256}
+                    zIndex={3}
+                  />
                   {markers.map(marker => (
                       <StarMarker 
                         key={marker.id} 
                         position={marker.position} 
                         color="#6366F1"
-                        onClick={() => setSelectedMarker(marker)}
+                        onClick={() => {
+                          setSelectedMarker(marker)
+                          pendingViewsRef.current.add(marker.id)
+                        }}
                       >
                         <Popup>
                           <div className="min-w-[250px]">
@@ -416,7 +535,7 @@ function App() {
                             <p className="text-sm text-gray-500 mb-2">{marker.location}</p>
                             <p className="mb-3">{marker.message}</p>
                             {marker.image && (
-                              <img src={marker.image} alt="分享图片" className="w-full max-h-64 object-contain rounded-md mb-2 mx-auto" />
+                              <img src={popupImageUrl(marker.image)} alt="分享图片" loading="lazy" className="w-full max-h-64 object-contain rounded-md mb-2 mx-auto" />
                             )}
                             <div className="flex justify-between items-center text-xs text-gray-500">
                               <span>{marker.date}</span>
@@ -1,36 +1,64 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_file, stream_with_context
+from werkzeug.wsgi import wrap_file
 from flask_cors import CORS
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import json
 import os
+import threading
+import zlib
+from spatial_index import parse_bbox, parse_zoom, thin_markers, iter_thinned_markers, in_bbox
+from clustering import ClusterIndex
+from tiles import TileCache, parse_tile, render_star_tile
+from file_store import FileStore
+from read_cache import ResponseCache, dump_json_bytes
+from periodic import PeriodicTask
+from event_bus import EventBus
+from like_buffer import LikeBuffer
+from view_buffer import ViewBuffer
+from cursors import encode_cursor, decode_time_cursor, decode_int_cursor, parse_limit
+from metrics import Metrics
+from ranking import HotRanking, TOP_K, FEATURED_LIMIT
+from heatmap import Heatmap
+from marker_feed import LazyIndex, MarkerFeed, SYNC_INTERVAL
+from geocoder import reverse_geocode, locate_marker
+from images import ImageStore, ImageTooLarge, MAX_IMAGE_BYTES
+from static_files import StaticFiles, IMMUTABLE_CACHE_CONTROL
 
 # 添加错误处理，确保即使缺少数据库相关包也能启动
 HAS_DATABASE = False
 try:
-    from sqlalchemy import create_engine, func
-    from sqlalchemy.orm import sessionmaker
-    from models import User, Location, Content, Like, Statistics, Base, update_statistics
+    from sqlalchemy import func, or_, and_
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import sessionmaker, contains_eager
+    from db_config import create_db_engine, pool_status
+    from models import User, Location, Content, Like, Statistics, Base, update_statistics, increment_statistics, \
+        flush_likes, flush_views, ensure_hot_score_column, backfill_hot_scores, sync_like_counts
+    from bulk_import import insert_markers, to_api_marker
+    from nickname_cache import NicknameCache
     HAS_DATABASE = True
     print("✓ 数据库相关包导入成功")
 except ImportError as e:
     print(f"✗ 数据库相关包导入失败: {str(e)}")
     print("将使用文件存储模式作为备选")
 
+# STAR_MAP_STORAGE=file 时不连接数据库，直接使用文件存储（本地开发和压测）
+if os.environ.get('STAR_MAP_STORAGE', '').lower() == 'file':
+    HAS_DATABASE = False
+
 app = Flask(__name__, static_folder='dist')
 CORS(app)  # 允许跨域请求
 
-# 数据库配置
+# 接口延迟、SQL耗时、缓存命中率等指标，见 /metrics
+metrics = Metrics()
+metrics.init_app(app)
+
+# 数据库配置：连接地址、连接池大小等从环境变量读取，见 db_config.py
 if HAS_DATABASE:
-    # MySQL数据库配置 - 注意：用户名应为root，主机名已单独指定
-    DB_USER = 'root'  # 用户名
-    DB_PASSWORD = 'z494TZjcdg?u'  # 密码
-    DB_HOST = 'localhost'
-    DB_NAME = 'star_map'
-    
     try:
         # 创建数据库引擎
-        engine = create_engine(f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}', echo=True)
+        engine = create_db_engine()
+        metrics.instrument_engine(engine)
         # 创建会话工厂
         Session = sessionmaker(bind=engine)
         print("✓ 数据库引擎创建成功")
@@ -41,37 +69,408 @@ if HAS_DATABASE:
 # 文件存储作为备选方案
 DATA_FILE = 'data.json'
 
-# 确保数据文件存在
-def ensure_data_file():
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump({
-                'markers': [],
-                'stats': {
-                    'totalMarkers': 0,
-                    'totalCities': 0,
-                    'totalPhotos': 0,
-                    'totalComments': 0
-                }
-            }, f, ensure_ascii=False, indent=2)
+# 文件存储（快照 + 追加写日志），首次使用时加载
+_file_store = {'store': None}
+_store_lock = threading.Lock()
+
+def get_store():
+    if _file_store['store'] is None:
+        with _store_lock:
+            if _file_store['store'] is None:
+                store = FileStore(DATA_FILE)
+                # 其他进程写入的标记也会通过日志同步到内存索引
+                store.subscribe(on_marker_created, reset_indexes, on_marker_updated)
+                _file_store['store'] = store
+    return _file_store['store']
+
+# 文件模式读接口的响应缓存，按存储版本号失效
+response_cache = ResponseCache()
+
+# 返回预先序列化的JSON响应，数据和缓冲区中的点赞数都没有变化时不重新序列化
+def cached_json_response(key, build):
+    body = response_cache.get(key, (get_store().current_version(), like_buffer.version), build)
+    return app.response_class(body, mimetype='application/json')
+
+# 数据版本：用于读接口的ETag和Last-Modified。
+# 数据库模式取自统计信息行（新增标记和点赞都会在同一事务中更新它），文件模式取日志序号
+def data_version(db):
+    if HAS_DATABASE and db:
+        try:
+            stats = db.query(Statistics).first()
+            if stats:
+                updated_at = stats.updated_at
+                stamp = updated_at.timestamp() if updated_at else 0
+                etag = f'db-{stats.total_contents}-{stats.total_likes}-{stats.total_photos}-{stamp:.6f}'
+                # updated_at 是本地时间，转换为带时区的时间
+                return etag, updated_at.astimezone(timezone.utc) if updated_at else None
+        except Exception as e:
+            print(f"数据版本查询错误: {e}")
+    
+    store = get_store()
+    store.refresh()
+    return f'file-{store.seq}', datetime.fromtimestamp(store.last_modified, timezone.utc)
+
+# 条件请求：客户端缓存的版本仍然有效时返回304，否则生成响应并附带ETag
+def conditional_response(etag, last_modified, build):
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        # Last-Modified 只精确到秒，只在客户端没有发送 If-None-Match 时使用
+        not_modified = (last_modified is not None and request.if_modified_since is not None
+                        and last_modified.replace(microsecond=0) <= request.if_modified_since)
+    
+    if not_modified:
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(build())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # 允许浏览器缓存，但每次使用前都要向服务器确认
+    response.cache_control.no_cache = True
+    return response
+
+# 流式输出时每批从数据库读取的行数
+STREAM_BATCH_SIZE = 1000
+
+# 流式输出标记列表：ndjson 每行一个标记，json 分块输出一个完整的JSON数组。
+# 序列化结果攒到一定大小再写出，避免每个标记一次网络写入
+STREAM_CHUNK_BYTES = 64 * 1024
+
+def streaming_response(markers, fmt, on_close=None):
+    if fmt == 'ndjson':
+        start, separator, end, suffix = b'', b'', b'', b'\n'
+    else:
+        start, separator, end, suffix = b'[', b',', b']', b''
+    
+    def generate():
+        try:
+            chunk = bytearray(start)
+            first = True
+            for marker in markers:
+                if not first:
+                    chunk += separator
+                chunk += dump_json_bytes(marker) + suffix
+                first = False
+                if len(chunk) >= STREAM_CHUNK_BYTES:
+                    yield bytes(chunk)
+                    chunk.clear()
+            chunk += end
+            yield bytes(chunk)
+        finally:
+            if on_close is not None:
+                on_close()
+    
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return app.response_class(stream_with_context(generate()), mimetype=mimetype)
+
+# 增量同步时回看的秒数：并发写入的事务提交顺序与created_at不一定一致，
+# 在游标时间之前多取一段，客户端按id去重
+SINCE_OVERLAP_SECONDS = 5
+
+# 实时事件推送
+event_bus = EventBus()
+
+# SSE连接的心跳间隔（秒），用于保持连接并及时发现已断开的客户端
+STREAM_HEARTBEAT_INTERVAL = 15
+
+# 每个进程允许的SSE连接数上限。线程型的 gunicorn 工作进程中每个连接占用一个线程，
+# gunicorn.conf.py 按线程数设置更小的默认值，见该文件
+MAX_STREAM_CLIENTS = int(os.environ.get('STAR_MAP_MAX_STREAM_CLIENTS', '1000'))
+
+# 截取内存索引构建用的快照：数据库模式为 ('db', 位置上限, 回看范围内的标记)，文件模式为 ('file', 全部标记)。
+# start() 在新标记分发的锁内调用，之后到达的新标记进入索引的构建缓冲，见 marker_feed.py
+def marker_snapshot(start):
+    if HAS_DATABASE:
+        try:
+            return ('db',) + marker_feed.snapshot(start)
+        except Exception as e:
+            print(f"标记快照错误: {e}")
+    
+    # 文件模式：存储层在同一把锁内应用日志并通知新标记
+    store = get_store()
+    store.refresh()
+    with store.lock:
+        start()
+        return 'file', list(store.markers)
+
+# 数据库模式下把新增的标记（包括其他工作进程写入的）分发给本进程的内存索引，
+# force 为 True 时不等待同步间隔（本进程写入之后）
+def sync_markers(force=False):
+    if HAS_DATABASE:
+        try:
+            marker_feed.sync(force)
+        except Exception as e:
+            print(f"新增标记同步错误: {e}")
+    else:
+        get_store().refresh(force)
+
+# 位置ID大于 position 的标记，按位置ID排序，只包含内存索引用到的字段
+def fetch_markers_after(position):
+    db = Session()
+    try:
+        rows = db.query(Location.id, Content.id, Location.latitude, Location.longitude) \
+            .join(Content, Content.location_id == Location.id) \
+            .filter(Location.id > position) \
+            .order_by(Location.id) \
+            .all()
+        return [(location_id, {'id': content_id, 'latitude': float(latitude), 'longitude': float(longitude)})
+                for location_id, content_id, latitude, longitude in rows]
+    finally:
+        db.close()
+
+def latest_marker_position():
+    db = Session()
+    try:
+        return db.query(func.max(Location.id)).scalar()
+    finally:
+        db.close()
+
+# 标记聚合索引，首次使用时构建，之后随新增标记增量更新
+def build_cluster_index(snapshot):
+    index = ClusterIndex()
+    if snapshot[0] == 'db':
+        _, floor, recent = snapshot
+        try:
+            db = next(get_db())
+            rows = db.query(Content.id, Location.latitude, Location.longitude) \
+                .join(Content.location) \
+                .filter(Location.id <= floor) \
+                .yield_per(1000)
+            for content_id, latitude, longitude in rows:
+                index.insert(latitude, longitude, content_id)
+            markers = recent
+        except Exception as e:
+            print(f"聚合索引构建错误: {e}")
+            index = ClusterIndex()
+            markers = get_store().all_markers()
+    else:
+        markers = snapshot[1]
+    
+    for marker in markers:
+        index.insert(marker['latitude'], marker['longitude'], marker['id'])
+    return index
+
+cluster_index = LazyIndex(build_cluster_index,
+                          lambda index, marker: index.insert(marker['latitude'], marker['longitude'], marker['id']))
+
+def get_cluster_index():
+    sync_markers()
+    return cluster_index.get(marker_snapshot)
+
+# 密度热力图的坐标数组和分箱缓存，首次使用时加载全部坐标，之后随新增标记增量更新
+def build_heatmap(snapshot):
+    heatmap = Heatmap()
+    if snapshot[0] == 'db':
+        _, floor, recent = snapshot
+        try:
+            db = next(get_db())
+            # 只读取经纬度两列，不构造ORM对象
+            heatmap.extend(db.query(Location.latitude, Location.longitude)
+                           .join(Content, Content.location_id == Location.id)
+                           .filter(Location.id <= floor)
+                           .yield_per(10000))
+            markers = recent
+        except Exception as e:
+            print(f"热力图数据加载错误: {e}")
+            heatmap = Heatmap()
+            markers = get_store().all_markers()
+    else:
+        markers = snapshot[1]
+    
+    heatmap.extend((marker['latitude'], marker['longitude']) for marker in markers)
+    return heatmap
+
+heatmap_index = LazyIndex(build_heatmap, lambda heatmap, marker: heatmap.insert(marker['latitude'], marker['longitude']))
+
+def get_heatmap():
+    sync_markers()
+    return heatmap_index.get(marker_snapshot)
+
+# 文件模式的精选排序（各地区热度前K名），首次使用时构建，之后随新增标记和点赞增量更新。
+# 数据库模式的热度保存在 contents.hot_score 列，由索引取前几名
+def build_ranking(snapshot):
+    ranking = HotRanking()
+    store = get_store()
+    markers = snapshot[1] if snapshot[0] == 'file' else store.all_markers()
+    for marker in markers:
+        ranking.add_marker(marker, store.view_count(marker['id']))
+    return ranking
+
+ranking_index = LazyIndex(build_ranking,
+                          lambda ranking, marker: ranking.add_marker(marker),
+                          lambda ranking, marker: ranking.add_marker(marker, get_store().view_count(marker['id'])))
+
+def get_ranking():
+    return ranking_index.get(marker_snapshot)
+
+# 星星图层瓦片的磁盘缓存目录
+TILE_CACHE_DIR = os.environ.get('STAR_MAP_TILE_CACHE_DIR', 'tile_cache')
+tile_cache = TileCache(TILE_CACHE_DIR)
+
+# 上传的图片按内容哈希保存，缩略图在后台进程池中生成，见 images.py
+image_store = ImageStore()
+
+# 前端构建结果的内存索引，在主进程启动时建立，工作进程直接继承
+_static_files = {'files': None}
+_static_lock = threading.Lock()
 
-# 读取数据
-def load_data():
-    ensure_data_file()
-    with open(DATA_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+def get_static_files():
+    if _static_files['files'] is None:
+        with _static_lock:
+            if _static_files['files'] is None:
+                _static_files['files'] = StaticFiles(app.static_folder)
+    return _static_files['files']
 
-# 保存数据
-def save_data(data):
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+# 新标记（包括其他进程写入的）应用到内存中的索引，删除该位置的缓存瓦片
+def on_marker_created(marker):
+    cluster_index.offer(marker)
+    heatmap_index.offer(marker)
+    tile_cache.invalidate(marker['latitude'], marker['longitude'])
+    ranking_index.offer(marker)
+
+# 文件存储中标记的点赞数、浏览数变化（包括其他进程写入的）后更新精选排序
+def on_marker_updated(marker):
+    ranking_index.offer(marker, created=False)
+
+# 数据整体重新加载后丢弃内存索引和瓦片缓存，下次使用时重建
+def reset_indexes():
+    cluster_index.reset()
+    heatmap_index.reset()
+    ranking_index.reset()
+    tile_cache.clear()
+
+# 数据库模式的新增标记分发，见 marker_feed.py
+marker_feed = MarkerFeed(latest_marker_position, fetch_markers_after, on_marker_created)
+
+# 统计信息定期校准：全量重新统计，修复增量计数的偏差
+STATS_RECONCILE_INTERVAL = float(os.environ.get('STAR_MAP_STATS_RECONCILE_INTERVAL', '600'))
+
+def reconcile_statistics():
+    db = next(get_db())
+    try:
+        update_statistics(db)
+    except Exception:
+        db.rollback()
+        raise
+
+stats_reconciler = PeriodicTask(STATS_RECONCILE_INTERVAL, reconcile_statistics, name='stats-reconcile')
+
+# 定期同步新增标记：空闲的工作进程也会及时删除其他进程写入标记所在的缓存瓦片
+index_syncer = PeriodicTask(SYNC_INTERVAL, lambda: sync_markers(force=True), name='index-sync')
+
+# 点赞写缓冲：批量写入点赞记录和计数
+def write_likes(rows):
+    if HAS_DATABASE:
+        db = Session()
+        try:
+            flush_likes(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    else:
+        likes = {}
+        users = []
+        for row in rows:
+            if row['user_id'] is None:
+                likes[row['content_id']] = likes.get(row['content_id'], 0) + 1
+            else:
+                users.append((row['content_id'], row['user_id']))
+        get_store().add_likes(likes, users)
+
+like_buffer = LikeBuffer(write_likes)
+
+# 文件记录中只在存储中保存的字段：省份和用户填写的地址，与数据库模式一致不出现在接口响应和事件中
+FILE_ONLY_FIELDS = ('province', 'address')
+
+# 文件记录转换为接口格式，与数据库模式的 content_to_marker 一致：去掉只在存储中保存的字段，
+# 加上缓冲区中尚未写入的点赞数。需要修改的标记返回副本，不修改存储中的标记
+def file_api_marker(marker, pending):
+    if marker['id'] not in pending and not any(field in marker for field in FILE_ONLY_FIELDS):
+        return marker
+    result = {key: value for key, value in marker.items() if key not in FILE_ONLY_FIELDS}
+    if marker['id'] in pending:
+        result['likes'] = result.get('likes', 0) + pending[marker['id']]
+    return result
+
+def file_api_markers(markers):
+    pending = like_buffer.pending_counts()
+    return [file_api_marker(marker, pending) for marker in markers]
+
+# 浏览数写缓冲：内存中按内容累加，定期用一条批量UPDATE写入 contents.view_count
+def write_views(counts):
+    if HAS_DATABASE:
+        db = Session()
+        try:
+            flush_views(db, counts)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    else:
+        get_store().add_views(counts)
+
+view_buffer = ViewBuffer(write_views)
+
+# 昵称到用户ID的进程内缓存，发布标记时不必每次查询 users 表
+nickname_cache = NicknameCache() if HAS_DATABASE else None
+
+# 启动后台任务
+def start_background_tasks():
+    like_buffer.start()
+    view_buffer.start()
+    index_syncer.start()
+    if HAS_DATABASE:
+        stats_reconciler.start()
+
+# 开始平滑退出：结束所有SSE长连接，正在处理的普通请求继续完成
+def begin_shutdown():
+    event_bus.close()
+
+# 停止后台任务，用于平滑退出
+def stop_background_tasks():
+    begin_shutdown()
+    like_buffer.stop()
+    view_buffer.stop()
+    index_syncer.stop()
+    image_store.shutdown()
+    if HAS_DATABASE:
+        stats_reconciler.stop()
+
+# 应用工厂：初始化数据库和示例数据后返回应用。
+# 多进程部署时在主进程中调用（start_tasks=False），后台任务由每个工作进程启动，见 gunicorn.conf.py
+def create_app(start_tasks=True):
+    init_db()
+    init_sample_data()
+    print(f"✓ 前端静态文件索引: {len(get_static_files().files)} 个文件")
+    if start_tasks:
+        start_background_tasks()
+    print(f"数据库模式: {'已启用' if HAS_DATABASE else '未启用，使用文件存储'}")
+    return app
+
+# 主进程创建工作进程之前调用：关闭初始化时打开的数据库连接，避免工作进程继承
+def before_fork():
+    if HAS_DATABASE:
+        engine.dispose()
+
+# 工作进程启动时调用：启动本进程的后台任务
+def on_worker_start():
+    start_background_tasks()
 
 # 初始化数据库
 def init_db():
+    global HAS_DATABASE
     if HAS_DATABASE:
         try:
             # 创建所有表
             Base.metadata.create_all(engine)
+            with engine.begin() as conn:
+                ensure_hot_score_column(conn)
             print("✓ 数据库表创建成功")
             
             # 初始化统计信息
@@ -86,21 +485,36 @@ def init_db():
                         total_cities=0,
                         total_photos=0,
                         total_comments=0,
-                        last_updated=datetime.now()
+                        updated_at=datetime.now()
                     )
                     session.add(stats)
                     session.commit()
                     print("✓ 统计信息初始化成功")
+                
+                # 按 likes 表校准点赞数，已有数据库的 likes_count 可能与点赞记录不一致
+                synced = sync_like_counts(session)
+                session.commit()
+                if synced:
+                    print(f"✓ 已校准 {synced} 条内容的点赞数")
+                
+                # 添加 hot_score 列之前的内容补算热度
+                backfilled = backfill_hot_scores(session)
+                if backfilled:
+                    print(f"✓ 已为 {backfilled} 条内容计算热度")
             except Exception as e:
                 print(f"初始化统计信息时出错: {e}")
                 session.rollback()
             finally:
                 session.close()
         except Exception as e:
+            # 数据库不可用时在启动阶段切换到文件模式，多进程部署时所有工作进程继承同一结果
             print(f"初始化数据库时出错: {e}")
-    else:
+            print("将使用文件存储模式作为备选")
+            HAS_DATABASE = False
+    
+    if not HAS_DATABASE:
         # 初始化文件存储
-        ensure_data_file()
+        get_store()
         print("✓ 文件存储初始化成功")
 
 # 获取数据库会话
@@ -115,59 +529,187 @@ def get_db():
         # 对于文件存储，返回None
         yield None
 
+# 构建标记查询：用户和位置通过JOIN一次性加载，点赞数取自 contents.likes_count（由点赞批量写入时累加），
+# 避免逐行查询点赞数和懒加载关联对象（N+1查询）
+def marker_query(db):
+    return db.query(Content, func.coalesce(Content.likes_count, 0)) \
+        .join(Content.user) \
+        .join(Content.location) \
+        .options(contains_eager(Content.user), contains_eager(Content.location))
+
+# 将数据库记录转换为前端使用的标记格式
+def content_to_marker(content, like_count):
+    return {
+        'id': content.id,
+        'nickname': content.user.nickname,
+        'location': content.location.city,
+        'latitude': float(content.location.latitude),
+        'longitude': float(content.location.longitude),
+        'message': content.message,
+        'image': content.image_url,
+        # 加上缓冲区中尚未写入数据库的点赞
+        'likes': like_count + like_buffer.pending_count(content.id),
+        'date': content.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
 # 获取所有标记
+# 带 since 参数时只返回游标之后新增的标记：{"markers": [...], "cursor": "..."}，
+# 完整列表的响应头 X-Marker-Cursor 中给出后续增量同步使用的游标。
+# 带 limit 参数时按 (created_at, id) 从新到旧分页：{"markers": [...], "nextCursor": "..."}，
+# 下一页把 nextCursor 作为 cursor 参数传回，最后一页 nextCursor 为 null。
+# stream=ndjson 逐行输出标记，stream=json 分块输出JSON数组，服务器不在内存中组装完整列表
 @app.route('/api/markers', methods=['GET'])
 def get_markers():
+    # 视口范围和缩放级别（可选）
+    try:
+        bbox = parse_bbox(request.args)
+        zoom = parse_zoom(request.args)
+        limit = parse_limit(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    since = request.args.get('since')
+    page_cursor = request.args.get('cursor')
+    stream = request.args.get('stream')
+    if stream not in (None, 'ndjson', 'json'):
+        return jsonify({'success': False, 'error': 'stream 参数应为 ndjson 或 json'}), 400
+    
     db = next(get_db())
     
     if HAS_DATABASE and db:
         try:
+            if since is not None:
+                since_time, since_id = decode_time_cursor(since)
+            if page_cursor is not None:
+                page_time, page_id = decode_time_cursor(page_cursor)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        try:
+            etag, last_modified = data_version(db)
+            
             # 过滤选项
             with_images = request.args.get('withImages', 'true').lower() == 'true'
             recent_only = request.args.get('recent', 'false').lower() == 'true'
             
             # 构建查询
-            query = db.query(Content).join(User).join(Location)
+            query = marker_query(db)
             
             if with_images:
                 query = query.filter(Content.image_url.isnot(None))
             
-            if recent_only:
-                query = query.order_by(Content.created_at.desc()).limit(20)
-            else:
-                query = query.order_by(Content.created_at.desc())
+            # 视口过滤，使用 locations 表的 idx_latitude_longitude 索引
+            if bbox:
+                min_lat, min_lng, max_lat, max_lng = bbox
+                query = query.filter(
+                    Location.latitude.between(min_lat, max_lat),
+                    Location.longitude.between(min_lng, max_lng)
+                )
             
-            # 执行查询
-            contents = query.all()
+            if since is not None:
+                def build():
+                    rows = query.filter(Content.created_at >= since_time - timedelta(seconds=SINCE_OVERLAP_SECONDS)) \
+                        .order_by(Content.created_at, Content.id).all()
+                    cursor = since
+                    if rows and (rows[-1][0].created_at, rows[-1][0].id) > (since_time, since_id):
+                        cursor = encode_cursor(rows[-1][0].created_at, rows[-1][0].id)
+                    return jsonify({
+                        'markers': [content_to_marker(content, like_count) for content, like_count in rows],
+                        'cursor': cursor
+                    })
+                return conditional_response(etag, last_modified, build)
             
-            # 转换为JSON格式
-            markers = []
-            for content in contents:
-                # 计算点赞数
-                like_count = db.query(func.count(Like.id)).filter(Like.content_id == content.id).scalar()
+            # 按 (created_at, id) 排序，使用 idx_contents_created_at 索引
+            query = query.order_by(Content.created_at.desc(), Content.id.desc())
+            
+            if limit is not None:
+                # 键集分页：从上一页最后一条之后继续，不使用OFFSET
+                if page_cursor is not None:
+                    query = query.filter(or_(
+                        Content.created_at < page_time,
+                        and_(Content.created_at == page_time, Content.id < page_id)
+                    ))
                 
-                marker = {
-                    'id': content.id,
-                    'nickname': content.user.nickname,
-                    'location': content.location.city,
-                    'latitude': content.location.latitude,
-                    'longitude': content.location.longitude,
-                    'message': content.message,
-                    'image': content.image_url,
-                    'likes': like_count,
-                    'date': content.created_at.strftime('%Y-%m-%d %H:%M:%S')
-                }
-                markers.append(marker)
+                def build():
+                    # 多取一条判断是否还有下一页
+                    rows = query.limit(limit + 1).all()
+                    next_cursor = None
+                    if len(rows) > limit:
+                        rows = rows[:limit]
+                        next_cursor = encode_cursor(rows[-1][0].created_at, rows[-1][0].id)
+                    return jsonify({
+                        'markers': [content_to_marker(content, like_count) for content, like_count in rows],
+                        'nextCursor': next_cursor
+                    })
+                return conditional_response(etag, last_modified, build)
             
-            return jsonify(markers)
+            if recent_only:
+                query = query.limit(20)
+            
+            if stream:
+                # 服务器端游标分批读取，边读边输出，响应结束后关闭会话
+                rows = query.yield_per(STREAM_BATCH_SIZE)
+                markers = (content_to_marker(content, like_count) for content, like_count in rows)
+                return conditional_response(etag, last_modified, lambda: streaming_response(
+                    iter_thinned_markers(markers, zoom), stream, on_close=db.close
+                ))
+            
+            def build():
+                # 执行查询并转换为JSON格式
+                rows = query.all()
+                markers = [content_to_marker(content, like_count) for content, like_count in rows]
+                response = jsonify(thin_markers(markers, zoom))
+                if rows:
+                    response.headers['X-Marker-Cursor'] = encode_cursor(rows[0][0].created_at, rows[0][0].id)
+                else:
+                    response.headers['X-Marker-Cursor'] = encode_cursor(datetime(1970, 1, 1), '')
+                return response
+            return conditional_response(etag, last_modified, build)
         except Exception as e:
             print(f"数据库查询错误: {e}")
             # 失败时回退到文件模式
     
-    # 文件模式
+    # 文件模式：增量同步的游标为日志序号，分页游标为标记在存储中的位置
     try:
-        data = load_data()
-        return jsonify(data['markers'])
+        if since is not None:
+            since_seq = decode_int_cursor(since)
+        if page_cursor is not None:
+            position = decode_int_cursor(page_cursor)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        store = get_store()
+        etag, last_modified = data_version(None)
+        seq = store.seq
+        
+        def build():
+            if since is not None:
+                markers, next_seq = store.markers_since(since_seq)
+                if bbox:
+                    markers = [m for m in markers if in_bbox(m, bbox)]
+                return jsonify({'markers': file_api_markers(markers), 'cursor': encode_cursor(next_seq)})
+            
+            if limit is not None:
+                markers, next_position = store.markers_before(
+                    position if page_cursor is not None else None, limit, bbox)
+                return jsonify({
+                    'markers': file_api_markers(markers),
+                    'nextCursor': encode_cursor(next_position) if next_position is not None else None
+                })
+            
+            if stream:
+                markers = store.query_bbox(bbox) if bbox else store.all_markers()
+                pending = like_buffer.pending_counts()
+                response = streaming_response(
+                    (file_api_marker(marker, pending) for marker in thin_markers(markers, zoom)), stream)
+            elif bbox:
+                response = jsonify(file_api_markers(thin_markers(store.query_bbox(bbox), zoom)))
+            else:
+                response = cached_json_response(('markers', zoom),
+                                                lambda: file_api_markers(thin_markers(store.all_markers(), zoom)))
+            response.headers['X-Marker-Cursor'] = encode_cursor(seq)
+            return response
+        return conditional_response(etag, last_modified, build)
     except Exception as e:
         print(f"文件读取错误: {e}")
         return jsonify([])
@@ -180,22 +722,18 @@ def add_marker():
     
     if HAS_DATABASE and db:
         try:
-            # 创建用户（如果不存在）
+            # 查找或创建用户：先查进程内缓存，未命中时按昵称唯一索引查询
             nickname = marker_data.get('nickname', '匿名用户')
-            user = db.query(User).filter(User.nickname == nickname).first()
-            if not user:
-                user = User(
-                    nickname=nickname,
-                    created_at=datetime.now()
-                )
-                db.add(user)
-                db.flush()  # 获取用户ID
+            user_id, new_user = nickname_cache.resolve(db, nickname)
             
-            # 创建位置
+            # 创建位置：城市和省份由坐标离线反查，填写的位置保存为地址
+            city, province = locate_marker(marker_data)
             location = Location(
                 latitude=marker_data.get('latitude', 35.86166),
                 longitude=marker_data.get('longitude', 104.195397),
-                city=marker_data.get('location', ''),
+                address=marker_data.get('location') or None,
+                city=city,
+                province=province,
                 created_at=datetime.now()
             )
             db.add(location)
@@ -204,32 +742,34 @@ def add_marker():
             # 创建内容
             content = Content(
                 id=str(uuid.uuid4()),
-                user_id=user.id,
+                user_id=user_id,
                 location_id=location.id,
                 message=marker_data.get('message', ''),
                 image_url=marker_data.get('image', None),
+                image_path=image_store.relative_path(marker_data.get('image')),
                 created_at=datetime.now()
             )
             db.add(content)
             
+            # 增量更新统计信息，与标记在同一事务中提交
+            increment_statistics(
+                db,
+                users=1 if new_user else 0,
+                locations=1,
+                contents=1,
+                photos=1 if content.image_url else 0,
+                city=location.city
+            )
+            
             # 提交事务
             db.commit()
-            
-            # 更新统计信息
-            update_statistics(db)
+            if new_user:
+                nickname_cache.put(nickname, user_id)
             
             # 返回创建的标记
-            marker = {
-                'id': content.id,
-                'nickname': user.nickname,
-                'location': location.city,
-                'latitude': location.latitude,
-                'longitude': location.longitude,
-                'message': content.message,
-                'image': content.image_url,
-                'likes': 0,
-                'date': content.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            }
+            marker = content_to_marker(content, 0)
+            sync_markers(force=True)
+            event_bus.publish('marker_created', marker)
             
             return jsonify({'success': True, 'marker': marker})
         except Exception as e:
@@ -237,12 +777,15 @@ def add_marker():
             db.rollback()
             # 失败时回退到文件模式
     
-    # 文件模式
+    # 文件模式：与数据库模式一致，location 为反查的城市，填写的位置保存为 address（只保存在存储中，不在响应中返回）
     try:
+        city, province = locate_marker(marker_data)
         marker = {
             'id': str(uuid.uuid4()),
             'nickname': marker_data.get('nickname', '匿名用户'),
-            'location': marker_data.get('location', ''),
+            'location': city,
+            'province': province,
+            'address': marker_data.get('location') or None,
             'latitude': marker_data.get('latitude', 35.86166),
             'longitude': marker_data.get('longitude', 104.195397),
             'message': marker_data.get('message', ''),
@@ -251,23 +794,232 @@ def add_marker():
             'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
         
-        all_data = load_data()
-        all_data['markers'].append(marker)
-        
-        # 更新统计
-        all_data['stats']['totalMarkers'] += 1
-        all_data['stats']['totalPhotos'] += 1 if marker['image'] else 0
-        
-        # 更新城市统计
-        cities = set(m['location'] for m in all_data['markers'] if m['location'])
-        all_data['stats']['totalCities'] = len(cities)
-        
-        save_data(all_data)
+        # 追加写入日志，统计和索引由存储层增量更新
+        get_store().add_marker(marker)
+        marker = file_api_marker(marker, {})
+        event_bus.publish('marker_created', marker)
         return jsonify({'success': True, 'marker': marker})
     except Exception as e:
         print(f"文件写入错误: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# 批量创建标记的最大数量
+MAX_BATCH_MARKERS = int(os.environ.get('STAR_MAP_MAX_BATCH_MARKERS', '1000'))
+
+# 批量提交时每个标记可以设置的字段
+MARKER_FIELDS = ('nickname', 'location', 'latitude', 'longitude', 'message', 'image')
+
+# 检查提交的标记字段，返回错误信息，合法时返回None
+def validate_marker(marker):
+    if not isinstance(marker, dict):
+        return '标记必须是对象'
+    for key, low, high in (('latitude', -90, 90), ('longitude', -180, 180)):
+        value = marker.get(key)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f'{key} 必须是数字'
+        if not low <= value <= high:
+            return f'{key} 超出范围'
+    for key, max_length in (('nickname', 50), ('location', 100), ('message', None), ('image', None)):
+        value = marker.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            return f'{key} 必须是字符串'
+        if max_length and len(value) > max_length:
+            return f'{key} 不能超过 {max_length} 个字符'
+    return None
+
+# 批量创建标记：请求体为标记数组或 {"markers": [...]}，逐条校验后合法的标记在一个事务中批量写入：
+# 昵称用一次 IN 查询解析，位置、内容各一条批量INSERT，统计信息增量更新一次。
+# 返回与请求顺序一致的逐条结果 {"index", "success", "marker" 或 "error"}
+@app.route('/api/markers/batch', methods=['POST'])
+def add_markers_batch():
+    payload = request.get_json(silent=True)
+    items = payload.get('markers') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': '请求体必须是非空的标记数组'}), 400
+    if len(items) > MAX_BATCH_MARKERS:
+        return jsonify({'success': False, 'error': f'每次最多提交 {MAX_BATCH_MARKERS} 个标记'}), 400
+    
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        error = validate_marker(item)
+        if error:
+            results[index] = {'index': index, 'success': False, 'error': error}
+        else:
+            valid.append((index, {key: item[key] for key in MARKER_FIELDS if item.get(key) is not None}))
+    
+    markers = []
+    if valid:
+        try:
+            markers = write_markers_batch([fields for _, fields in valid])
+        except Exception as e:
+            print(f"批量写入错误: {e}")
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    for (index, _), marker in zip(valid, markers):
+        results[index] = {'index': index, 'success': True, 'marker': marker}
+    return jsonify({'success': True, 'created': len(markers), 'failed': len(items) - len(markers), 'results': results})
+
+def write_markers_batch(items):
+    db = next(get_db())
+    
+    if HAS_DATABASE and db:
+        try:
+            # 与会话共用同一个连接和事务；缓存中已有的昵称不再查询
+            user_ids = nickname_cache.get_many(item.get('nickname', '匿名用户') for item in items)
+            rows, new_users = insert_markers(db.connection(), items, user_ids)
+            cities = {}
+            for row in rows:
+                if row['location']:
+                    cities[row['location']] = cities.get(row['location'], 0) + 1
+            increment_statistics(
+                db,
+                users=new_users,
+                locations=len(rows),
+                contents=len(rows),
+                photos=sum(1 for row in rows if row['image']),
+                cities=cities
+            )
+            db.commit()
+            nickname_cache.update(user_ids)
+            
+            markers = [to_api_marker(row) for row in rows]
+            sync_markers(force=True)
+            for marker in markers:
+                event_bus.publish('marker_created', marker)
+            return markers
+        except OperationalError as e:
+            # 只有数据库连接不可用时回退到文件模式
+            print(f"数据库写入错误: {e}")
+            db.rollback()
+        except Exception:
+            # 约束冲突等其他错误直接返回500，不把同一批数据分别写入数据库和文件
+            db.rollback()
+            raise
+    
+    # 文件模式：所有标记追加为连续的日志记录，只写一次文件
+    date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    markers = []
+    for item in items:
+        city, province = locate_marker(item)
+        markers.append({
+            'id': str(uuid.uuid4()),
+            'nickname': item.get('nickname', '匿名用户'),
+            'location': city,
+            'province': province,
+            'address': item.get('location') or None,
+            'latitude': item.get('latitude', 35.86166),
+            'longitude': item.get('longitude', 104.195397),
+            'message': item.get('message', ''),
+            'image': item.get('image', None),
+            'likes': 0,
+            'date': date
+        })
+    get_store().add_markers(markers)
+    markers = [file_api_marker(marker, {}) for marker in markers]
+    for marker in markers:
+        event_bus.publish('marker_created', marker)
+    return markers
+
+# 瓦片范围内标记的经纬度，用于渲染高缩放级别的瓦片
+def star_points(bbox):
+    db = next(get_db())
+    
+    if HAS_DATABASE and db:
+        try:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            rows = db.query(Location.latitude, Location.longitude) \
+                .join(Content, Content.location_id == Location.id) \
+                .filter(Location.latitude.between(min_lat, max_lat),
+                        Location.longitude.between(min_lng, max_lng)) \
+                .all()
+            return [(float(latitude), float(longitude)) for latitude, longitude in rows]
+        except Exception as e:
+            print(f"瓦片数据查询错误: {e}")
+    
+    # 文件模式
+    return [(float(marker['latitude']), float(marker['longitude'])) for marker in get_store().query_bbox(bbox)]
+
+# 星星图层瓦片（透明PNG），按瓦片内容生成ETag，浏览器缓存的瓦片未变化时返回304
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def get_star_tile(z, x, y):
+    if not parse_tile(z, x, y):
+        return jsonify({'success': False, 'error': '瓦片坐标超出范围'}), 404
+    
+    try:
+        sync_markers()
+        data = tile_cache.get(z, x, y, lambda: render_star_tile(z, x, y, get_cluster_index(), star_points))
+    except Exception as e:
+        print(f"瓦片渲染错误: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return conditional_response(f'tile-{zlib.crc32(data):08x}', None,
+                                lambda: app.response_class(data, mimetype='image/png'))
+
+# 获取视口内的标记聚合结果
+@app.route('/api/clusters', methods=['GET'])
+def get_clusters():
+    try:
+        bbox = parse_bbox(request.args)
+        zoom = parse_zoom(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if zoom is None:
+        return jsonify({'success': False, 'error': '缺少缩放级别参数 z'}), 400
+    
+    try:
+        return jsonify(get_cluster_index().query(zoom, bbox))
+    except Exception as e:
+        print(f"聚合查询错误: {e}")
+        return jsonify([])
+
+# 标记密度热力图：z 为缩放级别，bbox 为范围（省略时为全图），返回各瓦片中非空网格的标记数，格式见 heatmap.py
+@app.route('/api/heatmap', methods=['GET'])
+def get_heatmap_cells():
+    try:
+        bbox = parse_bbox(request.args)
+        zoom = parse_zoom(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if zoom is None:
+        return jsonify({'success': False, 'error': '缺少缩放级别参数 z'}), 400
+    
+    db = next(get_db())
+    try:
+        etag, last_modified = data_version(db)
+        heatmap = get_heatmap()
+        return conditional_response(etag, last_modified, lambda: app.response_class(
+            heatmap.render(zoom, bbox), mimetype='application/json'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"热力图查询错误: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# 离线反向地理编码：lat、lng 为坐标，返回最近的城市和省份，不在地名库覆盖范围内时返回404，见 geocoder.py
+@app.route('/api/geocode/reverse', methods=['GET'])
+def geocode_reverse():
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'error': '参数 lat、lng 必须是数字'}), 400
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({'success': False, 'error': '坐标超出范围'}), 400
+    
+    place = reverse_geocode(lat, lng)
+    if place is None:
+        return jsonify({'success': False, 'error': '该位置不在地名库覆盖范围内'}), 404
+    response = jsonify(place)
+    # 结果只取决于坐标和地名库，浏览器可以长期缓存
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
+
 # 获取统计信息
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
@@ -278,19 +1030,21 @@ def get_stats():
             # 获取统计信息
             stats = db.query(Statistics).first()
             if stats:
-                return jsonify({
+                etag, last_modified = data_version(db)
+                return conditional_response(etag, last_modified, lambda: jsonify({
                     'totalMarkers': stats.total_markers,
                     'totalCities': stats.total_cities,
                     'totalPhotos': stats.total_photos,
                     'totalComments': stats.total_comments
-                })
+                }))
         except Exception as e:
             print(f"统计查询错误: {e}")
     
     # 文件模式
     try:
-        data = load_data()
-        return jsonify(data['stats'])
+        etag, last_modified = data_version(None)
+        return conditional_response(etag, last_modified,
+                                    lambda: cached_json_response('stats', get_store().get_stats))
     except Exception as e:
         print(f"统计读取错误: {e}")
     
@@ -301,107 +1055,275 @@ def get_stats():
         'totalComments': 0
     })
 
-# 获取精选内容
+# 获取精选内容：热度最高的带图片标记，city 参数只返回该城市的，limit 默认10、最多 TOP_K
 @app.route('/api/featured', methods=['GET'])
 def get_featured():
+    city = request.args.get('city') or None
+    try:
+        limit = parse_limit(request.args, maximum=TOP_K) or FEATURED_LIMIT
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     db = next(get_db())
     
     if HAS_DATABASE and db:
         try:
-            # 获取最新的10个带图片的标记
-            query = db.query(Content).join(User).join(Location)
-            query = query.filter(Content.image_url.isnot(None))
-            query = query.order_by(Content.created_at.desc()).limit(10)
+            etag, last_modified = data_version(db)
             
-            contents = query.all()
+            # 按 hot_score 索引从高到低读取，只读取需要的行
+            query = marker_query(db)
+            query = query.filter(Content.image_url.isnot(None))
+            if city:
+                query = query.filter(Location.city == city)
+            query = query.order_by(Content.hot_score.desc()).limit(limit)
             
             # 转换为JSON格式
-            featured = []
-            for content in contents:
-                # 计算点赞数
-                like_count = db.query(func.count(Like.id)).filter(Like.content_id == content.id).scalar()
-                
-                marker = {
-                    'id': content.id,
-                    'nickname': content.user.nickname,
-                    'location': content.location.city,
-                    'latitude': content.location.latitude,
-                    'longitude': content.location.longitude,
-                    'message': content.message,
-                    'image': content.image_url,
-                    'likes': like_count,
-                    'date': content.created_at.strftime('%Y-%m-%d %H:%M:%S')
-                }
-                featured.append(marker)
-            
-            return jsonify(featured)
+            return conditional_response(etag, last_modified, lambda: jsonify(
+                [content_to_marker(content, like_count) for content, like_count in query.all()]
+            ))
         except Exception as e:
             print(f"精选内容查询错误: {e}")
     
-    # 文件模式：返回最新的10个带图片的标记
+    # 文件模式：从内存中的各地区前K名读取，不扫描全部标记
     try:
-        data = load_data()
-        # 筛选带图片的标记，按创建时间排序，取最新的10个
-        image_markers = [m for m in data['markers'] if m.get('image')]
-        sorted_markers = sorted(
-            image_markers,
-            key=lambda x: x['date'],
-            reverse=True
-        )[:10]
-        return jsonify(sorted_markers)
+        def build_featured():
+            store = get_store()
+            markers = (store.get_marker(marker_id) for marker_id in get_ranking().top(city, limit))
+            return file_api_markers(marker for marker in markers if marker is not None)
+        etag, last_modified = data_version(None)
+        return conditional_response(etag, last_modified,
+                                    lambda: cached_json_response(f'featured:{city}:{limit}', build_featured))
     except Exception as e:
         print(f"精选内容读取错误: {e}")
     
     return jsonify([])
 
 # 为标记点赞
+# 点赞先写入缓冲区，由后台线程批量写入，返回的点赞数包含尚未写入的部分。
+# 请求中带 userId 时同一用户对同一标记只能点赞一次
 @app.route('/api/markers/<marker_id>/like', methods=['POST'])
 def like_marker(marker_id):
+    user_id = (request.get_json(silent=True) or {}).get('userId')
+    if user_id is not None and not isinstance(user_id, int):
+        return jsonify({'success': False, 'error': 'userId 应为整数'}), 400
+    
     db = next(get_db())
     
     if HAS_DATABASE and db:
         try:
             # 检查内容是否存在
-            content = db.query(Content).filter(Content.id == marker_id).first()
+            content = db.query(Content.id, Content.likes_count).filter(Content.id == marker_id).first()
             if not content:
                 return jsonify({'success': False, 'error': '标记不存在'}), 404
             
-            # 创建点赞记录
-            like = Like(
-                content_id=content.id,
-                created_at=datetime.now()
-            )
-            db.add(like)
-            db.commit()
+            if user_id is not None:
+                if db.query(User.id).filter(User.id == user_id).first() is None:
+                    return jsonify({'success': False, 'error': '用户不存在'}), 400
+                liked = db.query(Like.id).filter(Like.content_id == marker_id, Like.user_id == user_id).first()
+                if liked is not None:
+                    return jsonify({'success': False, 'error': '已经点过赞了'}), 409
             
-            # 计算最新点赞数
-            like_count = db.query(func.count(Like.id)).filter(Like.content_id == marker_id).scalar()
+            if not like_buffer.add(marker_id, user_id):
+                return jsonify({'success': False, 'error': '已经点过赞了'}), 409
+            
+            like_count = (content.likes_count or 0) + like_buffer.pending_count(marker_id)
+            event_bus.publish('marker_liked', {'id': marker_id, 'likes': like_count})
             
             return jsonify({'success': True, 'likes': like_count})
         except Exception as e:
             print(f"点赞操作错误: {e}")
             db.rollback()
     
-    # 文件模式暂不支持点赞持久化，但仍返回成功以保持前端兼容性
-    return jsonify({'success': True, 'likes': 1})
+    # 文件模式：点赞数写入日志
+    try:
+        store = get_store()
+        marker = store.get_marker(marker_id)
+        if marker is None:
+            return jsonify({'success': False, 'error': '标记不存在'}), 404
+        if user_id is not None and store.has_liked(marker_id, user_id):
+            return jsonify({'success': False, 'error': '已经点过赞了'}), 409
+        if not like_buffer.add(marker_id, user_id):
+            return jsonify({'success': False, 'error': '已经点过赞了'}), 409
+        
+        like_count = marker.get('likes', 0) + like_buffer.pending_count(marker_id)
+        event_bus.publish('marker_liked', {'id': marker_id, 'likes': like_count})
+        
+        return jsonify({'success': True, 'likes': like_count})
+    except Exception as e:
+        print(f"点赞操作错误: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# 记录浏览：只在内存中累加，由后台线程批量写入，不存在的ID在写入时忽略。
+# 去重模式（STAR_MAP_UNIQUE_VIEWS=true）下浏览者取请求中的 viewerId，没有时用客户端地址和User-Agent
+MAX_VIEW_ID_LENGTH = 50
+
+def request_viewer():
+    viewer = (request.get_json(silent=True) or {}).get('viewerId')
+    if viewer is None:
+        viewer = f"{request.remote_addr}|{request.headers.get('User-Agent', '')}"
+    return viewer
 
-# 静态文件服务
+@app.route('/api/markers/<marker_id>/view', methods=['POST'])
+def view_marker(marker_id):
+    if len(marker_id) > MAX_VIEW_ID_LENGTH:
+        return jsonify({'success': False, 'error': '标记不存在'}), 404
+    recorded = view_buffer.add(marker_id, request_viewer())
+    return jsonify({'success': True, 'recorded': recorded})
+
+# 批量记录浏览：{"ids": [...]}，前端把一段时间内打开过的标记一次发送
+MAX_BATCH_VIEWS = int(os.environ.get('STAR_MAP_MAX_BATCH_VIEWS', '500'))
+
+@app.route('/api/markers/views', methods=['POST'])
+def view_markers_batch():
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if not isinstance(ids, list) or not all(isinstance(marker_id, str) for marker_id in ids):
+        return jsonify({'success': False, 'error': 'ids 应为标记ID列表'}), 400
+    if len(ids) > MAX_BATCH_VIEWS:
+        return jsonify({'success': False, 'error': f'一次最多记录 {MAX_BATCH_VIEWS} 个浏览'}), 400
+    viewer = request_viewer()
+    recorded = sum(1 for marker_id in ids
+                   if len(marker_id) <= MAX_VIEW_ID_LENGTH and view_buffer.add(marker_id, viewer))
+    return jsonify({'success': True, 'recorded': recorded})
+
+# 实时事件推送（Server-Sent Events）：marker_created 和 marker_liked
+@app.route('/api/stream', methods=['GET'])
+def event_stream():
+    # 在返回响应之前占用名额，响应关闭时释放（客户端在输出开始前断开时生成器不会运行）
+    if not event_bus.open_subscription(MAX_STREAM_CLIENTS):
+        return jsonify({'success': False, 'error': '连接数过多，请稍后重试'}), 503
+    
+    # 断线重连时补发 Last-Event-ID 之后的事件，新连接只接收之后的事件
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    last_id = int(last_event_id) if last_event_id.isdigit() else event_bus.last_id
+    
+    def generate():
+        seen = last_id
+        yield b'retry: 3000\n\n'
+        while not event_bus.closed:
+            payloads, seen_now = event_bus.events_after(seen)
+            if payloads:
+                yield b''.join(payloads)
+            seen = seen_now
+            if not event_bus.wait(seen, STREAM_HEARTBEAT_INTERVAL):
+                yield b': ping\n\n'
+    
+    response = app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
+    response.call_on_close(event_bus.close_subscription)
+    response.headers['Cache-Control'] = 'no-cache'
+    # 禁止反向代理缓冲事件流
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# 上传图片：multipart 表单的 image 字段，或请求体直接为图片数据。按内容哈希保存，相同的图片只保存一份，
+# 缩略图在后台生成。返回原图地址和各尺寸缩略图地址，发布标记时把原图地址作为 image 提交
+@app.route('/api/images', methods=['POST'])
+def upload_image():
+    if request.content_length is not None and request.content_length > MAX_IMAGE_BYTES + 64 * 1024:
+        return jsonify({'success': False, 'error': f'图片不能超过 {MAX_IMAGE_BYTES // (1024 * 1024)}MB'}), 413
+    
+    upload = request.files.get('image')
+    try:
+        digest, ext, created = image_store.save(upload.stream if upload is not None else request.stream)
+    except ImageTooLarge as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except OSError as e:
+        print(f"图片保存错误: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    base = request.host_url.rstrip('/')
+    image, thumbnails = image_store.urls(digest, ext)
+    return jsonify({
+        'success': True,
+        'id': digest,
+        'created': created,
+        'image': base + image,
+        'thumbnails': {name: base + url for name, url in thumbnails.items()}
+    }), 201 if created else 200
+
+# 上传的图片和缩略图：文件名为内容哈希，长期缓存；缩略图尚未生成时临时返回原图，不缓存
+@app.route('/images/<name>', methods=['GET'])
+def get_image(name):
+    found = image_store.resolve(name)
+    if found is None:
+        return jsonify({'success': False, 'error': '图片不存在'}), 404
+    
+    path, mimetype, immutable = found
+    response = send_file(os.path.abspath(path), mimetype=mimetype, conditional=True, etag=name if immutable else True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable' if immutable else 'no-cache'
+    return response
+
+# 静态文件服务：从启动时建立的索引查找，支持预压缩版本和304，见 static_files.py。
+# 其他路径返回单页应用的入口页面（内存中），由前端路由处理；assets/ 下不存在的文件返回404
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_static(path):
-    if path != '' and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
+    static_files = get_static_files()
+    entry = static_files.lookup(path) if path else None
+    if entry is None:
+        if path.startswith('assets/') or static_files.shell is None:
+            return jsonify({'success': False, 'error': '文件不存在'}), 404
+        entry = static_files.shell_info
+        encoding = static_files.choose_encoding(static_files.shell, request.accept_encodings)
+        data, etag = static_files.shell[encoding]
+        build = lambda: app.response_class(data, mimetype=entry['mimetype'])
     else:
-        return send_from_directory(app.static_folder, 'index.html')
+        encoding = static_files.choose_encoding(entry['variants'], request.accept_encodings)
+        file_path, size, etag = entry['variants'][encoding]
+        
+        def build():
+            # 通过 wsgi.file_wrapper 发送，服务器支持时用 sendfile 零拷贝
+            response = app.response_class(wrap_file(request.environ, open(file_path, 'rb')),
+                                          mimetype=entry['mimetype'], direct_passthrough=True)
+            response.content_length = size
+            return response
+    
+    try:
+        response = conditional_response(etag, entry['last_modified'], build)
+    except FileNotFoundError:
+        # 构建目录被替换，重新建立索引
+        static_files.scan()
+        return jsonify({'success': False, 'error': '文件不存在'}), 404
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if len(entry['variants']) > 1 or entry is static_files.shell_info:
+        response.vary.add('Accept-Encoding')
+    if entry['immutable']:
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+# 缓存和后台状态指标
+metrics.register_cache('response', response_cache)
+metrics.register_cache('tile', tile_cache)
+if nickname_cache is not None:
+    metrics.register_cache('nickname', nickname_cache)
+metrics.register_gauge('star_map_like_buffer_pending', '尚未写入存储的点赞数', lambda: len(like_buffer.rows))
+metrics.register_gauge('star_map_view_buffer_pending', '有尚未写入的浏览数的内容数', lambda: len(view_buffer.pending))
+metrics.register_gauge('star_map_views_sampled_out', '采样时未记录的浏览次数', lambda: view_buffer.sampled_out)
+metrics.register_gauge('star_map_stream_clients', 'SSE连接数', lambda: event_bus.subscribers)
+if HAS_DATABASE:
+    metrics.register_gauge('star_map_db_pool', '数据库连接池状态', lambda: {
+        key: value for key, value in pool_status(engine).items() if isinstance(value, (int, float))
+    }, label_name='field')
+
+# Prometheus 文本格式的监控指标
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 # 健康检查端点
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({
+    health = {
         'status': 'ok',
         'database_enabled': HAS_DATABASE,
         'timestamp': datetime.now().isoformat()
-    })
+    }
+    if HAS_DATABASE:
+        # 连接池状态：占用数、溢出数、排队等待和超时次数
+        health['database_pool'] = pool_status(engine)
+    return jsonify(health)
 
 # 初始化示例数据
 def init_sample_data():
@@ -512,8 +1434,8 @@ def init_sample_data():
     else:
         # 文件模式初始化示例数据
         try:
-            data = load_data()
-            if len(data['markers']) > 0:
+            store = get_store()
+            if store.all_markers():
                 print("文件已有数据，跳过示例数据初始化")
                 return
             
@@ -576,16 +1498,9 @@ def init_sample_data():
                 }
             ]
             
-            # 添加示例数据
-            data['markers'] = sample_markers
-            
-            # 更新统计信息
-            data['stats']['totalMarkers'] = len(sample_markers)
-            data['stats']['totalPhotos'] = len([m for m in sample_markers if m['image']])
-            data['stats']['totalCities'] = len(set(m['location'] for m in sample_markers))
-            data['stats']['totalComments'] = len(sample_markers)
-            
-            save_data(data)
+            # 添加示例数据，统计信息由存储层更新
+            for marker in sample_markers:
+                store.add_marker(marker)
             print("文件示例数据初始化完成")
         except Exception as e:
             print(f"初始化文件示例数据时出错: {e}")
@@ -593,16 +1508,13 @@ def init_sample_data():
 if __name__ == '__main__':
     print("=== 启动 Star Map 服务器 ===")
     
-    # 初始化数据库
-    print("正在初始化数据库...")
-    init_db()
-    
-    # 初始化示例数据
-    print("正在初始化示例数据...")
-    init_sample_data()
+    # 初始化数据库、示例数据和后台任务
+    create_app()
     
     print("服务器配置完成，正在启动...")
-    print(f"数据库模式: {'已启用' if HAS_DATABASE else '未启用，使用文件存储'}")
+    print("开发服务器仅用于本地调试，生产环境请使用: gunicorn -c gunicorn.conf.py wsgi:app")
     
-    # 启动服务器
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    # 启动开发服务器，STAR_MAP_DEBUG=true 时开启调试器和自动重载
+    debug = os.environ.get('STAR_MAP_DEBUG', 'false').lower() == 'true'
+    port = int(os.environ.get('STAR_MAP_PORT', '8000'))
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
\ No newline at end of file
@@ -0,0 +1,165 @@
+# 前端静态文件：启动时扫描 Vite 构建目录（dist/）建立内存索引，请求时只查字典，不检查文件是否存在。
+#
+# - 预压缩：同名的 .br / .gz 文件作为压缩版本，客户端的 Accept-Encoding 支持时优先返回 br，其次 gzip。
+#   运行 python static_files.py dist 为构建结果生成压缩文件（br 需要安装 brotli）
+# - 缓存：assets/ 下带内容哈希的文件名（如 index-4f9a1c2b.js）内容不会变化，返回 immutable 长期缓存；
+#   其他文件（index.html、favicon 等）每次使用前向服务器确认，ETag 为内容哈希，未变化时返回304
+# - 文件内容通过 wsgi.file_wrapper 发送，gunicorn 等服务器用 sendfile 直接从文件写入连接，不经过Python复制
+# - 单页应用的入口 index.html 及其压缩版本读入内存，前端路由的请求不访问文件系统
+#
+# 重新构建前端后需要重启服务器（或调用 scan()）才会使用新的文件。
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+from datetime import datetime, timezone
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    brotli = None
+    HAS_BROTLI = False
+
+SHELL = 'index.html'
+
+# 压缩版本的扩展名，按优先级排列
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Vite 输出的带哈希文件名：名称-8位以上哈希.扩展名
+HASHED_NAME = re.compile(r'^assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+
+# 值得压缩的类型，图片、字体等已压缩的格式不处理
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml',
+                      'image/svg+xml', 'application/wasm', 'application/manifest+json')
+
+# 小于该字节数的文件不压缩
+MIN_COMPRESS_BYTES = 1024
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def guess_type(name):
+    mimetype, _ = mimetypes.guess_type(name)
+    if mimetype is None:
+        return 'application/octet-stream'
+    if mimetype.startswith('text/') or mimetype == 'application/javascript':
+        mimetype += '; charset=utf-8'
+    return mimetype
+
+
+def is_compressible(name):
+    return guess_type(name).startswith(COMPRESSIBLE_TYPES)
+
+
+def content_etag(data):
+    return hashlib.sha256(data).hexdigest()[:20]
+
+
+class StaticFiles:
+    def __init__(self, root):
+        self.root = root
+        # 相对路径 -> {'mimetype', 'immutable', 'last_modified', 'variants': {编码: (文件路径, 字节数, ETag)}}，
+        # 未压缩的版本编码为空字符串
+        self.files = {}
+        # 入口页面：编码 -> (内容, ETag)
+        self.shell = None
+        self.shell_info = None
+        self.scan()
+
+    def scan(self):
+        files = {}
+        shell = None
+        shell_info = None
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                    continue
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    data = f.read()
+                etag = content_etag(data)
+                variants = {'': (path, len(data), etag)}
+                for encoding, suffix in ENCODINGS:
+                    try:
+                        size = os.path.getsize(path + suffix)
+                    except OSError:
+                        continue
+                    # 压缩版本比原文件旧时说明是上次构建留下的，不使用
+                    if os.path.getmtime(path + suffix) >= os.path.getmtime(path):
+                        variants[encoding] = (path + suffix, size, f'{etag}-{encoding}')
+                entry = {
+                    'mimetype': guess_type(name),
+                    'immutable': HASHED_NAME.match(relative) is not None,
+                    'last_modified': datetime.fromtimestamp(int(os.path.getmtime(path)), timezone.utc),
+                    'variants': variants
+                }
+                files[relative] = entry
+                if relative == SHELL:
+                    shell_info = entry
+                    shell = {'': (data, etag)}
+                    for encoding, (variant_path, _, variant_etag) in variants.items():
+                        if encoding:
+                            with open(variant_path, 'rb') as f:
+                                shell[encoding] = (f.read(), variant_etag)
+                    # 入口页面没有预压缩版本时在内存中压缩
+                    if 'gzip' not in shell:
+                        shell['gzip'] = (gzip.compress(data, 9, mtime=0), f'{etag}-gzip')
+                    if 'br' not in shell and HAS_BROTLI:
+                        shell['br'] = (brotli.compress(data), f'{etag}-br')
+        self.files = files
+        self.shell = shell
+        self.shell_info = shell_info
+        return len(files)
+
+    # 按路径查找文件，不存在时返回None
+    def lookup(self, path):
+        return self.files.get(path)
+
+    # 客户端支持的最优编码，accept 为 request.accept_encodings
+    @staticmethod
+    def choose_encoding(available, accept):
+        for encoding, _ in ENCODINGS:
+            if encoding in available and accept[encoding] > 0:
+                return encoding
+        return ''
+
+
+# 为目录中的文本类文件生成 .gz 和 .br 压缩文件，已是最新的跳过，返回生成的文件数
+def compress_directory(root, min_bytes=MIN_COMPRESS_BYTES):
+    created = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(tuple(suffix for _, suffix in ENCODINGS)) or not is_compressible(name):
+                continue
+            path = os.path.join(directory, name)
+            if os.path.getsize(path) < min_bytes:
+                continue
+            data = None
+            for encoding, suffix in ENCODINGS:
+                if encoding == 'br' and not HAS_BROTLI:
+                    continue
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                compressed = brotli.compress(data) if encoding == 'br' else gzip.compress(data, 9, mtime=0)
+                # 压缩后没有明显变小的不保存
+                if len(compressed) >= len(data) * 0.95:
+                    continue
+                with open(target, 'wb') as f:
+                    f.write(compressed)
+                created += 1
+    return created
+
+
+if __name__ == '__main__':
+    root = sys.argv[1] if len(sys.argv) > 1 else 'dist'
+    if not HAS_BROTLI:
+        print("未安装 brotli，只生成 .gz 文件（pip install brotli）")
+    print(f"已生成 {compress_directory(root)} 个压缩文件")
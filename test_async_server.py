@@ -0,0 +1,74 @@
+# 异步服务器的流式响应：客户端在输出过程中断开时应停止生成并释放SSE连接，不向ASGI服务器抛出异常
+import asyncio
+import importlib
+import os
+
+import pytest
+
+pytest.importorskip('sqlalchemy.ext.asyncio')
+pytest.importorskip('greenlet')
+pytest.importorskip('aiosqlite')
+
+
+@pytest.fixture
+def async_server(monkeypatch):
+    monkeypatch.setenv('STAR_MAP_ASYNC_DATABASE_URL', 'sqlite+aiosqlite://')
+    import async_server
+    return importlib.reload(async_server)
+
+
+def make_request(module, path):
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': [], 'query_string': b'',
+             'client': ('127.0.0.1', 50000)}
+    sent = []
+    first_chunk = asyncio.Event()
+
+    # 收到第一块响应体后客户端断开
+    async def receive():
+        await first_chunk.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+        if message['type'] == 'http.response.body' and message.get('body'):
+            first_chunk.set()
+
+    return module.Request(scope, receive), send, sent
+
+
+def test_stream_disconnect_closes_generator(async_server):
+    closed = []
+
+    async def body():
+        try:
+            yield b'first'
+            # 模拟等待下一个事件
+            await asyncio.sleep(60)
+            yield b'never'
+        finally:
+            closed.append(True)
+
+    async def run():
+        request, send, sent = make_request(async_server, '/api/stream')
+        await asyncio.wait_for(async_server.Response(body()).send(request, send), 5)
+        return sent
+
+    sent = asyncio.run(run())
+    assert closed == [True]
+    assert [message.get('body') for message in sent if message['type'] == 'http.response.body'] == [b'first']
+
+
+def test_event_stream_disconnect_releases_subscription(async_server):
+    async def run():
+        async_server._loop['loop'] = asyncio.get_running_loop()
+        async_server._loop['stream_event'] = asyncio.Event()
+        request, send, sent = make_request(async_server, '/api/stream')
+        response = await async_server.event_stream(request)
+        assert async_server.event_bus.subscribers == 1
+        await asyncio.wait_for(response.send(request, send), 5)
+        return sent
+
+    sent = asyncio.run(run())
+    assert sent[0]['status'] == 200
+    assert sent[1]['body'].startswith(b'retry:')
+    assert async_server.event_bus.subscribers == 0
@@ -0,0 +1,108 @@
+# 批量创建标记：合法和不合法的标记混合提交时逐条返回结果，同一批中重复的昵称只创建一个用户，
+# SQL语句数量不随标记数量增长（位置的多行INSERT按参数上限分块，每块一条）
+import pytest
+
+import bulk_import
+from test_query_count import server  # noqa: F401  (pytest fixture)
+
+from models import User, Content, Statistics
+
+
+def batch(count, nickname=lambda i: f'批量{i}'):
+    return [{'nickname': nickname(i), 'latitude': 30 + i * 0.001, 'longitude': 110, 'message': f'留言{i}'}
+            for i in range(count)]
+
+
+def test_mixed_valid_and_invalid_markers(server):
+    server.init_db()
+    items = [
+        {'nickname': '甲', 'latitude': 39.9, 'longitude': 116.4, 'message': '你好'},
+        {'nickname': '乙', 'latitude': 200},
+        'not-an-object',
+        {'nickname': '丙', 'latitude': 31.2, 'longitude': 121.5},
+        {'nickname': 123},
+    ]
+    response = server.app.test_client().post('/api/markers/batch', json={'markers': items})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['created'], body['failed']) == (2, 3)
+    assert [result['index'] for result in body['results']] == [0, 1, 2, 3, 4]
+    assert [result['success'] for result in body['results']] == [True, False, False, True, False]
+    assert body['results'][0]['marker']['nickname'] == '甲'
+    assert body['results'][3]['marker']['nickname'] == '丙'
+
+    session = server.Session()
+    try:
+        assert session.query(Content).count() == 2
+        assert session.query(Statistics.total_contents).scalar() == 2
+    finally:
+        session.close()
+
+
+def test_duplicate_nicknames_in_one_batch(server):
+    items = batch(6, nickname=lambda i: '同一个人' if i % 2 else f'路人{i}')
+    body = server.app.test_client().post('/api/markers/batch', json=items).get_json()
+    assert body['created'] == 6
+
+    session = server.Session()
+    try:
+        assert session.query(User).filter(User.nickname == '同一个人').count() == 1
+        user_ids = {user_id for user_id, in session.query(Content.user_id)}
+        assert len(user_ids) == 4
+    finally:
+        session.close()
+
+
+def count_batch_statements(module, items):
+    client = module.app.test_client()
+    del module.statements[:]
+    assert client.post('/api/markers/batch', json=items).get_json()['created'] == len(items)
+    return len(module.statements)
+
+
+@pytest.mark.parametrize('rows_per_statement', [None, 50])
+def test_statement_count_per_chunk(server, monkeypatch, rows_per_statement):
+    server.init_db()
+    # 索引同步不计入写入的语句数
+    monkeypatch.setattr(server, 'sync_markers', lambda force=False: None)
+    location_columns = 9
+    if rows_per_statement is not None:
+        monkeypatch.setattr(bulk_import, 'MAX_STATEMENT_PARAMS', location_columns * rows_per_statement)
+
+    # 先写入一批，城市计数行已存在，之后每批只更新
+    count_batch_statements(server, batch(1, nickname=lambda i: f'预热{i}'))
+    small = count_batch_statements(server, batch(5, nickname=lambda i: f'小批{i}'))
+    large = count_batch_statements(server, batch(200, nickname=lambda i: f'大批{i}'))
+    if rows_per_statement is None:
+        assert large == small
+    else:
+        # 200个标记的位置分为4块，5个标记只有1块
+        assert large == small + 3
+
+
+def test_non_connection_errors_do_not_fall_back_to_file(server, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    server.init_db()
+
+    def broken_insert(*args, **kwargs):
+        raise ValueError('约束冲突')
+
+    monkeypatch.setattr(server, 'insert_markers', broken_insert)
+    response = server.app.test_client().post('/api/markers/batch', json=batch(2))
+    assert response.status_code == 500
+    assert not (tmp_path / 'data.jsonl').exists()
+
+
+def test_connection_errors_fall_back_to_file(server, monkeypatch, tmp_path):
+    from sqlalchemy.exc import OperationalError
+
+    monkeypatch.chdir(tmp_path)
+    server.init_db()
+
+    def lost_connection(*args, **kwargs):
+        raise OperationalError('INSERT', {}, Exception('连接已断开'))
+
+    monkeypatch.setattr(server, 'insert_markers', lost_connection)
+    response = server.app.test_client().post('/api/markers/batch', json=batch(2))
+    assert response.get_json()['created'] == 2
+    assert (tmp_path / 'data.jsonl').exists()
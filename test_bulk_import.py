@@ -0,0 +1,34 @@
+# 批量写入标记：昵称的唯一索引不区分大小写时（MySQL 默认排序规则），不同写法的昵称对应同一个用户
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from sqlalchemy import create_engine
+
+from bulk_import import insert_markers
+from models import Base, User
+
+
+@pytest.fixture
+def nocase_engine(monkeypatch):
+    # 用 SQLite 的 NOCASE 排序规则模拟 MySQL 不区分大小写的昵称比较
+    monkeypatch.setattr(User.__table__.c.nickname.type, 'collation', 'NOCASE')
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def test_mixed_case_nicknames(nocase_engine):
+    with nocase_engine.begin() as conn:
+        markers, new_users = insert_markers(conn, [{'nickname': 'bob'}])
+        assert new_users == 1
+
+    with nocase_engine.begin() as conn:
+        cache = {}
+        markers, new_users = insert_markers(conn, [{'nickname': 'Bob'}, {'nickname': 'BOB'}, {'nickname': 'alice'},
+                                                   {'nickname': 'Alice'}], cache)
+        assert len(markers) == 4
+        assert new_users == 1
+        assert cache['Bob'] == cache['BOB'] == cache['bob']
+        assert cache['alice'] == cache['Alice']
+        assert len(conn.execute(User.__table__.select()).all()) == 2
@@ -0,0 +1,31 @@
+# SSE连接数上限：名额在返回响应前占用，响应关闭后释放，超过上限返回503
+from test_query_count import load_server
+
+
+def test_stream_client_limit():
+    server = load_server()
+    server.MAX_STREAM_CLIENTS = 1
+    client = server.app.test_client()
+
+    first = client.get('/api/stream', buffered=False)
+    assert first.status_code == 200
+    assert next(first.response).startswith(b'retry:')
+    assert server.event_bus.subscribers == 1
+
+    assert client.get('/api/stream', buffered=False).status_code == 503
+
+    first.close()
+    assert server.event_bus.subscribers == 0
+    second = client.get('/api/stream', buffered=False)
+    assert second.status_code == 200
+    second.close()
+    assert server.event_bus.subscribers == 0
+
+
+def test_unstarted_stream_releases_subscription():
+    server = load_server()
+    response = server.app.test_client().get('/api/stream', buffered=False)
+    assert server.event_bus.subscribers == 1
+    # 输出开始之前断开
+    response.close()
+    assert server.event_bus.subscribers == 0
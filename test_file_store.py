@@ -0,0 +1,100 @@
+# 文件存储：崩溃时写了一半的日志行、压缩期间的并发追加、新标记和重新加载的回调
+import threading
+
+from file_store import FileStore
+
+
+def make_marker(i):
+    return {'id': f'm{i}', 'latitude': 30 + i * 0.001, 'longitude': 110, 'location': f'城市{i % 3}', 'likes': 0}
+
+
+def test_torn_last_line_is_truncated(tmp_path):
+    path = str(tmp_path / 'data.json')
+    store = FileStore(path)
+    store.add_markers([make_marker(i) for i in range(3)])
+    with open(store.log_path, 'ab') as f:
+        f.write(b'{"op": "add", "marker": {"id": "half')
+
+    reloaded = FileStore(path)
+    assert [marker['id'] for marker in reloaded.all_markers()] == ['m0', 'm1', 'm2']
+    with open(store.log_path, 'rb') as f:
+        assert f.read().endswith(b'\n')
+    # 截断后可以继续追加
+    reloaded.add_marker(make_marker(3))
+    assert [marker['id'] for marker in FileStore(path).all_markers()] == ['m0', 'm1', 'm2', 'm3']
+
+
+def test_compaction_during_concurrent_appends(tmp_path):
+    path = str(tmp_path / 'data.json')
+    store = FileStore(path, compact_threshold=10 ** 9)
+    # 另一个进程的存储实例共用同一组文件
+    other = FileStore(path, compact_threshold=10 ** 9, refresh_interval=0)
+    stop = threading.Event()
+
+    def compact_loop():
+        while not stop.is_set():
+            store.compact()
+
+    compactor = threading.Thread(target=compact_loop)
+    compactor.start()
+    try:
+        for i in range(200):
+            (store if i % 2 else other).add_marker(make_marker(i))
+    finally:
+        stop.set()
+        compactor.join()
+
+    expected = {f'm{i}' for i in range(200)}
+    for instance in (store, other, FileStore(path)):
+        instance.refresh(force=True)
+        markers = instance.all_markers()
+        assert len(markers) == 200
+        assert {marker['id'] for marker in markers} == expected
+        assert instance.get_stats()['totalMarkers'] == 200
+
+
+def test_subscribe_callbacks(tmp_path):
+    path = str(tmp_path / 'data.json')
+    store = FileStore(path)
+    other = FileStore(path, refresh_interval=0)
+    created, resets, updated = [], [], []
+    store.subscribe(lambda marker: created.append(marker['id']), lambda: resets.append(True),
+                    lambda marker: updated.append((marker['id'], marker['likes'])))
+
+    store.add_marker(make_marker(0))
+    # 其他进程写入的标记和点赞在读取日志时回调
+    other.add_marker(make_marker(1))
+    other.add_likes({'m1': 2})
+    store.refresh(force=True)
+    assert created == ['m0', 'm1']
+    assert updated == [('m1', 2)]
+
+    # 其他进程压缩后日志被替换，本进程整体重新加载
+    other.compact()
+    store.refresh(force=True)
+    assert resets == [True]
+    assert [marker['id'] for marker in store.all_markers()] == ['m0', 'm1']
+
+
+def test_likes_during_compaction_are_counted_once(tmp_path, monkeypatch):
+    import file_store
+
+    path = str(tmp_path / 'data.json')
+    store = FileStore(path, compact_threshold=10 ** 9)
+    store.add_marker(make_marker(0))
+    dump = file_store.json.dump
+    calls = []
+
+    # 在不持锁序列化快照期间写入点赞
+    def dump_with_like(data, *args, **kwargs):
+        if not calls and 'markers' in data:
+            calls.append(True)
+            store.add_likes({'m0': 1})
+        return dump(data, *args, **kwargs)
+
+    monkeypatch.setattr(file_store.json, 'dump', dump_with_like)
+    store.compact()
+    monkeypatch.setattr(file_store.json, 'dump', dump)
+    assert calls
+    assert store.get_marker('m0')['likes'] == 1
+    assert FileStore(path).get_marker('m0')['likes'] == 1
@@ -0,0 +1,49 @@
+# 发布标记时的离线反查：城市由坐标反查，用户填写的位置在文件模式下也保存为 address。
+# 两种模式的接口响应和事件中的标记字段相同，省份和地址只保存在存储中
+from test_query_count import load_server, server  # noqa: F401  (pytest fixture)
+
+from file_store import FileStore
+from geocoder import reverse_geocode
+
+
+def test_reverse_geocode():
+    place = reverse_geocode(39.9042, 116.4074)
+    assert place['city'].startswith('北京')
+    assert reverse_geocode(0, -30) is None
+
+
+API_FIELDS = {'id', 'nickname', 'location', 'latitude', 'longitude', 'message', 'image', 'likes', 'date'}
+
+
+def post_markers(module, monkeypatch):
+    events = []
+    monkeypatch.setattr(module.event_bus, 'publish', lambda event, data: events.append(data))
+    client = module.app.test_client()
+    marker = client.post('/api/markers', json={
+        'location': '我家楼下的咖啡馆', 'latitude': 39.9042, 'longitude': 116.4074
+    }).get_json()['marker']
+    batch = client.post('/api/markers/batch', json=[
+        {'location': '外滩', 'latitude': 31.2304, 'longitude': 121.4737}
+    ]).get_json()['results'][0]['marker']
+    listed = client.get('/api/markers').get_json()
+
+    assert marker['location'].startswith('北京')
+    assert batch['location'].startswith('上海')
+    for payload in [marker, batch] + events + listed:
+        assert set(payload) == API_FIELDS
+    return marker
+
+
+def test_file_mode_keeps_user_location_as_address(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('STAR_MAP_STORAGE', 'file')
+    module = load_server()
+    marker = post_markers(module, monkeypatch)
+
+    stored = FileStore(module.DATA_FILE).get_marker(marker['id'])
+    assert stored['address'] == '我家楼下的咖啡馆'
+    assert stored['province'].startswith('北京')
+
+
+def test_database_mode_markers_have_the_same_fields(server, monkeypatch):
+    post_markers(server, monkeypatch)
@@ -0,0 +1,41 @@
+# 热力图：NumPy 是可选依赖，未安装时纯Python分箱的结果与向量化分箱相同
+import json
+import random
+
+import pytest
+
+import heatmap
+from heatmap import Heatmap
+
+
+def build(points):
+    result = Heatmap()
+    result.extend(points[:-10])
+    for lat, lng in points[-10:]:
+        result.insert(lat, lng)
+    return result
+
+
+# 网格的输出顺序与分箱方式有关，按 (瓦片, 列, 行) -> 数量 比较
+def render_all(result):
+    grids = []
+    for z in (0, 3, 6):
+        body = json.loads(result.render(z, (30.0, 100.0, 40.0, 120.0)))
+        cells = {}
+        for tile in body['tiles']:
+            values = tile['cells']
+            for i in range(0, len(values), 3):
+                cells[(tile['x'], tile['y'], values[i], values[i + 1])] = values[i + 2]
+        grids.append((body['max'], cells))
+    return grids
+
+
+def test_pure_python_matches_numpy(monkeypatch):
+    pytest.importorskip('numpy')
+    random.seed(3)
+    points = [(random.uniform(30, 40), random.uniform(100, 120)) for _ in range(500)]
+    expected = render_all(build(points))
+
+    monkeypatch.setattr(heatmap, 'HAS_NUMPY', False)
+    assert render_all(build(points)) == expected
+    assert sum(expected[0][1].values()) == 500
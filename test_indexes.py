@@ -0,0 +1,91 @@
+# 内存索引：其他工作进程写入的标记要同步到本进程，构建期间新增的标记不能丢失
+import uuid
+
+from test_query_count import load_server, server, seed_markers  # noqa: F401  (pytest fixture)
+
+from models import User, Location, Content
+
+
+# 模拟其他工作进程：直接写入数据库，不经过本进程的写入接口
+def insert_elsewhere(module, latitude=31.0, longitude=121.0):
+    session = module.Session()
+    try:
+        user = User(nickname=f'其他进程{uuid.uuid4().hex[:8]}')
+        location = Location(latitude=latitude, longitude=longitude, city='上海')
+        session.add_all([user, location])
+        session.flush()
+        session.add(Content(id=str(uuid.uuid4()), user_id=user.id, location_id=location.id, message='其他进程'))
+        session.commit()
+    finally:
+        session.close()
+
+
+def test_cluster_index_sees_other_worker_markers(server):
+    seed_markers(server, 3)
+    server.marker_feed.interval = 0
+    assert server.get_cluster_index().count == 3
+
+    insert_elsewhere(server)
+    assert server.get_cluster_index().count == 4
+
+
+def test_marker_created_during_cluster_build_is_kept(server):
+    seed_markers(server, 3)
+    client = server.app.test_client()
+    build = server.cluster_index.build
+
+    # 构建读取快照之后、完成之前，本进程写入一个新标记
+    def build_with_concurrent_write(snapshot):
+        response = client.post('/api/markers', json={'nickname': '并发', 'latitude': 30.5, 'longitude': 114.3})
+        assert response.get_json()['success']
+        return build(snapshot)
+
+    server.cluster_index.build = build_with_concurrent_write
+    assert server.get_cluster_index().count == 4
+    # 之后的新标记直接应用到索引
+    insert_elsewhere(server)
+    server.sync_markers(force=True)
+    assert server.get_cluster_index().count == 5
+
+
+def test_heatmap_sees_other_worker_markers(server):
+    seed_markers(server, 3)
+    server.marker_feed.interval = 0
+    assert server.get_heatmap().count == 3
+
+    insert_elsewhere(server)
+    assert server.get_heatmap().count == 4
+
+
+def test_marker_created_during_heatmap_build_is_kept(server):
+    seed_markers(server, 3)
+    client = server.app.test_client()
+    build = server.heatmap_index.build
+
+    def build_with_concurrent_write(snapshot):
+        client.post('/api/markers', json={'nickname': '并发', 'latitude': 30.5, 'longitude': 114.3})
+        return build(snapshot)
+
+    server.heatmap_index.build = build_with_concurrent_write
+    assert server.get_heatmap().count == 4
+
+
+def test_marker_created_during_ranking_build_is_kept(tmp_path, monkeypatch):
+    # 精选排序只在文件模式下使用
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('STAR_MAP_STORAGE', 'file')
+    module = load_server()
+    client = module.app.test_client()
+    client.post('/api/markers', json={'nickname': '之前', 'image': 'https://example.com/1.jpg'})
+    build = module.ranking_index.build
+    created = []
+
+    def build_with_concurrent_write(snapshot):
+        response = client.post('/api/markers', json={'nickname': '并发', 'image': 'https://example.com/2.jpg'})
+        created.append(response.get_json()['marker']['id'])
+        return build(snapshot)
+
+    module.ranking_index.build = build_with_concurrent_write
+    top = module.get_ranking().top()
+    assert len(top) == 2
+    assert created[0] in top
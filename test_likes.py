@@ -0,0 +1,114 @@
+# 点赞：文件模式下同一用户的重复点赞在写入日志、重新加载和压缩之后仍然去重；
+# 数据库模式启动时按点赞记录校准 likes_count
+from test_query_count import load_server, server, seed_markers  # noqa: F401  (pytest fixture)
+
+from file_store import FileStore
+from models import Content
+
+
+def test_file_mode_like_dedup_survives_flush(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('STAR_MAP_STORAGE', 'file')
+    module = load_server()
+    client = module.app.test_client()
+    marker_id = client.post('/api/markers', json={'nickname': '测试'}).get_json()['marker']['id']
+
+    assert client.post(f'/api/markers/{marker_id}/like', json={'userId': 7}).status_code == 200
+    module.like_buffer.flush()
+    assert client.post(f'/api/markers/{marker_id}/like', json={'userId': 7}).status_code == 409
+    # 匿名点赞不去重
+    assert client.post(f'/api/markers/{marker_id}/like', json={}).status_code == 200
+    assert client.post(f'/api/markers/{marker_id}/like', json={}).status_code == 200
+    module.like_buffer.flush()
+
+    store = module.get_store()
+    assert store.get_marker(marker_id)['likes'] == 3
+    store.compact()
+    reloaded = FileStore(module.DATA_FILE)
+    assert reloaded.has_liked(marker_id, 7)
+    assert reloaded.get_marker(marker_id)['likes'] == 3
+
+
+def test_file_mode_reads_include_buffered_likes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('STAR_MAP_STORAGE', 'file')
+    module = load_server()
+    client = module.app.test_client()
+    marker_id = client.post('/api/markers', json={'nickname': '测试', 'image': 'a.jpg'}).get_json()['marker']['id']
+    # 先读取一次，缓存点赞前的响应
+    assert client.get('/api/markers').get_json()[0]['likes'] == 0
+    assert client.get('/api/featured').get_json()[0]['likes'] == 0
+
+    assert client.post(f'/api/markers/{marker_id}/like', json={}).status_code == 200
+    assert client.get('/api/markers').get_json()[0]['likes'] == 1
+    assert client.get('/api/markers?bbox=-180,-90,180,90').get_json()[0]['likes'] == 1
+    assert client.get('/api/markers?limit=10').get_json()['markers'][0]['likes'] == 1
+    assert client.get('/api/featured').get_json()[0]['likes'] == 1
+    # 存储中的标记不被修改，写入后不重复计算
+    assert module.get_store().get_marker(marker_id)['likes'] == 0
+    module.like_buffer.flush()
+    assert client.get('/api/markers').get_json()[0]['likes'] == 1
+
+
+def test_file_store_counts_each_user_once(tmp_path):
+    store = FileStore(str(tmp_path / 'data.json'))
+    store.add_marker({'id': 'a', 'latitude': 30, 'longitude': 110})
+    # 两个进程的缓冲区同时写入同一用户的点赞，只有先写入日志的生效
+    store.add_likes({}, [('a', 1)])
+    store.add_likes({'a': 2}, [('a', 1), ('a', 2)])
+    assert store.get_marker('a')['likes'] == 4
+
+
+def test_init_db_resyncs_like_counts(server):
+    seed_markers(server, 3)
+    session = server.Session()
+    try:
+        session.query(Content).update({Content.likes_count: 0}, synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+    server.init_db()
+
+    session = server.Session()
+    try:
+        assert [count for count, in session.query(Content.likes_count)] == [1, 1, 1]
+    finally:
+        session.close()
+
+
+def test_flush_likes_counts_only_inserted_rows(server):
+    from datetime import datetime
+    from sqlalchemy import event
+    from models import User, Like, flush_likes
+
+    seed_markers(server, 2)
+    session = server.Session()
+    try:
+        content_id = session.query(Content.id).first()[0]
+        users = [User(nickname=f'点赞{i}') for i in range(2)]
+        session.add_all(users)
+        session.commit()
+        user_ids = [user.id for user in users]
+    finally:
+        session.close()
+
+    # 另一个进程在本进程检查已有点赞之后、写入之前提交了同一用户的点赞
+    state = {'done': False}
+
+    @event.listens_for(server.engine, 'before_cursor_execute')
+    def concurrent_like(conn, cursor, statement, parameters, context, executemany):
+        if not state['done'] and statement.startswith('INSERT OR IGNORE INTO likes'):
+            state['done'] = True
+            cursor.execute('INSERT INTO likes (content_id, user_id) VALUES (?, ?)', (content_id, user_ids[0]))
+
+    session = server.Session()
+    try:
+        rows = [{'content_id': content_id, 'user_id': user_id, 'created_at': datetime.now()} for user_id in user_ids]
+        assert flush_likes(session, rows) == 1
+        session.commit()
+        # 种子数据的1个 + 本次实际插入的1个，另一个进程的点赞由它自己计数
+        assert session.query(Content.likes_count).filter(Content.id == content_id).scalar() == 2
+        assert session.query(Like).filter(Like.content_id == content_id).count() == 3
+    finally:
+        session.close()
@@ -0,0 +1,26 @@
+# 数据迁移：导入压缩过的文件存储时，日志中的实名点赞按快照中的点赞记录去重
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from sqlalchemy import create_engine
+
+from file_store import FileStore
+from migrate_data import import_markers
+from models import Content
+
+
+def test_import_compacted_store(tmp_path):
+    path = str(tmp_path / 'data.json')
+    store = FileStore(path)
+    store.add_marker({'id': 'a', 'nickname': '测试', 'latitude': 30, 'longitude': 110, 'likes': 0})
+    store.add_likes({'a': 1}, [('a', 1)])
+    store.compact()
+    # 压缩之后日志中再次出现同一用户的点赞（两个进程的缓冲区同时写入），只计一次
+    store.add_likes({'a': 1}, [('a', 1), ('a', 2)])
+    assert store.get_marker('a')['likes'] == 4
+
+    engine = create_engine('sqlite://')
+    assert import_markers(engine, path) == 1
+    with engine.connect() as conn:
+        assert conn.execute(Content.__table__.select()).one().likes_count == 4
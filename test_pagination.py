@@ -0,0 +1,86 @@
+# 标记列表的键集分页和流式输出：篡改的游标返回400，相同时间的标记翻页不重复不遗漏，
+# ndjson / json 流式输出与普通列表一致
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from test_query_count import load_server, server, seed_markers  # noqa: F401  (pytest fixture)
+
+from cursors import encode_cursor
+from models import Content
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor!',
+    base64.urlsafe_b64encode(b'{"a": 1}').decode('ascii'),
+    encode_cursor('2024-01-01T00:00:00'),
+    encode_cursor('昨天', 'id'),
+    encode_cursor('2024-01-01T00:00:00', 42),
+])
+def test_invalid_cursor_is_rejected(server, cursor):
+    seed_markers(server, 3)
+    client = server.app.test_client()
+    response = client.get('/api/markers', query_string={'limit': 2, 'cursor': cursor})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    assert client.get('/api/markers', query_string={'since': cursor}).status_code == 400
+
+
+@pytest.mark.parametrize('cursor', ['###', encode_cursor(-1), encode_cursor('1'), encode_cursor(True)])
+def test_invalid_file_cursor_is_rejected(tmp_path, monkeypatch, cursor):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('STAR_MAP_STORAGE', 'file')
+    client = load_server().app.test_client()
+    assert client.get('/api/markers', query_string={'limit': 2, 'cursor': cursor}).status_code == 400
+    assert client.get('/api/markers', query_string={'since': cursor}).status_code == 400
+
+
+def test_paging_across_equal_timestamps(server):
+    seed_markers(server, 7)
+    session = server.Session()
+    try:
+        session.query(Content).update({Content.created_at: datetime(2024, 5, 1, 12, 0, 0)}, synchronize_session=False)
+        session.commit()
+        expected = sorted((content_id for content_id, in session.query(Content.id)), reverse=True)
+    finally:
+        session.close()
+
+    client = server.app.test_client()
+    ids = []
+    cursor = None
+    for _ in range(10):
+        query = {'limit': 3}
+        if cursor is not None:
+            query['cursor'] = cursor
+        page = client.get('/api/markers', query_string=query).get_json()
+        ids.extend(marker['id'] for marker in page['markers'])
+        cursor = page['nextCursor']
+        if cursor is None:
+            break
+    assert ids == expected
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'json'])
+def test_streaming_matches_list(server, monkeypatch, fmt):
+    seed_markers(server, 25)
+    # 每个标记单独成块，覆盖分块边界上的分隔符
+    monkeypatch.setattr(server, 'STREAM_CHUNK_BYTES', 1)
+    client = server.app.test_client()
+    expected = client.get('/api/markers').get_json()
+
+    response = client.get('/api/markers', query_string={'stream': fmt})
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    if fmt == 'ndjson':
+        assert response.mimetype == 'application/x-ndjson'
+        markers = [json.loads(line) for line in body.splitlines()]
+    else:
+        assert response.mimetype == 'application/json'
+        markers = json.loads(body)
+    assert markers == expected
+
+
+def test_invalid_stream_format_is_rejected(server):
+    assert server.app.test_client().get('/api/markers?stream=xml').status_code == 400
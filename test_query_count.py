@@ -0,0 +1,113 @@
+# 标记接口SQL语句数量回归测试：/api/markers 和 /api/featured 每次请求的语句数
+# 不应随标记数量增长（防止N+1查询回归）
+import importlib.util
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('sqlalchemy')
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models import Base, User, Location, Content, Like, Statistics
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'start-server.py')
+
+
+# 加载 start-server.py（文件名包含连字符，无法直接import）
+def load_server():
+    spec = importlib.util.spec_from_file_location('start_server', SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def server():
+    module = load_server()
+    if not module.HAS_DATABASE:
+        pytest.skip('数据库模式不可用')
+
+    # 使用内存SQLite代替MySQL
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    module.engine = engine
+    module.Session = sessionmaker(bind=engine)
+
+    statements = []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    module.statements = statements
+    return module
+
+
+# 写入指定数量的标记，每个标记带一个点赞
+def seed_markers(module, count):
+    session = module.Session()
+    try:
+        now = datetime.now()
+        for i in range(count):
+            # 昵称唯一，重复写入时沿用已有用户
+            user = session.query(User).filter(User.nickname == f'用户{i}').first() or User(nickname=f'用户{i}')
+            location = Location(latitude=30 + i * 0.01, longitude=110 + i * 0.01, city=f'城市{i % 5}')
+            session.add_all([user, location])
+            session.flush()
+            content = Content(
+                id=str(uuid.uuid4()),
+                user_id=user.id,
+                location_id=location.id,
+                message=f'留言{i}',
+                image_url=f'https://example.com/{i}.jpg',
+                likes_count=1,
+                created_at=now - timedelta(seconds=i)
+            )
+            session.add(content)
+            session.flush()
+            session.add(Like(content_id=content.id, user_id=user.id))
+        session.add(Statistics(total_markers=count))
+        session.commit()
+    finally:
+        session.close()
+
+
+# 统计一次GET请求执行的SQL语句数
+def count_request_statements(module, url):
+    client = module.app.test_client()
+    module.statements.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return len(module.statements), response.get_json()
+
+
+@pytest.mark.parametrize('url', ['/api/markers', '/api/featured'])
+def test_statement_count_is_constant(server, url):
+    seed_markers(server, 3)
+    small_count, small_body = count_request_statements(server, url)
+
+    seed_markers(server, 30)
+    large_count, large_body = count_request_statements(server, url)
+
+    assert len(large_body) > len(small_body)
+    assert small_count == large_count
+    assert large_count <= 2
+
+
+def test_marker_json_shape(server):
+    seed_markers(server, 2)
+    _, markers = count_request_statements(server, '/api/markers')
+
+    assert len(markers) == 2
+    marker = markers[0]
+    assert set(marker) == {'id', 'nickname', 'location', 'latitude', 'longitude',
+                           'message', 'image', 'likes', 'date'}
+    assert marker['nickname'] == '用户0'
+    assert marker['likes'] == 1
+    assert isinstance(marker['latitude'], float)
@@ -0,0 +1,32 @@
+# 视口参数解析：非有限值（nan、inf）和不完整、颠倒的范围返回400
+import pytest
+
+from test_query_count import server  # noqa: F401  (pytest fixture)
+
+from spatial_index import parse_bbox
+
+
+@pytest.mark.parametrize('args', [
+    {'bbox': 'nan,nan,nan,nan'},
+    {'bbox': '100,30,inf,40'},
+    {'bbox': '-inf,30,120,40'},
+    {'minLat': 'NaN', 'minLng': '100', 'maxLat': '40', 'maxLng': '120'},
+    {'bbox': '100,40,120,30'},
+    {'bbox': '100,30,120'},
+    {'minLat': '30', 'minLng': '100'},
+])
+def test_invalid_bbox(args):
+    with pytest.raises(ValueError):
+        parse_bbox(args)
+
+
+def test_bbox_is_clamped():
+    assert parse_bbox({'bbox': '-200,-95,200,95'}) == (-90.0, -180.0, 90.0, 180.0)
+    assert parse_bbox({}) is None
+
+
+@pytest.mark.parametrize('path', ['/api/markers', '/api/clusters?zoom=3', '/api/heatmap?z=3'])
+def test_non_finite_bbox_returns_400(server, path):
+    separator = '&' if '?' in path else '?'
+    response = server.app.test_client().get(f'{path}{separator}bbox=nan,nan,nan,nan')
+    assert response.status_code == 400
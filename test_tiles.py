@@ -0,0 +1,59 @@
+# 星星瓦片的磁盘缓存：空白瓦片不写入，失效在后台删除，瓦片数超过上限时删除最早写入的
+import os
+import time
+
+from tiles import TileCache, EMPTY_TILE, MAX_TILE_ZOOM, parse_tile
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_max_zoom_matches_frontend():
+    assert parse_tile(MAX_TILE_ZOOM, 0, 0)
+    assert not parse_tile(MAX_TILE_ZOOM + 1, 0, 0)
+
+
+def test_empty_tile_is_not_stored(tmp_path):
+    cache = TileCache(str(tmp_path))
+    assert cache.get(3, 1, 1, lambda: EMPTY_TILE) is EMPTY_TILE
+    assert not os.path.exists(cache.path(3, 1, 1))
+
+
+def test_invalidate_removes_tile_in_background(tmp_path):
+    cache = TileCache(str(tmp_path))
+    # 纬度0、经度0位于第0级唯一的瓦片和第1级的 (1, 1)
+    cache.get(1, 1, 1, lambda: b'old')
+    assert os.path.exists(cache.path(1, 1, 1))
+
+    cache.invalidate(-1.0, 1.0)
+    # 删除完成前按未缓存处理
+    assert cache.get(1, 1, 1, lambda: b'new') == b'new'
+    assert wait_until(lambda: not cache.pending)
+    assert cache.get(1, 1, 1, lambda: b'newer') in (b'new', b'newer')
+
+
+def test_render_during_invalidation_is_not_stored(tmp_path):
+    cache = TileCache(str(tmp_path))
+
+    def render():
+        cache.invalidate(-1.0, 1.0)
+        return b'stale'
+
+    assert cache.get(1, 1, 1, render) == b'stale'
+    assert not os.path.exists(cache.path(1, 1, 1))
+
+
+def test_prune_keeps_newest_tiles(tmp_path):
+    cache = TileCache(str(tmp_path), max_tiles=10)
+    for y in range(20):
+        cache.get(5, 0, y, lambda: b'tile')
+        os.utime(cache.path(5, 0, y), (y, y))
+    assert wait_until(lambda: cache.stored is not None and cache.stored <= 10)
+    remaining = sorted(int(name[:-4]) for name in os.listdir(os.path.join(str(tmp_path), '5', '0')))
+    assert remaining == list(range(20 - len(remaining), 20))
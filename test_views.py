@@ -0,0 +1,86 @@
+# 浏览数：批量写入后精选接口的ETag应变化，客户端不会一直拿到304和旧的排序；
+# 采样和 HyperLogLog 去重的计数误差，写入后缓冲区不残留小数部分
+import random
+
+import view_buffer
+from test_query_count import server, seed_markers  # noqa: F401  (pytest fixture)
+from view_buffer import ViewBuffer, HyperLogLog, hash64
+
+
+def test_featured_etag_changes_after_view_flush(server):
+    seed_markers(server, 3)
+    client = server.app.test_client()
+    response = client.get('/api/featured')
+    etag = response.headers['ETag']
+    last = response.get_json()[-1]['id']
+
+    server.write_views({last: 1000})
+
+    response = client.get('/api/featured', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()[0]['id'] == last
+
+
+class Recorder:
+    def __init__(self):
+        self.counts = {}
+
+    def __call__(self, counts):
+        for content_id, count in counts.items():
+            assert isinstance(count, int)
+            self.counts[content_id] = self.counts.get(content_id, 0) + count
+
+
+def test_flush_leaves_no_fractional_remainders(monkeypatch):
+    # 全部采样命中，小数部分全部向上取整
+    monkeypatch.setattr(view_buffer.random, 'random', lambda: 0.0)
+    recorder = Recorder()
+    buffer = ViewBuffer(recorder, max_ids=5, sample_rate=0.4)
+    triggers = []
+    monkeypatch.setattr(buffer.task, 'trigger', lambda: triggers.append(True))
+
+    for i in range(5):
+        buffer.add(f'c{i}')
+    assert len(triggers) == 1
+    buffer.flush()
+    assert buffer.pending == {}
+    assert recorder.counts == {f'c{i}': 3 for i in range(5)}
+
+    # 缓冲区已清空，新的浏览不会立即触发写入
+    buffer.add('c0')
+    assert len(triggers) == 1
+
+
+def test_sampled_counts_are_unbiased():
+    random.seed(1)
+    recorder = Recorder()
+    buffer = ViewBuffer(recorder, max_ids=10 ** 6, sample_rate=0.25)
+    for _ in range(20):
+        for i in range(100):
+            for _ in range(10):
+                buffer.add(f'c{i}')
+        buffer.flush()
+    total = sum(recorder.counts.values())
+    assert abs(total - 20000) < 20000 * 0.05
+
+
+def test_unique_views_count_each_viewer_once():
+    recorder = Recorder()
+    buffer = ViewBuffer(recorder, unique=True)
+    for _ in range(50):
+        buffer.add('c', viewer='same')
+    for i in range(2000):
+        buffer.add('d', viewer=f'viewer-{i}')
+        buffer.add('d', viewer=f'viewer-{i}')
+    buffer.flush()
+    assert recorder.counts['c'] == 1
+    assert abs(recorder.counts['d'] - 2000) < 2000 * 0.1
+
+
+def test_hyperloglog_estimate():
+    for count in (10, 1000, 50000):
+        sketch = HyperLogLog()
+        for i in range(count):
+            sketch.add(hash64(i))
+        assert abs(sketch.estimate() - count) <= max(count * 0.1, 1)
@@ -0,0 +1,293 @@
+# 星星图层瓦片：服务端把标记渲染为 256x256 的透明PNG瓦片（/tiles/{z}/{x}/{y}.png），
+# 前端叠加一个瓦片图层代替成千上万个DOM标记，每个视口只需加载固定数量的瓦片。
+#
+# 低缩放级别直接读取聚合索引：ClusterIndex 第 z+6 级的网格（64像素）正好是第 z 级的一个像素，
+# 渲染一张瓦片最多读取 256x256 个网格，与标记总数无关；高缩放级别的瓦片覆盖范围小，按经纬度范围查询标记。
+# 渲染结果缓存在磁盘上，新增标记时只删除该标记所在的各级瓦片（星星跨越瓦片边界时包括相邻瓦片）。
+# 删除文件在后台线程中进行，请求线程只登记待删除的瓦片；空白瓦片不写入磁盘，缓存的瓦片数超过上限时删除最早写入的。
+# 多个工作进程共用缓存目录，每个进程都会收到所有新增标记（数据库模式见 marker_feed.py，文件模式为日志同步）并各自删除，
+# 其他进程在收到新标记之前写入的过期瓦片会在它收到该标记时删除。
+import math
+import os
+import shutil
+import struct
+import threading
+import zlib
+
+from spatial_index import MAX_LATITUDE, lat_lng_to_pixel
+
+TILE_SIZE = 256
+
+# 提供瓦片的最大缩放级别（与前端 App.jsx 的 STAR_TILE_MAX_ZOOM 一致，更高的级别前端直接显示标记）
+MAX_TILE_ZOOM = 11
+
+# 磁盘上最多缓存的瓦片数
+MAX_CACHED_TILES = int(os.environ.get('STAR_MAP_TILE_CACHE_MAX_TILES', '100000'))
+
+# 超过上限时删除到上限的这个比例，避免每写入一张都扫描目录
+PRUNE_RATIO = 0.8
+
+# 星星图案超出中心像素的半径，渲染和失效时按这个宽度包含相邻瓦片的标记
+STAR_RADIUS = 3
+
+
+# 星星图案：相对中心像素的偏移和亮度权重，十字方向的光芒最长，对角线次之，中心周围有一圈光晕
+def _build_sprite(radius):
+    sprite = []
+    for dx in range(-radius, radius + 1):
+        for dy in range(-radius, radius + 1):
+            if dx == 0 or dy == 0:
+                weight = 1 - (abs(dx) + abs(dy)) / (radius + 1)
+            elif abs(dx) == abs(dy):
+                weight = 0.6 - 0.25 * abs(dx)
+            elif dx * dx + dy * dy <= 5:
+                weight = 0.15
+            else:
+                continue
+            if weight > 0:
+                sprite.append((dx, dy, weight))
+    return sprite
+
+
+STAR_SPRITE = _build_sprite(STAR_RADIUS)
+
+# 颜色：单个星星为金色，重叠越多越接近白色
+STAR_COLOR = (255, 196, 48)
+GLOW_COLOR = (255, 255, 235)
+
+# 亮度量化为调色板，避免逐像素计算
+PALETTE_STEPS = 32
+PALETTE_MAX = 8.0
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _build_palette():
+    palette = []
+    for level in range(int(PALETTE_MAX * PALETTE_STEPS) + 1):
+        value = level / PALETTE_STEPS
+        alpha = 1 - math.exp(-1.5 * value)
+        mix = min(value / PALETTE_MAX, 1.0)
+        color = [round(star + (glow - star) * mix) for star, glow in zip(STAR_COLOR, GLOW_COLOR)]
+        palette.append(bytes(color + [round(255 * alpha)]))
+    return palette
+
+
+PALETTE = _build_palette()
+
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+
+# RGBA图像编码为PNG：raw 为逐行数据，每行以过滤类型字节（0）开头
+def encode_png(width, height, raw):
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return PNG_SIGNATURE + _png_chunk(b'IHDR', header) + \
+        _png_chunk(b'IDAT', zlib.compress(bytes(raw), 6)) + _png_chunk(b'IEND', b'')
+
+
+EMPTY_TILE = encode_png(TILE_SIZE, TILE_SIZE, bytes((TILE_SIZE * 4 + 1) * TILE_SIZE))
+
+
+# 渲染一张瓦片，points 为瓦片内的像素坐标和该像素上的标记数 (x, y, count)
+def render_tile(points):
+    size = TILE_SIZE
+    intensity = {}
+    for px, py, count in points:
+        px = int(px)
+        py = int(py)
+        for dx, dy, weight in STAR_SPRITE:
+            x = px + dx
+            y = py + dy
+            if 0 <= x < size and 0 <= y < size:
+                key = y * size + x
+                intensity[key] = intensity.get(key, 0.0) + weight * count
+    if not intensity:
+        return EMPTY_TILE
+
+    stride = size * 4 + 1
+    raw = bytearray(stride * size)
+    last = len(PALETTE) - 1
+    for key, value in intensity.items():
+        y, x = divmod(key, size)
+        offset = y * stride + 1 + x * 4
+        raw[offset:offset + 4] = PALETTE[min(int(value * PALETTE_STEPS), last)]
+    return encode_png(size, size, raw)
+
+
+# 全局像素坐标转换为经纬度（Web墨卡托）
+def pixel_to_lat_lng(x, y, zoom):
+    scale = TILE_SIZE * (2 ** zoom)
+    lng = x / scale * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / scale))))
+    return max(min(lat, MAX_LATITUDE), -MAX_LATITUDE), max(min(lng, 180.0), -180.0)
+
+
+def parse_tile(z, x, y):
+    # 瓦片坐标超出范围时返回False
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+# 渲染星星瓦片：cluster_index 为聚合索引，query_points(bbox) 返回范围内标记的 (纬度, 经度)
+def render_star_tile(z, x, y, cluster_index, query_points):
+    origin_x = x * TILE_SIZE
+    origin_y = y * TILE_SIZE
+    shift = int(math.log2(cluster_index.cell_pixels))
+    if z + shift <= cluster_index.max_zoom:
+        cells = cluster_index.cell_counts(z + shift,
+                                          origin_x - STAR_RADIUS, origin_y - STAR_RADIUS,
+                                          origin_x + TILE_SIZE + STAR_RADIUS, origin_y + TILE_SIZE + STAR_RADIUS)
+        return render_tile((cell_x - origin_x, cell_y - origin_y, count) for cell_x, cell_y, count in cells)
+
+    max_lat, min_lng = pixel_to_lat_lng(origin_x - STAR_RADIUS, origin_y - STAR_RADIUS, z)
+    min_lat, max_lng = pixel_to_lat_lng(origin_x + TILE_SIZE + STAR_RADIUS, origin_y + TILE_SIZE + STAR_RADIUS, z)
+    points = []
+    for lat, lng in query_points((min_lat, min_lng, max_lat, max_lng)):
+        px, py = lat_lng_to_pixel(lat, lng, z)
+        points.append((px - origin_x, py - origin_y, 1))
+    return render_tile(points)
+
+
+# 瓦片的磁盘缓存：{目录}/{z}/{x}/{y}.png，多个工作进程共用同一个目录
+class TileCache:
+    def __init__(self, directory, max_zoom=MAX_TILE_ZOOM, max_tiles=MAX_CACHED_TILES):
+        self.directory = directory
+        self.max_zoom = max_zoom
+        self.max_tiles = max_tiles
+        self.lock = threading.Lock()
+        # 每次失效加一；渲染期间发生过失效时结果不写入缓存，避免写回过期的瓦片
+        self.generation = 0
+        # 等待后台线程删除的瓦片 (z, x, y)，删除完成前按未缓存处理
+        self.pending = set()
+        # 目录中的瓦片数（估计值，包括其他进程写入的需要扫描目录才能知道），None 表示尚未扫描
+        self.stored = None
+        self.wake_event = threading.Event()
+        self.thread = None
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, z, x, y):
+        return os.path.join(self.directory, str(z), str(x), f'{y}.png')
+
+    def get(self, z, x, y, render):
+        path = self.path(z, x, y)
+        if (z, x, y) not in self.pending:
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                self.hits += 1
+                return data
+            except FileNotFoundError:
+                pass
+
+        self.misses += 1
+        generation = self.generation
+        data = render()
+        # 空白瓦片渲染很快，不占用磁盘
+        if data is EMPTY_TILE:
+            return data
+        with self.lock:
+            if generation != self.generation:
+                return data
+            self._write(path, data)
+            if self.stored is not None:
+                self.stored += 1
+            if self.stored is None or self.stored > self.max_tiles:
+                self._wake()
+        return data
+
+    def _write(self, path, data):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"瓦片缓存写入失败: {e}")
+
+    def invalidate(self, lat, lng):
+        # 登记包含该位置的各级瓦片（每级1到4张），由后台线程删除
+        px0, py0 = lat_lng_to_pixel(float(lat), float(lng), 0)
+        tiles = []
+        for z in range(self.max_zoom + 1):
+            scale = 2 ** z
+            px = px0 * scale
+            py = py0 * scale
+            limit = scale - 1
+            min_x = max(int((px - STAR_RADIUS) // TILE_SIZE), 0)
+            max_x = min(int((px + STAR_RADIUS) // TILE_SIZE), limit)
+            min_y = max(int((py - STAR_RADIUS) // TILE_SIZE), 0)
+            max_y = min(int((py + STAR_RADIUS) // TILE_SIZE), limit)
+            tiles.extend((z, x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1))
+        with self.lock:
+            self.generation += 1
+            self.pending.update(tiles)
+            self._wake()
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.pending.clear()
+            self.stored = 0
+
+    # 需要持有 self.lock
+    def _wake(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name='tile-cache', daemon=True)
+            self.thread.start()
+        self.wake_event.set()
+
+    def _run(self):
+        while True:
+            self.wake_event.wait()
+            self.wake_event.clear()
+            try:
+                self._remove_pending()
+                if self.stored is None or self.stored > self.max_tiles:
+                    self._prune()
+            except Exception as e:
+                print(f"瓦片缓存清理失败: {e}")
+
+    def _remove_pending(self):
+        with self.lock:
+            tiles = list(self.pending)
+        removed = 0
+        for z, x, y in tiles:
+            try:
+                os.remove(self.path(z, x, y))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        with self.lock:
+            # 删除期间再次登记的瓦片也一起移出：登记之前开始的渲染不会写入（generation 已变化），
+            # 登记之后开始的渲染使用的索引已包含新标记
+            self.pending.difference_update(tiles)
+            if self.stored is not None:
+                self.stored = max(self.stored - removed, 0)
+
+    # 统计目录中的瓦片，超过上限时删除最早写入的
+    def _prune(self):
+        files = []
+        for directory, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith('.png'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except FileNotFoundError:
+                    pass
+        if len(files) > self.max_tiles:
+            files.sort()
+            excess = len(files) - int(self.max_tiles * PRUNE_RATIO)
+            for _, path in files[:excess]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            files = files[excess:]
+        with self.lock:
+            self.stored = len(files)
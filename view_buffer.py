@@ -0,0 +1,166 @@
+# 浏览计数缓冲：浏览请求只在内存中累加每条内容的浏览数，由后台线程定期把累加值批量写入存储，
+# 不会每次打开弹窗都写一次数据库。
+#
+# STAR_MAP_VIEW_SAMPLE_RATE < 1 时只记录部分浏览，每次按 1/采样率 计数，期望值不变，高峰时减少加锁和内存开销。
+# STAR_MAP_UNIQUE_VIEWS=true 时只统计不同的浏览者：每条内容一个 HyperLogLog（1024个寄存器，误差约3%），
+# 估计值增加多少就计入多少浏览数。去重在每个进程内分别进行，同一浏览者访问不同工作进程时会分别计数。
+import hashlib
+import math
+import os
+import random
+import threading
+from collections import OrderedDict
+
+from periodic import PeriodicTask
+
+# 批量写入的间隔（秒）
+VIEW_FLUSH_INTERVAL = float(os.environ.get('STAR_MAP_VIEW_FLUSH_INTERVAL', '5'))
+
+# 缓冲区累计多少条不同内容后立即写入
+VIEW_FLUSH_IDS = int(os.environ.get('STAR_MAP_VIEW_FLUSH_IDS', '5000'))
+
+VIEW_SAMPLE_RATE = float(os.environ.get('STAR_MAP_VIEW_SAMPLE_RATE', '1'))
+
+UNIQUE_VIEWS = os.environ.get('STAR_MAP_UNIQUE_VIEWS', 'false').lower() == 'true'
+
+# 内存中最多保留的 HyperLogLog 数量（每个约1KB），最久未浏览的内容先淘汰
+VIEW_SKETCHES = int(os.environ.get('STAR_MAP_VIEW_SKETCHES', '10000'))
+
+HLL_PRECISION = 10
+
+
+def hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+# HyperLogLog 基数估计。寄存器变化时增量维护 sum(2^-M) 和空寄存器数，估计值的计算是O(1)
+class HyperLogLog:
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        self.inverse_sum = float(self.size)
+        self.zeros = self.size
+        self.alpha = 0.7213 / (1 + 1.079 / self.size)
+
+    def add(self, value_hash):
+        # 返回是否有寄存器变化（变化时估计值才可能增加）
+        index = value_hash >> (64 - self.precision)
+        rest = value_hash & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        old = self.registers[index]
+        if rank <= old:
+            return False
+        self.registers[index] = rank
+        self.inverse_sum += 2.0 ** -rank - 2.0 ** -old
+        if old == 0:
+            self.zeros -= 1
+        return True
+
+    def estimate(self):
+        raw = self.alpha * self.size * self.size / self.inverse_sum
+        # 小基数时使用线性计数修正
+        if raw <= 2.5 * self.size and self.zeros:
+            return self.size * math.log(self.size / self.zeros)
+        return raw
+
+
+class ViewBuffer:
+    def __init__(self, flush_func, interval=VIEW_FLUSH_INTERVAL, max_ids=VIEW_FLUSH_IDS,
+                 sample_rate=VIEW_SAMPLE_RATE, unique=UNIQUE_VIEWS, max_sketches=VIEW_SKETCHES):
+        self.flush_func = flush_func
+        self.max_ids = max_ids
+        self.sample_rate = min(max(sample_rate, 0.0001), 1.0)
+        self.unique = unique
+        self.max_sketches = max_sketches
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        # 内容ID -> 尚未写入的浏览数；正在写入、尚未提交的部分在 inflight 中
+        self.pending = {}
+        self.inflight = {}
+        # 内容ID -> [HyperLogLog, 已计入的浏览数]
+        self.sketches = OrderedDict()
+        self.sampled_out = 0
+        self.task = PeriodicTask(interval, self.flush, name='view-flush')
+
+    def _sampled(self, viewer_hash):
+        if self.sample_rate >= 1:
+            return True
+        # 去重时按浏览者采样，同一浏览者的多次浏览要么都记录要么都不记录
+        if viewer_hash is not None:
+            return (viewer_hash & 0xFFFFFFFF) < self.sample_rate * 0x100000000
+        return random.random() < self.sample_rate
+
+    def add(self, content_id, viewer=None):
+        # 返回是否计入了浏览数
+        viewer_hash = hash64(viewer) if self.unique and viewer is not None else None
+        if not self._sampled(viewer_hash):
+            self.sampled_out += 1
+            return False
+        weight = 1 / self.sample_rate
+        with self.lock:
+            if viewer_hash is not None:
+                entry = self.sketches.get(content_id)
+                if entry is None:
+                    entry = self.sketches[content_id] = [HyperLogLog(), 0.0]
+                    if len(self.sketches) > self.max_sketches:
+                        self.sketches.popitem(last=False)
+                else:
+                    self.sketches.move_to_end(content_id)
+                if not entry[0].add(viewer_hash):
+                    return False
+                estimate = entry[0].estimate() * weight
+                weight = estimate - entry[1]
+                if weight <= 0:
+                    return False
+                entry[1] = estimate
+            self.pending[content_id] = self.pending.get(content_id, 0.0) + weight
+            full = len(self.pending) >= self.max_ids
+        if full:
+            self.task.trigger()
+        return True
+
+    def pending_count(self, content_id):
+        if not self.pending and not self.inflight:
+            return 0
+        with self.lock:
+            return int(self.pending.get(content_id, 0) + self.inflight.get(content_id, 0))
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return
+                # 采样和去重产生的小数部分按概率取整（期望值不变），写入后缓冲区清空，
+                # 不会因为残留的小数部分使缓冲区一直处于“已满”状态
+                counts = {}
+                for content_id, value in self.pending.items():
+                    whole = int(value)
+                    if random.random() < value - whole:
+                        whole += 1
+                    if whole:
+                        counts[content_id] = whole
+                self.pending = {}
+                if not counts:
+                    return
+                self.inflight = counts
+
+            try:
+                self.flush_func(counts)
+            except Exception:
+                # 写入失败时放回缓冲区，下次重试
+                with self.lock:
+                    for content_id, count in self.inflight.items():
+                        self.pending[content_id] = self.pending.get(content_id, 0) + count
+                    self.inflight = {}
+                raise
+
+            with self.lock:
+                self.inflight = {}
+
+    def start(self):
+        self.task.start()
+
+    def stop(self):
+        # 退出前写入剩余的浏览数
+        self.task.stop(run_final=True)
@@ -0,0 +1,15 @@
+# 生产环境入口：gunicorn -c gunicorn.conf.py wsgi:app
+# start-server.py 的文件名包含连字符，不能直接import，这里按路径加载
+import importlib.util
+import os
+import sys
+
+_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'start-server.py')
+_spec = importlib.util.spec_from_file_location('star_map_server', _path)
+server = importlib.util.module_from_spec(_spec)
+sys.modules['star_map_server'] = server
+_spec.loader.exec_module(server)
+
+# 在主进程中完成数据库和示例数据初始化；后台任务由每个工作进程在启动时各自开启。
+# 单进程的WSGI服务器（如 waitress）不会调用 gunicorn 的钩子，可以设置 STAR_MAP_START_TASKS=true
+app = server.create_app(start_tasks=os.environ.get('STAR_MAP_START_TASKS', 'false').lower() == 'true')